@@ -0,0 +1,170 @@
+"""
+Admission control, upstream concurrency limits and cancellation on disconnect.
+
+Runs the real API offline (in-memory Qdrant of synthetic chunks, hash
+embeddings, fake LLM). The fake LLM behaves like a quota-limited API: calls
+beyond --llm-capacity in flight fail at once, as Gemini's 429s do.
+
+Spike: --spike distinct questions arrive within --window seconds, once with
+no limits and once with the configured ones. Reports answered / failed /
+shed (429, 503) requests, p50 / p95 latency of answered ones, peak LLM calls
+in flight and upstream rejections.
+
+Disconnect: clients leave after --disconnect-after seconds, while the graph
+is grading and rewriting (every chunk graded irrelevant). Reports the LLM calls
+started after the client left, with Starlette's plain StreamingResponse and
+with the disconnect-aware one, for servers speaking ASGI spec 2.3 (uvicorn)
+and 2.4 (where Starlette stops watching for disconnects).
+
+Usage: python benchmarks/admission_benchmark.py [--spike 300] [--llm-capacity 16]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import time
+import asyncio
+import argparse
+import statistics
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from starlette.responses import StreamingResponse
+
+from chat_benchmark import send_request, percentile
+
+
+class CallTimes(BaseCallbackHandler):
+    """When each LLM call started, per request ID."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.started = defaultdict(list)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        from audit_ai.metrics import request_id_var
+
+        self.started[request_id_var.get()].append(time.perf_counter())
+
+
+class PlainStreamingResponse(StreamingResponse):
+    """Starlette's own disconnect handling, for comparison."""
+
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+
+def configure(engine, api, fake, limited: bool, args):
+    from audit_ai.limits import AdmissionController, BoundedChatModel, UpstreamLimiter
+
+    llm_limit = args.llm_limit if limited else 0
+    engine.upstream_limits["llm"] = UpstreamLimiter("llm", llm_limit)
+    engine.set_components(llm=BoundedChatModel(model=fake, limiter=engine.upstream_limits["llm"], callbacks=fake.callbacks))
+    if limited:
+        api.admission = AdmissionController(args.max_in_flight, args.max_queue, args.queue_timeout)
+    else:
+        api.admission = AdmissionController(0, 0, 0)
+    fake.peak_active = fake.rejected = 0
+
+
+async def run_spike(api, label: str, args):
+    offsets = [args.window * i / args.spike for i in range(args.spike)]
+    topics = fakes.TOPICS
+
+    async def run(i: int):
+        await asyncio.sleep(offsets[i])
+        question = f"What does NIST say about {topics[i % len(topics)]} (case {i})?"
+        return await send_request(api.app, f"{label}-{i}", question)
+
+    return await asyncio.gather(*(run(i) for i in range(args.spike)))
+
+
+async def run_disconnects(api, times: CallTimes, label: str, spec_version: str, args):
+    async def run(i: int):
+        request_id = f"{label}-{i}"
+        started = time.perf_counter()
+        await send_request(
+            api.app, request_id, f"What does NIST say about {fakes.TOPICS[i]} ({label})?",
+            disconnect_after=args.disconnect_after, spec_version=spec_version,
+        )
+        left_at = started + args.disconnect_after
+        # Give anything still running time to show up
+        await asyncio.sleep(args.llm_latency * 12)
+        calls = times.started.pop(request_id, [])
+        return sum(t > left_at for t in calls), len(calls)
+
+    return await asyncio.gather(*(run(i) for i in range(args.disconnects)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spike", type=int, default=300, help="Requests in the spike.")
+    parser.add_argument("--window", type=float, default=1.0, help="Seconds over which the spike arrives.")
+    parser.add_argument("--llm-capacity", type=int, default=16, help="Fake LLM quota: calls in flight before 429s.")
+    parser.add_argument("--llm-limit", type=int, default=16, help="LLM_MAX_CONCURRENCY in the limited run.")
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--queue-timeout", type=float, default=5.0)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--disconnects", type=int, default=8)
+    parser.add_argument("--disconnect-after", type=float, default=0.5)
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(llm_latency=args.llm_latency, token_latency=0.01)
+    fake = engine.get_llm()
+    times = CallTimes()
+    fake.callbacks.append(times)
+    from audit_ai import main as api
+
+    # Distinct questions: nothing to coalesce
+    api.COALESCE_REQUESTS = False
+
+    print(f"\nSpike: {args.spike} requests over {args.window}s, fake LLM quota {args.llm_capacity} calls in flight\n")
+    print("| Limits | Answered | Failed | Shed 429 / 503 | Latency p50 / p95 ms | Peak LLM in flight | LLM 429s |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    fake.capacity = args.llm_capacity
+    for limited in (False, True):
+        configure(engine, api, fake, limited, args)
+        results = await run_spike(api, f"spike-{limited}", args)
+        answered = [r for r in results if r["status"] == 200 and not r["failed"]]
+        totals = [r["total"] * 1000 for r in answered]
+        name = (
+            f"LLM {args.llm_limit}, admit {args.max_in_flight} + queue {args.max_queue}" if limited else "none"
+        )
+        print(
+            f"| {name} | {len(answered)} | {sum(r['status'] == 200 and r['failed'] for r in results)} "
+            f"| {sum(r['status'] == 429 for r in results)} / {sum(r['status'] == 503 for r in results)} "
+            f"| {percentile(totals, 0.5):.0f} / {percentile(totals, 0.95):.0f} "
+            f"| {fake.peak_active} | {fake.rejected} |"
+        )
+    print(f"\n/stats admission: {api.admission.stats()}")
+
+    # --- Disconnects: every chunk graded irrelevant, so the graph rewrites 3 times before answering ---
+    fake.capacity = 0
+    fake.grade = "no"
+    engine.SCORE_GATING = False
+    configure(engine, api, fake, True, args)
+    print(f"\nDisconnect after {args.disconnect_after}s ({args.disconnects} clients, rewrite loop running)\n")
+    print("| Response | ASGI spec | LLM calls after disconnect / req | LLM calls / req |")
+    print("| :--- | :--- | :--- | :--- |")
+    aware = api.DisconnectAwareStreamingResponse
+    for response_class in (PlainStreamingResponse, aware):
+        api.DisconnectAwareStreamingResponse = response_class
+        for spec_version in ("2.3", "2.4"):
+            rows = await run_disconnects(api, times, f"{response_class.__name__}-{spec_version}", spec_version, args)
+            print(
+                f"| {'plain' if response_class is PlainStreamingResponse else 'disconnect-aware'} | {spec_version} "
+                f"| {statistics.mean(after for after, _ in rows):.2f} | {statistics.mean(total for _, total in rows):.2f} |"
+            )
+    api.DisconnectAwareStreamingResponse = aware
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""
+An audit checklist through /chat/batch vs. the same questions sent to /chat.
+
+Runs the real API offline (in-memory Qdrant of synthetic chunks, hash
+embeddings with a fixed per-call latency, fake LLM). The checklist is sent
+one question at a time, as --concurrency parallel /chat requests, and as a
+single /chat/batch request. The embedding cache is emptied before each mode.
+Reports:
+
+  total          wall time until every answer is in
+  first answer   time until the first answer (first token for /chat)
+  embedding      calls to the embedding model
+  Qdrant         search requests (single and batched)
+  LLM calls      all LLM calls (router, grader, generator, ...)
+
+A last /chat/batch run fails the shared embedding call (a quota error): every
+question must still get a result line, and the stream must end with `done`.
+
+Usage: python benchmarks/batch_benchmark.py [--questions 50] [--concurrency 8]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import json
+import time
+import asyncio
+import argparse
+
+from prometheus_client import REGISTRY
+
+from chat_benchmark import send_request
+
+QUESTION_TEMPLATES = [
+    "What does the NIST framework require for {topic}?",
+    "Which NIST CSF 2.0 controls cover {topic}?",
+    "Who is responsible for {topic} under NIST CSF 2.0?",
+    "How should we audit our {topic} policy against NIST?",
+    "What evidence shows {topic} meets NIST CSF 2.0?",
+]
+
+
+def checklist(n: int):
+    """Numbered audit questions, all distinct."""
+    topics = fakes.TOPICS
+    return [
+        f"{i + 1}. " + QUESTION_TEMPLATES[(i // len(topics)) % len(QUESTION_TEMPLATES)].format(topic=topics[i % len(topics)])
+        for i in range(n)
+    ]
+
+
+def counters():
+    """Embedding model calls, Qdrant searches and LLM calls so far."""
+    totals = {"embedding": 0.0, "qdrant": 0.0, "llm": 0.0}
+    for metric in REGISTRY.collect():
+        for sample in metric.samples:
+            if sample.name == "auditai_embedding_latency_seconds_count":
+                totals["embedding"] += sample.value
+            elif sample.name == "auditai_qdrant_latency_seconds_count" and sample.labels["operation"] in (
+                "query_points", "query_batch_points"
+            ):
+                totals["qdrant"] += sample.value
+            elif sample.name == "auditai_llm_calls_total":
+                totals["llm"] += sample.value
+    return totals
+
+
+async def run_single(api, questions, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def ask(i: int):
+        async with slots:
+            result = await send_request(api.app, f"single-{concurrency}-{i}", questions[i])
+            return time.perf_counter() - started - result["total"] + result["ttft"], result["failed"]
+
+    results = await asyncio.gather(*(ask(i) for i in range(len(questions))))
+    return min(first for first, _ in results), sum(failed for _, failed in results)
+
+
+async def run_batch(api, questions):
+    result = await send_request(api.app, "batch", None, path="/chat/batch", questions=questions)
+    if result["status"] != 200:
+        raise RuntimeError(f"/chat/batch returned {result['status']}")
+    lines = [json.loads(line) for line in result["body"].decode("utf-8").splitlines() if line]
+    answers = [line for line in lines if line["type"] == "result"]
+    if len(answers) != len(questions):
+        raise RuntimeError(f"/chat/batch answered {len(answers)} of {len(questions)} questions")
+    if not lines or lines[-1]["type"] != "done":
+        raise RuntimeError("/chat/batch stream did not end with a done line")
+    return result["ttft"], sum(line["error"] for line in answers)
+
+
+async def run_batch_embedding_failure(engine, api, questions):
+    """/chat/batch while the batch embedding call fails with a quota error."""
+    embeddings = engine.get_embeddings()
+
+    async def quota_exceeded(texts):
+        raise RuntimeError("429 embed quota")
+
+    embeddings.aembed_queries = quota_exceeded
+    try:
+        return await run_batch(api, questions)
+    finally:
+        del embeddings.aembed_queries
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel /chat requests (and BATCH_CONCURRENCY).")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(llm_latency=args.llm_latency, embedding_latency=args.embedding_latency)
+    from audit_ai import main as api
+
+    api.COALESCE_REQUESTS = False
+    engine.BATCH_CONCURRENCY = args.concurrency
+    questions = checklist(args.questions)
+    await send_request(api.app, "warmup", "warm up the collection")
+
+    modes = [
+        ("/chat, one at a time", lambda: run_single(api, questions, 1)),
+        (f"/chat, {args.concurrency} at a time", lambda: run_single(api, questions, args.concurrency)),
+        ("/chat/batch", lambda: run_batch(api, questions)),
+        ("/chat/batch, batch embedding fails", lambda: run_batch_embedding_failure(engine, api, questions)),
+    ]
+    print(f"\n{args.questions} questions, LLM latency {args.llm_latency}s, embedding latency {args.embedding_latency}s\n")
+    print("| Mode | Total s | First answer s | Embedding calls | Qdrant requests | LLM calls | Failed |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    for name, run in modes:
+        engine.get_embeddings()._memory.clear()
+        before = counters()
+        started = time.perf_counter()
+        first, failed = await run()
+        total = time.perf_counter() - started
+        after = counters()
+        print(
+            f"| {name} | {total:.1f} | {first:.2f} "
+            f"| {after['embedding'] - before['embedding']:.0f} | {after['qdrant'] - before['qdrant']:.0f} "
+            f"| {after['llm'] - before['llm']:.0f} | {failed} |"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,304 @@
+"""
+Offline latency & throughput suite for /chat.
+
+Everything upstream is a deterministic local stand-in (see fakes.py): the
+fake streaming chat model, hash embeddings behind the engine's embedding
+cache, and an in-memory Qdrant collection of synthetic chunks. The real
+FastAPI app, router, graph and retrieval code run unchanged in one process
+(one event loop == one uvicorn worker).
+
+A mixed workload of 'search' and 'chat' queries is streamed at increasing
+concurrency. For each level and intent the suite reports p50/p95/p99 time
+to first token, total latency, requests/sec and LLM calls per request.
+
+Results are saved as JSON under benchmarks/results/ (named after the current
+commit), and --compare prints the change against an earlier run.
+
+Usage: python benchmarks/chat_benchmark.py [--levels 1,4,16] [--compare benchmarks/results/<commit>.json]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+RESULTS_DIR = os.path.join(fakes.CURRENT_DIR, "results")
+
+SEARCH_QUERIES = [
+    "What does the NIST Govern function say about risk strategy?",
+    "How does NIST CSF handle supply chain risk?",
+    "What are the NIST requirements for asset inventory?",
+    "Which NIST outcomes cover access control?",
+    "What does NIST say about incident response?",
+    "How should backups be tested under NIST CSF 2.0?",
+]
+CHAT_QUERIES = [
+    "hello",
+    "who are you?",
+    "thanks for the help",
+    "what can you do?",
+]
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts LLM calls per request ID (the suite sends one ID per request)."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    def _count(self):
+        from audit_ai.metrics import request_id_var
+
+        self.calls[request_id_var.get()] += 1
+
+    def on_chat_model_start(self, *args, **kwargs) -> None:
+        self._count()
+
+    def on_llm_start(self, *args, **kwargs) -> None:
+        self._count()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def current_commit() -> str:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=fakes.PROJECT_ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=fakes.PROJECT_ROOT) != 0
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def send_request(
+    app,
+    request_id: str,
+    query: Optional[str],
+    disconnect_after: Optional[float] = None,
+    spec_version: str = "2.3",
+    path: str = "/chat",
+    **fields,
+) -> Dict:
+    """
+    Calls the ASGI app directly and timestamps each body chunk as the app sends it.
+    (httpx's ASGITransport buffers the whole response, which would hide TTFT.)
+    Extra `fields` (history, session_id, ...) are sent along with the query (if any) to
+    `path`. The response body is returned under "body". With
+    `disconnect_after`, the client goes away after that many seconds. `spec_version` is
+    the ASGI HTTP spec the "server" claims (uvicorn: 2.3).
+    Returns the status, timings and whether the stream reported a system error or broke off.
+    """
+    body = json.dumps({"query": query, **fields} if query is not None else fields).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-request-id", request_id.encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    requested = False
+    finished = asyncio.Event()
+    started = time.perf_counter()
+    result = {"ttft": None, "status": None, "failed": False}
+    chunks = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=disconnect_after)
+        except asyncio.TimeoutError:
+            pass
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            if result["ttft"] is None and (b'"type": "token"' in chunk or b'"type": "result"' in chunk):
+                result["ttft"] = time.perf_counter() - started
+            if b"[System Error" in chunk:
+                result["failed"] = True
+            if not message.get("more_body", False):
+                finished.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # A real server would drop the connection mid-stream
+        result["failed"] = True
+    result["total"] = time.perf_counter() - started
+    result["completed"] = finished.is_set()
+    result["body"] = b"".join(chunks)
+    if result["ttft"] is None:
+        result["ttft"] = result["total"]
+    return result
+
+
+async def one_request(app, request_id: str, query: str, **fields) -> Dict[str, float]:
+    """`send_request` for a request that must succeed: returns its TTFT and total latency."""
+    result = await send_request(app, request_id, query, **fields)
+    if result["status"] != 200:
+        raise RuntimeError(f"/chat returned {result['status']} for request {request_id}")
+    return {"ttft": result["ttft"], "total": result["total"]}
+
+
+async def run_level(app, counter: LLMCallCounter, concurrency: int, total: int, chat_ratio: float) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = defaultdict(list)
+    n_chat = int(round(total * chat_ratio))
+
+    async def run(i: int):
+        intent = "chat" if i < n_chat else "search"
+        pool = CHAT_QUERIES if intent == "chat" else SEARCH_QUERIES
+        # Unique suffixes keep the embedding cache from turning the run into a cache benchmark
+        query = f"{pool[i % len(pool)]} (request {concurrency}-{i})"
+        request_id = f"bench-{concurrency}-{i}"
+        async with semaphore:
+            result = await one_request(app, request_id, query)
+        result["llm_calls"] = counter.calls.pop(request_id, 0)
+        samples[intent].append(result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    level = {"concurrency": concurrency, "requests": total, "seconds": elapsed, "rps": total / elapsed, "intents": {}}
+    for intent, results in samples.items():
+        ttfts = [r["ttft"] * 1000 for r in results]
+        totals = [r["total"] * 1000 for r in results]
+        level["intents"][intent] = {
+            "requests": len(results),
+            "ttft_p50_ms": percentile(ttfts, 0.50),
+            "ttft_p95_ms": percentile(ttfts, 0.95),
+            "ttft_p99_ms": percentile(ttfts, 0.99),
+            "total_p50_ms": percentile(totals, 0.50),
+            "total_p95_ms": percentile(totals, 0.95),
+            "total_p99_ms": percentile(totals, 0.99),
+            "llm_calls_per_request": sum(r["llm_calls"] for r in results) / len(results),
+        }
+    return level
+
+
+def print_report(report: Dict, baseline: Dict = None) -> None:
+    previous = {}
+    if baseline:
+        for level in baseline["levels"]:
+            for intent, row in level["intents"].items():
+                previous[(level["concurrency"], intent)] = (row, level["rps"])
+
+    def delta(now: float, before: float) -> str:
+        return f" ({(now - before) / before:+.0%})" if before else ""
+
+    print(f"\nCommit {report['commit']}, {json.dumps(report['config'])}")
+    if baseline:
+        print(f"Compared with {baseline['commit']} ({baseline['created_at']})")
+    print("\n| Concurrency | Intent | Req/s | TTFT p50 / p95 / p99 ms | Total p50 / p95 / p99 ms | LLM calls / req |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- |")
+    for level in report["levels"]:
+        for intent, row in sorted(level["intents"].items()):
+            before, before_rps = previous.get((level["concurrency"], intent), ({}, 0.0))
+            print(
+                f"| {level['concurrency']} | {intent} | {level['rps']:.1f}{delta(level['rps'], before_rps)} "
+                f"| {row['ttft_p50_ms']:.0f} / {row['ttft_p95_ms']:.0f} / {row['ttft_p99_ms']:.0f}"
+                f"{delta(row['ttft_p95_ms'], before.get('ttft_p95_ms', 0.0))} "
+                f"| {row['total_p50_ms']:.0f} / {row['total_p95_ms']:.0f} / {row['total_p99_ms']:.0f}"
+                f"{delta(row['total_p95_ms'], before.get('total_p95_ms', 0.0))} "
+                f"| {row['llm_calls_per_request']:.2f} |"
+            )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds before each fake LLM reply starts.")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between streamed chunks.")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embedding call (cache misses).")
+    parser.add_argument("--chunks", type=int, default=200, help="Synthetic chunks in the in-memory collection.")
+    parser.add_argument("--levels", type=str, default="1,4,16,64")
+    parser.add_argument("--requests-per-level", type=int, default=64)
+    parser.add_argument("--chat-ratio", type=float, default=0.25, help="Share of 'chat' queries in the workload.")
+    parser.add_argument("--router", choices=["embedding", "llm"], default=None, help="Override ROUTER_MODE.")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier results file to compare against.")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(
+        llm_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        embedding_latency=args.embedding_latency,
+        n_chunks=args.chunks,
+    )
+    if args.router:
+        engine.ROUTER_MODE = args.router
+    counter = LLMCallCounter()
+    engine.llm.callbacks.append(counter)
+
+    from audit_ai.main import app
+
+    levels = []
+    await one_request(app, "warmup", SEARCH_QUERIES[0])  # Builds router examples, opens the collection
+    for concurrency in [int(x) for x in args.levels.split(",")]:
+        print(f"--- Concurrency {concurrency} ---")
+        levels.append(await run_level(app, counter, concurrency, args.requests_per_level, args.chat_ratio))
+
+    report = {
+        "commit": current_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "llm_latency": args.llm_latency,
+            "token_latency": args.token_latency,
+            "embedding_latency": args.embedding_latency,
+            "chunks": args.chunks,
+            "requests_per_level": args.requests_per_level,
+            "chat_ratio": args.chat_ratio,
+            "router": engine.ROUTER_MODE,
+            "grader": engine.GRADER_MODE,
+        },
+        "levels": levels,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved {path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Request coalescing on vs off.
+
+Sends bursts of the same question (with varied case and punctuation) to /chat,
+spread over a short arrival window so that later requests join a run that is
+already streaming. Runs offline on the same stand-ins as chat_benchmark.py.
+Reports, per mode: pipeline runs, LLM calls, TTFT and total latency.
+
+Usage: python benchmarks/coalescing_benchmark.py [--burst 32] [--window 1.0]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import random
+import asyncio
+import argparse
+
+from chat_benchmark import LLMCallCounter, one_request, percentile
+
+VARIANTS = [
+    "What does the NIST Govern function say about risk strategy?",
+    "what does the NIST govern function say about risk strategy",
+    "What does the NIST Govern function say about risk strategy ?",
+    "  What does the NIST Govern   function say about risk strategy??",
+]
+
+
+async def run_burst(app, counter: LLMCallCounter, burst: int, window: float, seed: int, label: str):
+    rng = random.Random(seed)
+    offsets = sorted(rng.uniform(0, window) for _ in range(burst))
+
+    async def run(i: int, offset: float):
+        await asyncio.sleep(offset)
+        return await one_request(app, f"{label}-{i}", VARIANTS[i % len(VARIANTS)])
+
+    results = await asyncio.gather(*(run(i, offset) for i, offset in enumerate(offsets)))
+    llm_calls = sum(counter.calls.pop(f"{label}-{i}", 0) for i in range(burst))
+    return results, llm_calls
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=32, help="Identical requests per burst.")
+    parser.add_argument("--window", type=float, default=1.0, help="Seconds over which the burst arrives.")
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(llm_latency=args.llm_latency, token_latency=args.token_latency)
+    counter = LLMCallCounter()
+    engine.get_llm().callbacks.append(counter)
+
+    from audit_ai import main as api
+
+    await one_request(api.app, "warmup", "warm up the collection")
+
+    print(f"\n{args.bursts} bursts of {args.burst} requests over {args.window}s\n")
+    print("| Coalescing | Pipeline runs | LLM calls | TTFT p50 / p95 ms | Total p50 / p95 ms |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for enabled in (False, True):
+        api.COALESCE_REQUESTS = enabled
+        leaders_before = api.flights.leaders
+        ttfts, totals, llm_calls = [], [], 0
+        for b in range(args.bursts):
+            results, calls = await run_burst(api.app, counter, args.burst, args.window, seed=b, label=f"{enabled}-{b}")
+            ttfts += [r["ttft"] * 1000 for r in results]
+            totals += [r["total"] * 1000 for r in results]
+            llm_calls += calls
+        runs = api.flights.leaders - leaders_before if enabled else args.bursts * args.burst
+        print(
+            f"| {'on' if enabled else 'off'} | {runs} | {llm_calls} "
+            f"| {percentile(ttfts, 0.5):.0f} / {percentile(ttfts, 0.95):.0f} "
+            f"| {percentile(totals, 0.5):.0f} / {percentile(totals, 0.95):.0f} |"
+        )
+    print(f"\n/stats coalescing: {api.flights.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""
+Cold start: import time and API startup time.
+
+Each sample runs in a fresh interpreter and measures
+
+  import engine    `import audit_ai.engine`
+  import main      `import audit_ai.main` on top of that
+  startup          the FastAPI lifespan (component construction, optional pre-warm)
+  first Qdrant     one `get_collection` through the engine's async client right after startup
+
+Qdrant is a local stub that answers the version and collection-info requests,
+so connection setup is real while no credentials are needed. Gemini is never
+called. Modes: lazy startup (default), lazy startup with PREWARM_CONNECTIONS,
+and optionally another checkout (e.g. the pre-change tree) via --baseline-src.
+
+Usage: python benchmarks/cold_start_benchmark.py [--runs 5] [--baseline-src /path/to/old/checkout/src]
+"""
+import sys
+import os
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+
+import json
+import argparse
+import threading
+import statistics
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COLLECTION_NAME = "compliance_audit"
+
+# Runs in the child interpreter. Older trees validate the collection (with a live
+# embedding call) while importing; that check is switched off as langchain_qdrant loads.
+PROBE = r"""
+import sys, time, json, asyncio, importlib.abc, importlib.util
+sys.path.insert(0, SRC)
+
+
+class SkipCollectionValidation(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name != "langchain_qdrant.qdrant":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+
+        def patched(module):
+            exec_module(module)
+            module.QdrantVectorStore._validate_collection_config = classmethod(lambda cls, *a, **k: None)
+
+        spec.loader.exec_module = patched
+        return spec
+
+
+sys.meta_path.insert(0, SkipCollectionValidation())
+timings = {}
+started = time.perf_counter()
+import audit_ai.engine as engine
+timings["import_engine"] = time.perf_counter() - started
+mark = time.perf_counter()
+import audit_ai.main as main
+timings["import_main"] = time.perf_counter() - mark
+
+
+async def serve():
+    mark = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        timings["startup"] = time.perf_counter() - mark
+        mark = time.perf_counter()
+        await engine.async_client.get_collection(engine.COLLECTION_NAME)
+        timings["first_qdrant"] = time.perf_counter() - mark
+
+
+asyncio.run(serve())
+timings["total"] = time.perf_counter() - started
+print("TIMINGS " + json.dumps(timings))
+"""
+
+
+def collection_info() -> bytes:
+    """A genuine CollectionInfo payload, taken from an in-memory collection."""
+    from qdrant_client import QdrantClient, models
+
+    local = QdrantClient(":memory:")
+    local.create_collection(COLLECTION_NAME, vectors_config=models.VectorParams(size=3072, distance=models.Distance.COSINE))
+    info = local.get_collection(COLLECTION_NAME).model_dump(mode="json")
+    return json.dumps({"result": info, "status": "ok", "time": 0.0}).encode("utf-8")
+
+
+def start_stub_qdrant() -> ThreadingHTTPServer:
+    info = collection_info()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] == f"/collections/{COLLECTION_NAME}":
+                body = info
+            elif self.path.split("?")[0] == "/":
+                body = json.dumps({"title": "qdrant - vector search engine", "version": "1.12.0"}).encode("utf-8")
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_probe(src: str, port: int, prewarm: bool) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "QDRANT_URL": f"http://127.0.0.1:{port}",
+            "QDRANT_API_KEY": "cold-start",
+            "GOOGLE_API_KEY": "cold-start",
+            "GROQ_API_KEY": "cold-start",  # Older trees refuse to import without it
+            "ROUTER_MODE": "llm",  # Pre-warming the embedding router would call Gemini
+            "HYBRID_RETRIEVAL": "false",
+            "PREWARM_CONNECTIONS": "true" if prewarm else "false",
+        }
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", f"SRC = {src!r}\n" + PROBE],
+        env=env,
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("TIMINGS "))
+    return json.loads(line[len("TIMINGS "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline-src", type=str, default=None, help="'src' directory of another checkout.")
+    args = parser.parse_args()
+
+    server = start_stub_qdrant()
+    port = server.server_address[1]
+    modes = [("lazy", os.path.join(PROJECT_ROOT, "src"), False), ("lazy + prewarm", os.path.join(PROJECT_ROOT, "src"), True)]
+    if args.baseline_src:
+        modes.insert(0, ("baseline", os.path.abspath(args.baseline_src), False))
+
+    print(f"\n{args.runs} cold runs per mode (median, ms)\n")
+    print("| Mode | Import engine | Import main | Startup | Ready (total) | First Qdrant call |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- |")
+    for name, src, prewarm in modes:
+        samples = [run_probe(src, port, prewarm) for _ in range(args.runs)]
+
+        def median(key):
+            return statistics.median(sample[key] for sample in samples) * 1000
+
+        ready = median("import_engine") + median("import_main") + median("startup")
+        print(
+            f"| {name} | {median('import_engine'):.0f} | {median('import_main'):.0f} | {median('startup'):.0f} "
+            f"| {ready:.0f} | {median('first_qdrant'):.1f} |"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
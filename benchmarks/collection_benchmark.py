@@ -0,0 +1,158 @@
+"""
+Recall@k and search latency per collection profile.
+
+For every profile in audit_ai/collection.py, a scratch collection is created
+with that profile's HNSW and quantization settings plus the payload indexes,
+and filled with the same synthetic, clustered embeddings (each point carries
+metadata.source_file / metadata.page like ingested chunks). Queries then run
+through the profile's search parameters, unfiltered and filtered to a few
+source files. Exact nearest neighbours are computed locally with NumPy.
+
+  recall@k   share of the exact top-k the search returned
+  latency    client-side query_points time (p50 / p95)
+
+Uses QDRANT_URL / QDRANT_API_KEY (a real server: quantization and HNSW only
+exist there). --local runs against the in-process Qdrant, which searches
+exhaustively and ignores both, as a smoke test of the benchmark itself.
+Scratch collections are deleted afterwards.
+
+Usage: python benchmarks/collection_benchmark.py [--points 20000] [--dim 1536] [--k 10] [--profiles default,scalar,binary]
+"""
+import sys
+import os
+
+# --- PATH HACK (Industrial Standard for standalone scripts) ---
+# Adds the 'src' directory to the path so we can import 'audit_ai'
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+import time
+import asyncio
+import argparse
+import statistics
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import AsyncQdrantClient, models
+
+from audit_ai.collection import PROFILES, ensure_payload_indexes, search_filter
+
+load_dotenv()
+
+N_SOURCE_FILES = 20
+
+
+def synthetic_embeddings(n_points: int, dim: int, n_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Unit vectors around a few topic centres, roughly how chunk embeddings cluster."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, n_clusters, n_points)] + 0.6 * rng.standard_normal((n_points, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def source_file(i: int) -> str:
+    return f"policy_{i % N_SOURCE_FILES:02d}.pdf"
+
+
+async def wait_until_indexed(client: AsyncQdrantClient, name: str, n_points: int, local: bool) -> None:
+    if local:
+        return
+    while True:
+        info = await client.get_collection(name)
+        if info.status == models.CollectionStatus.GREEN and (info.indexed_vectors_count or 0) >= n_points:
+            return
+        await asyncio.sleep(1.0)
+
+
+async def fill(client: AsyncQdrantClient, name: str, profile, vectors: np.ndarray, local: bool) -> None:
+    if await client.collection_exists(name):
+        await client.delete_collection(name)
+    await client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        # Index (rather than brute-force) even a scratch-sized collection
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1000),
+    )
+    await ensure_payload_indexes(client, name)
+    for start in range(0, len(vectors), 256):
+        batch = vectors[start:start + 256]
+        await client.upsert(
+            collection_name=name,
+            points=[
+                models.PointStruct(
+                    id=start + i,
+                    vector=vector.tolist(),
+                    payload={"metadata": {"source_file": source_file(start + i), "page": (start + i) // 50}},
+                )
+                for i, vector in enumerate(batch)
+            ],
+        )
+    await wait_until_indexed(client, name, len(vectors), local)
+
+
+async def measure(client, name, profile, vectors, queries, k, source_files=None):
+    mask = None
+    if source_files:
+        mask = np.array([source_file(i) in source_files for i in range(len(vectors))])
+    recalls, latencies = [], []
+    for query in queries:
+        similarities = vectors @ query
+        if mask is not None:
+            similarities = np.where(mask, similarities, -np.inf)
+        exact = set(np.argsort(-similarities)[:k].tolist())
+
+        started = time.perf_counter()
+        response = await client.query_points(
+            collection_name=name,
+            query=query.tolist(),
+            limit=k,
+            query_filter=search_filter(source_files=source_files),
+            search_params=profile.search_params(),
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(exact & {point.id for point in response.points}) / k)
+    latencies.sort()
+    return statistics.mean(recalls), statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--profiles", type=str, default=",".join(PROFILES))
+    parser.add_argument("--local", action="store_true", help="In-process Qdrant (smoke test only).")
+    args = parser.parse_args()
+
+    if args.local:
+        client = AsyncQdrantClient(":memory:")
+    else:
+        client = AsyncQdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"), timeout=120)
+
+    vectors = synthetic_embeddings(args.points, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.points, args.queries)] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    filtered_to = [source_file(i) for i in range(2)]  # 10% of the points
+
+    print(f"\n{args.points} points x {args.dim} dims, {args.queries} queries, k={args.k}{' (local)' if args.local else ''}\n")
+    print(f"| Profile | Recall@{args.k} | p50 / p95 ms | Recall@{args.k} (filtered) | p50 / p95 ms (filtered) |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for name in args.profiles.split(","):
+        profile = PROFILES[name]
+        collection = f"bench_profile_{name}"
+        try:
+            await fill(client, collection, profile, vectors, args.local)
+            recall, p50, p95 = await measure(client, collection, profile, vectors, queries, args.k)
+            f_recall, f_p50, f_p95 = await measure(client, collection, profile, vectors, queries, args.k, filtered_to)
+            print(f"| {name} | {recall:.3f} | {p50:.1f} / {p95:.1f} | {f_recall:.3f} | {f_p50:.1f} / {f_p95:.1f} |")
+        finally:
+            await client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+Context packing on vs off.
+
+Retrieves once per question in evals/test.csv (full graph, packing off), then
+runs `generate` on the very same documents with CONTEXT_PACKING off and on,
+so only the context assembly differs. Reports, for each mode:
+
+  prompt tokens      as reported by the model (estimate if unavailable)
+  generation latency time spent in the generate LLM call
+
+and writes collector-format results for each mode, ready for the RAGAS evaluator:
+
+  python evals/evaluator.py --results evals/rag_results_packing_off.json --report evals/ragas_report_packing_off.md
+  python evals/evaluator.py --results evals/rag_results_packing_on.json --report evals/ragas_report_packing_on.md
+
+Needs the real API keys and an ingested collection.
+
+Usage: python benchmarks/context_benchmark.py [--limit N]
+"""
+import sys
+import os
+
+# --- PATH HACK (Industrial Standard for standalone scripts) ---
+# Adds the 'src' directory to the path so we can import 'audit_ai'
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+import csv
+import json
+import asyncio
+import argparse
+import statistics
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from audit_ai import engine
+
+EVALS_DIR = os.path.join(PROJECT_ROOT, "evals")
+TEST_FILE = os.path.join(EVALS_DIR, "test.csv")
+
+
+class PromptTokenCounter(AsyncCallbackHandler):
+    def __init__(self):
+        self.input_tokens = 0
+
+    async def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.input_tokens += usage.get("input_tokens", 0)
+
+
+def load_rows():
+    with open(TEST_FILE, "r", encoding="utf-8") as f:
+        return [{"question": row["question"], "ground_truth": row["ground_truth"]} for row in csv.DictReader(f)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=None, help="Only run the first N questions.")
+    parser.add_argument("--budget", type=int, default=engine.CONTEXT_TOKEN_BUDGET, help="Context token budget.")
+    args = parser.parse_args()
+
+    engine.CONTEXT_TOKEN_BUDGET = args.budget
+    rows = load_rows()[: args.limit]
+    results = {"off": [], "on": []}
+    metrics = {"off": {"tokens": [], "latency": [], "blocks": []}, "on": {"tokens": [], "latency": [], "blocks": []}}
+
+    for i, row in enumerate(rows):
+        print(f"[{i + 1}/{len(rows)}] {row['question'][:60]}...")
+        engine.CONTEXT_PACKING = False
+        retrieved = await engine.app.ainvoke({"question": row["question"]})
+        documents = retrieved["documents"]
+
+        for mode in ("off", "on"):
+            engine.CONTEXT_PACKING = mode == "on"
+            counter = PromptTokenCounter()
+            output = await engine.generate(
+                {"question": row["question"], "documents": documents}, config={"callbacks": [counter]}
+            )
+            metrics[mode]["tokens"].append(counter.input_tokens or output["context_tokens"])
+            metrics[mode]["latency"].append(output["generation_latency_ms"])
+            metrics[mode]["blocks"].append(len(output["context_documents"]))
+            results[mode].append(
+                {
+                    "question": row["question"],
+                    "answer": str(output["generation"]),
+                    "contexts": [str(doc.page_content) for doc in output["context_documents"]],
+                    "ground_truth": row["ground_truth"],
+                }
+            )
+
+    for mode, data in results.items():
+        path = os.path.join(EVALS_DIR, f"rag_results_packing_{mode}.json")
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+        print(f"💾 Saved {path}")
+
+    print(f"\n{len(rows)} questions, budget {args.budget} tokens, dedup threshold {engine.CONTEXT_DEDUP_THRESHOLD}\n")
+    print("| Packing | Prompt tokens (mean) | Context blocks (mean) | Generation p50 ms | Generation p95 ms |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for mode, data in metrics.items():
+        latencies = sorted(data["latency"])
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(
+            f"| {mode} | {statistics.mean(data['tokens']):.0f} | {statistics.mean(data['blocks']):.1f} "
+            f"| {statistics.median(latencies):.0f} | {p95:.0f} |"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+"""
+Questions naming CSF control IDs: dense search, hybrid search and the control-ID index.
+
+Runs the real API offline (in-memory Qdrant of synthetic chunks, each defining
+one control such as "GV.SC-04: ...", hash embeddings, fake LLM). The BM25 and
+control-ID indexes are built from the collection the way ingestion builds them.
+Questions name a subcategory or a category that exists in the collection,
+plus the control-ID questions of evals/test.csv whose IDs the synthetic
+collection happens to contain. Reports, per mode:
+
+  hit@1          the first source defines (or, for a category, belongs to) the asked control
+  precision      share of sources that mention the asked control
+  TTFT / total   p50 time to first token and end-to-end /chat time
+  embedding      embedding model calls per question
+  Qdrant         searches per question
+  grader         grader LLM calls per question
+
+On the real collection, run evals/collector.py with CONTROL_ID_LOOKUP on and off
+and compare the RAGAS reports of the control-ID rows.
+
+Usage: python benchmarks/control_benchmark.py [--questions 60] [--chunks 200]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import os
+import csv
+import json
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+from collections import Counter, defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_qdrant import QdrantVectorStore
+from prometheus_client import REGISTRY
+
+from chat_benchmark import send_request, percentile
+
+TEST_FILE = os.path.join(fakes.PROJECT_ROOT, "evals", "test.csv")
+TEMPLATES = [
+    "What does {control} require?",
+    "How do we show compliance with {control}?",
+    "Summarize {control} for our audit.",
+]
+
+
+class RoleCounter(BaseCallbackHandler):
+    """Counts LLM calls per request ID and role tag."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = defaultdict(Counter)
+
+    def on_chat_model_start(self, serialized, messages, *, tags=None, **kwargs) -> None:
+        from audit_ai.metrics import LLM_ROLES, request_id_var
+
+        role = next((tag for tag in (tags or []) if tag in LLM_ROLES), "other")
+        self.calls[request_id_var.get()][role] += 1
+
+
+def counter_total(name: str, operations=None) -> float:
+    total = 0.0
+    for metric in REGISTRY.collect():
+        for sample in metric.samples:
+            if sample.name == name and (operations is None or sample.labels.get("operation") in operations):
+                total += sample.value
+    return total
+
+
+async def build_local_indexes(engine, directory: str):
+    """The BM25 and control-ID indexes over the in-memory collection, as ingestion writes them."""
+    from audit_ai.sparse import BM25Index
+    from audit_ai.controls import ControlIndex
+
+    points, offset = [], None
+    while True:
+        batch, offset = await engine.get_async_client().scroll(
+            collection_name=engine.COLLECTION_NAME, with_payload=True, limit=1000, offset=offset
+        )
+        points += batch
+        if offset is None:
+            break
+    ids = [str(point.id) for point in points]
+    texts = [point.payload[QdrantVectorStore.CONTENT_KEY] for point in points]
+    metadatas = [point.payload[QdrantVectorStore.METADATA_KEY] for point in points]
+
+    engine.SPARSE_INDEX_PATH = os.path.join(directory, "sparse_index.json")
+    engine.CONTROL_INDEX_PATH = os.path.join(directory, "control_index.json")
+    BM25Index(ids, texts, metadatas).save(engine.SPARSE_INDEX_PATH)
+    controls = ControlIndex(ids, texts, metadatas)
+    controls.save(engine.CONTROL_INDEX_PATH)
+    return controls
+
+
+def make_questions(controls, n: int, seed: int = 0):
+    """(question, control) pairs: subcategories and categories, then matching evals/test.csv rows."""
+    from audit_ai.controls import query_control_ids
+
+    rng = random.Random(seed)
+    known = sorted(controls.controls())
+    categories = sorted({control.split("-")[0] for control in known})
+    pairs = []
+    for i in range(n):
+        control = rng.choice(categories) if i % 4 == 3 else rng.choice(known)
+        pairs.append((rng.choice(TEMPLATES).format(control=control), control))
+
+    evals = 0
+    with open(TEST_FILE, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for control in query_control_ids(row["question"]):
+                if controls.lookup(control):
+                    pairs.append((row["question"], control))
+                    evals += 1
+    return pairs, evals
+
+
+def score_sources(sources, control: str):
+    """(first source belongs to the control, share of sources mentioning it)."""
+    if not sources:
+        return 0.0, 0.0
+    mentions = [control in source["text"] for source in sources]
+    # Synthetic chunks open with the control they define
+    first = sources[0]["text"].startswith(control)
+    return float(first), sum(mentions) / len(mentions)
+
+
+async def run_mode(engine, api, roles: RoleCounter, label: str, pairs):
+    rows = []
+    for i, (question, control) in enumerate(pairs):
+        request_id = f"{label}-{i}"
+        embeddings_before = counter_total("auditai_embedding_latency_seconds_count")
+        searches_before = counter_total("auditai_qdrant_latency_seconds_count", ("query_points", "query_batch_points"))
+        result = await send_request(api.app, request_id, question)
+        if result["status"] != 200 or result["failed"]:
+            raise RuntimeError(f"/chat failed for {question!r}")
+        lines = [json.loads(line) for line in result["body"].decode("utf-8").splitlines() if line]
+        sources = next(line["content"] for line in lines if line["type"] == "sources")
+        hit, precision = score_sources(sources, control)
+        rows.append(
+            {
+                "hit": hit,
+                "precision": precision,
+                "ttft": result["ttft"] * 1000,
+                "total": result["total"] * 1000,
+                "embedding": counter_total("auditai_embedding_latency_seconds_count") - embeddings_before,
+                "searches": counter_total(
+                    "auditai_qdrant_latency_seconds_count", ("query_points", "query_batch_points")
+                ) - searches_before,
+                "grader": roles.calls.pop(request_id, Counter())["grader"],
+            }
+        )
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(
+        llm_latency=args.llm_latency, embedding_latency=args.embedding_latency, n_chunks=args.chunks
+    )
+    roles = RoleCounter()
+    engine.get_llm().callbacks.append(roles)
+    from audit_ai import main as api
+
+    api.COALESCE_REQUESTS = False
+    with tempfile.TemporaryDirectory() as directory:
+        controls = await build_local_indexes(engine, directory)
+        pairs, evals = make_questions(controls, args.questions)
+        await send_request(api.app, "warmup", "warm up the collection")
+
+        modes = [("dense", False, False), ("hybrid (BM25)", True, False), ("control-ID index", True, True)]
+        results = {}
+        for name, hybrid, lookup in modes:
+            engine.HYBRID_RETRIEVAL = hybrid
+            engine.CONTROL_ID_LOOKUP = lookup
+            # Every mode embeds each question afresh
+            engine.get_embeddings()._memory.clear()
+            results[name] = await run_mode(engine, api, roles, name, pairs)
+
+    print(
+        f"\n{len(pairs)} control-ID questions ({evals} from evals/test.csv), {len(controls)} controls "
+        f"in {args.chunks} chunks, LLM latency {args.llm_latency}s, embedding latency {args.embedding_latency}s\n"
+    )
+    print("| Mode | Hit@1 | Precision | TTFT p50 ms | Total p50 ms | Embedding / q | Qdrant / q | Grader / q |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    for name, rows in results.items():
+        print(
+            f"| {name} | {statistics.mean(r['hit'] for r in rows):.0%} "
+            f"| {statistics.mean(r['precision'] for r in rows):.0%} "
+            f"| {percentile([r['ttft'] for r in rows], 0.5):.0f} "
+            f"| {percentile([r['total'] for r in rows], 0.5):.0f} "
+            f"| {statistics.mean(r['embedding'] for r in rows):.2f} "
+            f"| {statistics.mean(r['searches'] for r in rows):.2f} "
+            f"| {statistics.mean(r['grader'] for r in rows):.2f} |"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
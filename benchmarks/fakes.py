@@ -0,0 +1,317 @@
+"""
+Deterministic local stand-ins for the Gemini and Qdrant dependencies, so the
+API can be load-tested without spending real quota.
+
+Import this module BEFORE `audit_ai.engine` / `audit_ai.main`: it fills in
+placeholder credentials and the settings the offline stack relies on.
+"""
+import sys
+import os
+
+# --- PATH HACK (Industrial Standard for standalone scripts) ---
+# Adds the 'src' directory to the path so we can import 'audit_ai'
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+import re
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+from contextlib import contextmanager
+from typing import Any, List, Tuple
+
+import numpy as np
+
+for key in ("GOOGLE_API_KEY", "QDRANT_API_KEY"):
+    os.environ.setdefault(key, "offline-benchmark")
+os.environ.setdefault("QDRANT_URL", "http://localhost:6333")
+# Every load-test request asks the same question; the answer cache would short-circuit it
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+# There is no embedding model to route with, so the (fake) LLM router is used
+os.environ.setdefault("ROUTER_MODE", "llm")
+
+from langchain_qdrant import QdrantVectorStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+# Words a follow-up uses to point back at an earlier turn
+_REFERENCE = re.compile(r"\b(that|it|this|those|them)\b")
+# Questions naming a CSF control ("PR.AA-05") are compliance questions too
+_CONTROL_ID = re.compile(r"\b(GV|ID|PR|DE|RS|RC)\.[A-Z]{2}\b", re.IGNORECASE)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers each engine prompt with a canned reply after a fixed latency.
+    Async calls sleep without blocking the event loop, like a real network call would.
+    """
+
+    latency: float = 0.2
+    token_latency: float = 0.0  # Delay between streamed chunks
+    grade: str = "yes"
+    # When set, a per-chunk grader call says 'yes' only if the chunk matches this regex
+    relevant_pattern: str = ""
+    answer: str = "According to the NIST framework, the Govern function sets the cybersecurity risk strategy."
+    # Like a quota-limited API: calls beyond this many in flight fail at once (0: no limit)
+    capacity: int = 0
+    _active: int = PrivateAttr(default=0)
+    peak_active: int = 0
+    rejected: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages) -> str:
+        prompt = messages[-1].content
+        if "You are a router" in prompt:
+            user_input = prompt.split("Input:", 1)[1].split("\n", 1)[0]
+            return "search" if "NIST" in user_input or _CONTROL_ID.search(user_input) else "chat"
+        if "You are a grader" in prompt:
+            if self.relevant_pattern and "Here is the retrieved document:" in prompt:
+                document = prompt.split("Here is the retrieved document:", 1)[1].split("Here is the user question:", 1)[0]
+                return "yes" if re.search(self.relevant_pattern, document) else "no"
+            return self.grade
+        if "standalone question" in prompt:
+            # A follow-up that refers back ("that", "it") carries the words of the last self-contained
+            # user turn along; anything else is already standalone
+            follow_up = prompt.split("Follow-up question:", 1)[1].split("\n", 1)[0].strip()
+            turns = re.findall(r"^User: (.*)$", prompt.split("Follow-up question:", 1)[0], re.MULTILINE)
+            standalone = [turn for turn in turns if not _REFERENCE.search(turn)]
+            if standalone and _REFERENCE.search(follow_up):
+                return f"{follow_up} ({standalone[-1]})"
+            return follow_up
+        if "vector search query" in prompt:
+            return "NIST CSF 2.0 governance controls"
+        return self.answer
+
+    @contextmanager
+    def _slot(self):
+        self._active += 1
+        self.peak_active = max(self.peak_active, self._active)
+        try:
+            if self.capacity and self._active > self.capacity:
+                self.rejected += 1
+                raise RuntimeError("429 RESOURCE_EXHAUSTED (fake quota)")
+            yield
+        finally:
+            self._active -= 1
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        with self._slot():
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        with self._slot():
+            await asyncio.sleep(self.latency)
+        for i, word in enumerate(self._reply(messages).split(" ")):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeVectorStore:
+    """
+    Returns synthetic NIST chunks after a fixed search latency.
+    The top score defaults to the ambiguous band, so requests still go through the grader.
+    """
+
+    def __init__(self, latency: float = 0.05, n_chunks: int = 10, top_score: float = 0.7):
+        self.latency = latency
+        self.top_score = top_score
+        self.documents = [
+            Document(
+                page_content=f"GV.OC-0{i % 5 + 1}: The organizational context is understood (chunk {i}).",
+                metadata={"source_file": "nist_framework.pdf", "page": i, "_id": f"chunk-{i}"},
+            )
+            for i in range(n_chunks)
+        ]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        time.sleep(self.latency)
+        return self.documents[:k]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        await asyncio.sleep(self.latency)
+        return self.documents[:k]
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        await asyncio.sleep(self.latency)
+        # Honours the engine's filters: skipped chunk IDs (must_not) and source files (must)
+        search_filter = kwargs.get("filter")
+        excluded = {str(i) for cond in (search_filter.must_not if search_filter else None) or [] for i in cond.has_id}
+        allowed = None
+        for cond in (search_filter.must if search_filter else None) or []:
+            allowed = set(cond.match.any)
+        documents = [
+            doc
+            for doc in self.documents
+            if doc.metadata["_id"] not in excluded and (allowed is None or doc.metadata["source_file"] in allowed)
+        ]
+        return [(doc, self.top_score - 0.01 * i) for i, doc in enumerate(documents[:k])]
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings: each word is hashed to a signed
+    dimension. Texts sharing words get similar vectors, so routing and ranking
+    behave plausibly without an embedding model.
+
+    A shared extra dimension lifts every cosine similarity to at least
+    `baseline_similarity`, like real embedding models (unrelated texts rarely
+    score near 0), so the engine's score thresholds keep their meaning.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0, baseline_similarity: float = 0.5):
+        self.size = size
+        self.latency = latency
+        self.baseline_similarity = baseline_similarity
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size + 1, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "little")
+            vector[digest % self.size] += 1.0 if (digest >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector *= np.sqrt(1 - self.baseline_similarity) / norm
+        vector[-1] = np.sqrt(self.baseline_similarity)
+        return vector.tolist()
+
+    # Keyword arguments (Gemini's task_type, ...) change nothing here
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+FUNCTIONS = {
+    "GV": "Govern", "ID": "Identify", "PR": "Protect", "DE": "Detect", "RS": "Respond", "RC": "Recover",
+}
+TOPICS = [
+    "supply chain risk", "asset inventory", "access control", "incident response", "backups",
+    "continuous monitoring", "roles and responsibilities", "risk strategy", "vulnerability management",
+    "awareness training", "data security", "recovery planning",
+]
+
+
+def synthetic_chunks(n_chunks: int, seed: int = 0) -> List[Document]:
+    """NIST-flavoured chunks with control IDs, spread over pages of one framework PDF."""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(n_chunks):
+        prefix = rng.choice(list(FUNCTIONS))
+        control = f"{prefix}.{rng.choice(['OC', 'RM', 'SC', 'AM', 'AA', 'CM', 'MA', 'RP'])}-{rng.randint(1, 9):02d}"
+        topic = rng.choice(TOPICS)
+        text = (
+            f"{control}: Under the {FUNCTIONS[prefix]} function of the NIST CSF 2.0, the organization "
+            f"addresses {topic}. " + " ".join(rng.choice(TOPICS) for _ in range(30))
+        )
+        chunks.append(
+            Document(
+                page_content=text,
+                metadata={"source_file": "nist_framework.pdf", "page": i // 4, "page_label": str(i // 4 + 1)},
+            )
+        )
+    return chunks
+
+
+async def load_memory_collection(embeddings: Embeddings, documents: List[Document], collection_name: str):
+    """An in-memory AsyncQdrantClient holding `documents`, stored the way ingestion stores them."""
+    from qdrant_client import AsyncQdrantClient, models
+
+    client = AsyncQdrantClient(":memory:")
+    vectors = await embeddings.aembed_documents([doc.page_content for doc in documents])
+    await client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=len(vectors[0]), distance=models.Distance.COSINE),
+    )
+    await client.upsert(
+        collection_name=collection_name,
+        points=[
+            models.PointStruct(
+                id=str(uuid.uuid5(uuid.NAMESPACE_URL, doc.page_content)),
+                vector=vector,
+                payload={
+                    QdrantVectorStore.CONTENT_KEY: doc.page_content,
+                    QdrantVectorStore.METADATA_KEY: doc.metadata,
+                },
+            )
+            for doc, vector in zip(documents, vectors)
+        ],
+    )
+    return client
+
+
+async def ainstall_offline_stack(
+    llm_latency: float = 0.2,
+    token_latency: float = 0.0,
+    embedding_latency: float = 0.0,
+    n_chunks: int = 200,
+):
+    """
+    Runs the real retrieval path offline: hash embeddings (behind the engine's
+    embedding cache), an in-memory Qdrant collection of synthetic chunks, and the
+    fake streaming chat model. Returns the engine module.
+    """
+    from audit_ai import engine
+    from audit_ai.vectorstore import AsyncQdrantVectorStore
+
+    embeddings = engine.get_embeddings()
+    # Swapping the wrapped model keeps the cache, the router and the answer cache pointing at one object
+    embeddings.embeddings = HashEmbeddings(latency=embedding_latency)
+
+    async_client = await load_memory_collection(HashEmbeddings(), synthetic_chunks(n_chunks), engine.COLLECTION_NAME)
+    engine.set_components(
+        llm=FakeChatModel(
+            latency=llm_latency, token_latency=token_latency, callbacks=[engine.metrics.llm_metrics_handler]
+        ),
+        async_client=async_client,
+        vector_store=AsyncQdrantVectorStore(
+            client=engine.get_client(),
+            async_client=async_client,
+            collection_name=engine.COLLECTION_NAME,
+            embedding=embeddings,
+            validate_collection_config=False,
+            limiter=engine.upstream_limits["qdrant"],
+        ),
+    )
+    return engine
+
+
+def install(llm_latency: float = 0.2, retrieval_latency: float = 0.05, grade: str = "yes", top_score: float = 0.7):
+    """Swaps the engine's LLM and vector store for the fakes. Returns the engine module."""
+    from audit_ai import engine
+
+    engine.set_components(
+        llm=FakeChatModel(latency=llm_latency, grade=grade, callbacks=[engine.metrics.llm_metrics_handler]),
+        vector_store=FakeVectorStore(latency=retrieval_latency, top_score=top_score),
+    )
+    return engine
@@ -0,0 +1,105 @@
+"""
+Dense-only vs hybrid (dense + BM25, reciprocal rank fusion) retrieval.
+
+Runs every question in evals/test.csv, plus a few control-ID lookups, through
+the search graph twice and reports, for each mode:
+
+  retry rate      share of questions that went through transform_query at least once
+  LLM calls/query grader + rewrite + generation calls
+  latency         end-to-end graph latency
+
+Needs the real API keys and a collection ingested with `python -m audit_ai.ingestion`
+(which also writes data/sparse_index.json).
+
+Usage: python benchmarks/hybrid_benchmark.py [--limit N]
+"""
+import sys
+import os
+
+# --- PATH HACK (Industrial Standard for standalone scripts) ---
+# Adds the 'src' directory to the path so we can import 'audit_ai'
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+import csv
+import time
+import asyncio
+import argparse
+import statistics
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from audit_ai import engine
+
+EVAL_QUESTIONS_FILE = os.path.join(PROJECT_ROOT, "evals", "test.csv")
+
+# Exact-term queries that dense retrieval tends to miss
+CONTROL_ID_QUESTIONS = [
+    "What does GV.SC-04 require?",
+    "What is GV.OC-01 about?",
+    "Explain ID.AM-01.",
+    "What does PR.AA-01 cover?",
+    "What is DE.CM-01?",
+    "What does RS.MA-01 say?",
+    "What is RC.RP-01 about?",
+]
+
+
+class LLMCallCounter(AsyncCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+
+    async def on_chat_model_start(self, *args, **kwargs) -> None:
+        self.calls += 1
+
+    async def on_llm_start(self, *args, **kwargs) -> None:
+        self.calls += 1
+
+
+def load_questions():
+    with open(EVAL_QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        questions = [row["question"] for row in csv.DictReader(f)]
+    return questions + CONTROL_ID_QUESTIONS
+
+
+async def run_mode(hybrid: bool, questions):
+    engine.HYBRID_RETRIEVAL = hybrid
+    retried, calls, latencies = 0, [], []
+    for question in questions:
+        counter = LLMCallCounter()
+        started = time.perf_counter()
+        result = await engine.app.ainvoke({"question": question}, config={"callbacks": [counter]})
+        latencies.append(time.perf_counter() - started)
+        calls.append(counter.calls)
+        if result.get("retry_count", 0) > 0:
+            retried += 1
+    return retried / len(questions), statistics.mean(calls), latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=None, help="Only run the first N questions.")
+    args = parser.parse_args()
+
+    questions = load_questions()[: args.limit]
+    if engine.get_sparse_index() is None:
+        print(f"❌ No sparse index at {engine.SPARSE_INDEX_PATH}. Run the ingestion first.")
+        sys.exit(1)
+
+    rows = []
+    for name, hybrid in (("dense", False), ("hybrid", True)):
+        print(f"--- Running {name} retrieval over {len(questions)} questions ---")
+        rows.append((name, *await run_mode(hybrid, questions)))
+
+    print(f"\n{len(questions)} questions ({len(CONTROL_ID_QUESTIONS)} control-ID lookups), k={engine.RETRIEVAL_K}, RRF k={engine.RRF_K}\n")
+    print("| Retrieval | Retry rate | LLM calls / query | p50 s | p95 s |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for name, retry_rate, calls, latencies in rows:
+        p50 = statistics.median(latencies)
+        p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+        print(f"| {name} | {retry_rate:.0%} | {calls:.2f} | {p50:.2f} | {p95:.2f} |")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
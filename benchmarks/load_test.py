@@ -0,0 +1,60 @@
+"""
+Single-worker load test for /chat.
+
+Drives the FastAPI app in-process (one event loop == one uvicorn worker) with
+increasing concurrency against fake upstreams that have a fixed latency.
+If nothing blocks the event loop, requests/sec grows roughly linearly with
+concurrency; a blocking call anywhere on the path flattens the curve at ~1x.
+
+Usage: python benchmarks/load_test.py [--llm-latency 0.2] [--requests-per-level 32]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import time
+import asyncio
+import argparse
+
+import httpx
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int, query: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with semaphore:
+            response = await client.post("/chat", json={"query": query}, timeout=None)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": total, "seconds": elapsed, "rps": total / elapsed}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    parser.add_argument("--requests-per-level", type=int, default=32)
+    parser.add_argument("--levels", type=str, default="1,2,4,8,16,32")
+    parser.add_argument("--query", type=str, default="What does the NIST Govern function cover?")
+    args = parser.parse_args()
+
+    fakes.install(llm_latency=args.llm_latency, retrieval_latency=args.retrieval_latency)
+    from audit_ai.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = []
+        for level in [int(x) for x in args.levels.split(",")]:
+            results.append(await run_level(client, level, args.requests_per_level, args.query))
+
+    baseline = results[0]["rps"]
+    print("\n| Concurrency | Requests | Seconds | Req/s | Speedup |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for r in results:
+        print(f"| {r['concurrency']} | {r['requests']} | {r['seconds']:.2f} | {r['rps']:.2f} | {r['rps'] / baseline:.1f}x |")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
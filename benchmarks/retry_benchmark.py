@@ -0,0 +1,99 @@
+"""
+Rewrite loops with and without excluding already graded chunks.
+
+Runs the real graph offline (in-memory Qdrant of synthetic chunks, hash
+embeddings, fake LLM). The fake grader calls a chunk relevant only if it
+carries one of a few control IDs, so many questions need rewrites. Reports,
+for RETRY_EXCLUDE_SEEN off and on, per request:
+
+  grader calls     per-chunk grader LLM calls (including ones cancelled by the early exit)
+  re-grades        calls spent on a chunk already sent to the grader for the same request
+  distinct chunks  chunks sent to the grader
+  rewrites         transform_query loops
+  found            share of requests that reached a chunk graded relevant
+
+Usage: python benchmarks/retry_benchmark.py [--chunks 200] [--pattern "R[CS]\\.\\w\\w-0[12]"]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import asyncio
+import argparse
+import statistics
+from collections import Counter
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+QUESTION_TEMPLATES = [
+    "What does the NIST framework say about {topic}?",
+    "Which controls cover {topic}?",
+]
+
+
+class GradedChunks(BaseCallbackHandler):
+    """Counts how often each chunk is sent to the per-chunk grader."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.chunks = Counter()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        prompt = messages[0][-1].content
+        if "Here is the retrieved document:" in prompt:
+            self.chunks[prompt.split("Here is the retrieved document:", 1)[1].split("Here is the user question:", 1)[0]] += 1
+
+
+async def run_mode(engine, questions, exclude_seen: bool):
+    engine.RETRY_EXCLUDE_SEEN = exclude_seen
+    rows = []
+    for question in questions:
+        graded = GradedChunks()
+        state = await engine.get_graph().ainvoke({"question": question}, config={"callbacks": [graded]})
+        calls = sum(graded.chunks.values())
+        rows.append(
+            {
+                "calls": calls,
+                "regrades": calls - len(graded.chunks),
+                "distinct": len(graded.chunks),
+                "rewrites": state.get("retry_count", 0),
+                "found": bool(state.get("relevant_documents")),
+            }
+        )
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--pattern", type=str, default=r"R[CS]\.\w\w-0[12]", help="Control IDs the fake grader accepts.")
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(llm_latency=0.0, n_chunks=args.chunks)
+    engine.get_llm().relevant_pattern = args.pattern
+    # Every pass must reach the grader for the comparison to mean anything
+    engine.SCORE_GATING = False
+    engine.GRADER_MODE = "concurrent"
+    questions = [template.format(topic=topic) for topic in fakes.TOPICS for template in QUESTION_TEMPLATES]
+
+    results = {}
+    for exclude_seen in (False, True):
+        results[exclude_seen] = await run_mode(engine, questions, exclude_seen)
+
+    print(f"\n{len(questions)} questions, {args.chunks} chunks, relevant = /{args.pattern}/, k={engine.RETRIEVAL_K}\n")
+    print("| Exclude seen | Grader calls / req | Re-grades / req | Distinct chunks / req | Rewrites / req | Found |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- |")
+    for exclude_seen, rows in results.items():
+        print(
+            f"| {'on' if exclude_seen else 'off'} "
+            f"| {statistics.mean(r['calls'] for r in rows):.2f} "
+            f"| {statistics.mean(r['regrades'] for r in rows):.2f} "
+            f"| {statistics.mean(r['distinct'] for r in rows):.2f} "
+            f"| {statistics.mean(r['rewrites'] for r in rows):.2f} "
+            f"| {sum(r['found'] for r in rows) / len(rows):.0%} |"
+        )
+    saved = [off["calls"] - on["calls"] for off, on in zip(results[False], results[True])]
+    print(f"\nGrader calls saved per request: mean {statistics.mean(saved):.2f}, max {max(saved)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
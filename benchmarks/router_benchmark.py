@@ -0,0 +1,130 @@
+"""
+Offline benchmark for the intent router.
+
+Routes a labelled set of queries (benchmarks/router_cases.csv plus every
+question in evals/test.csv, all 'search') three ways and reports accuracy
+and latency for each:
+
+  embedding  local classifier only (never abstains)
+  hybrid     local classifier, LLM fallback below ROUTER_CONFIDENCE_THRESHOLD
+  llm        the LLM router on every query
+
+A calibration table then shows, per confidence threshold, the share of
+queries the embedding router would decide locally and its accuracy on them;
+pick ROUTER_CONFIDENCE_THRESHOLD from it before setting ROUTER_MODE=embedding.
+
+Needs the real API keys (it measures the real embedding and LLM latency).
+Set EMBEDDING_CACHE_PATH to avoid re-embedding on repeat runs.
+
+Usage: python benchmarks/router_benchmark.py [--no-llm]
+"""
+import sys
+import os
+
+# --- PATH HACK (Industrial Standard for standalone scripts) ---
+# Adds the 'src' directory to the path so we can import 'audit_ai'
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+import csv
+import time
+import asyncio
+import argparse
+import statistics
+
+from audit_ai import engine
+from audit_ai.config import ROUTER_CONFIDENCE_THRESHOLD, ROUTER_EXAMPLES_FILE, ROUTER_STRATEGY, ROUTER_KNN_K
+from audit_ai.router import EmbeddingRouter, load_router_examples
+
+CASES_FILE = os.path.join(CURRENT_DIR, "router_cases.csv")
+EVAL_QUESTIONS_FILE = os.path.join(PROJECT_ROOT, "evals", "test.csv")
+
+
+def load_cases():
+    cases = []
+    with open(CASES_FILE, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            cases.append((row["query"], row["intent"]))
+    with open(EVAL_QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            cases.append((row["question"], "search"))
+    return cases
+
+
+def summarize(name, predictions, latencies, labels, extra=""):
+    correct = sum(p == l for p, l in zip(predictions, labels))
+    p50 = statistics.median(latencies) * 1000
+    p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000
+    print(f"| {name} | {correct / len(labels):.1%} | {p50:.1f} | {p95:.1f} | {extra} |")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-llm", action="store_true", help="Skip the LLM-only run (hybrid fallbacks still call the LLM).")
+    args = parser.parse_args()
+
+    cases = load_cases()
+    labels = [intent for _, intent in cases]
+
+    # A threshold below any possible margin forces a decision, giving the raw classifier
+    forced = EmbeddingRouter(
+        engine.embeddings,
+        load_router_examples(ROUTER_EXAMPLES_FILE),
+        threshold=-1.0,
+        strategy=ROUTER_STRATEGY,
+        k=ROUTER_KNN_K,
+    )
+    await forced.aclassify("warm up")  # Embeds the examples outside the timed loop
+
+    embedding_preds, embedding_lat, margins = [], [], []
+    hybrid_preds, hybrid_lat = [], []
+    fallbacks = 0
+    engine.ROUTER_MODE = "llm"
+
+    for query, label in cases:
+        started = time.perf_counter()
+        intent, margin = await forced.aclassify(query)
+        elapsed = time.perf_counter() - started
+        embedding_preds.append(intent)
+        embedding_lat.append(elapsed)
+        margins.append(margin)
+
+        if margin >= ROUTER_CONFIDENCE_THRESHOLD:
+            hybrid_preds.append(intent)
+            hybrid_lat.append(elapsed)
+        else:
+            fallbacks += 1
+            started = time.perf_counter()
+            hybrid_preds.append(await engine.aroute_query(query))
+            hybrid_lat.append(elapsed + time.perf_counter() - started)
+
+        if intent != label:
+            print(f"   ✗ embedding router: '{query}' -> {intent} (expected {label}, margin {margin:.3f})")
+
+    llm_preds, llm_lat = [], []
+    if not args.no_llm:
+        for query, _ in cases:
+            started = time.perf_counter()
+            llm_preds.append(await engine.aroute_query(query))
+            llm_lat.append(time.perf_counter() - started)
+
+    print(f"\n{len(cases)} queries, threshold {ROUTER_CONFIDENCE_THRESHOLD}, strategy {ROUTER_STRATEGY}\n")
+    print("| Router | Accuracy | p50 ms | p95 ms | Notes |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    summarize("embedding", embedding_preds, embedding_lat, labels, "includes one embedding call")
+    summarize("hybrid", hybrid_preds, hybrid_lat, labels, f"{fallbacks / len(cases):.0%} fell back to the LLM")
+    if llm_preds:
+        summarize("llm", llm_preds, llm_lat, labels, "one LLM call per query")
+
+    # Calibration: queries at or above each threshold are decided locally, the rest go to the LLM
+    print("\n| Threshold | Decided locally | Local accuracy |")
+    print("| :--- | :--- | :--- |")
+    for threshold in (0.0, 0.02, 0.04, 0.06, 0.08, 0.1, 0.15):
+        local = [(p, l) for p, l, m in zip(embedding_preds, labels, margins) if m >= threshold]
+        accuracy = f"{sum(p == l for p, l in local) / len(local):.1%}" if local else "-"
+        print(f"| {threshold} | {len(local) / len(labels):.0%} | {accuracy} |")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
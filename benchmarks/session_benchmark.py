@@ -0,0 +1,157 @@
+"""
+Multi-turn conversations with and without the per-session document cache.
+
+Runs the real API offline (in-memory Qdrant of synthetic chunks, hash
+embeddings, fake LLM). Each conversation asks about a topic, follows up on it
+twice ("which controls cover that?") and then switches topic. History is sent
+with every turn, so follow-ups are condensed in every mode. For the cache off
+and for each SESSION_REUSE_THRESHOLD, per turn after the first:
+
+  reused         share of follow-ups / topic switches answered from the session's chunks
+  overlap        share of a fresh retrieval's chunks that the reused chunks contain
+  Qdrant         dense searches per turn
+  grader         grader LLM calls per turn
+  LLM calls      all LLM calls per turn (condenser included)
+  latency        p50 end-to-end /chat time
+
+A good threshold reuses follow-ups but not topic switches, at a high overlap.
+Hash embeddings separate topics far worse than a real model, so calibrate the
+production value on real conversations; this shows the mechanics and savings.
+
+Usage: python benchmarks/session_benchmark.py [--conversations 24] [--thresholds 0.6,0.65,0.7]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import asyncio
+import argparse
+import statistics
+from collections import Counter, defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import REGISTRY
+
+from chat_benchmark import one_request, percentile
+
+TURNS = [
+    "What does the NIST framework say about {topic}?",
+    "Which controls cover that?",
+    "And who is responsible for it under NIST?",
+    "What does NIST say about {other} instead?",
+]
+SWITCH_TURN = 3
+
+
+class RoleCounter(BaseCallbackHandler):
+    """Counts LLM calls per request ID and role tag."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = defaultdict(Counter)
+
+    def on_chat_model_start(self, serialized, messages, *, tags=None, **kwargs) -> None:
+        from audit_ai.metrics import LLM_ROLES, request_id_var
+
+        role = next((tag for tag in (tags or []) if tag in LLM_ROLES), "other")
+        self.calls[request_id_var.get()][role] += 1
+
+
+def qdrant_searches() -> float:
+    return REGISTRY.get_sample_value("auditai_qdrant_latency_seconds_count", {"operation": "query_points"}) or 0.0
+
+
+def record_reuse(engine):
+    """Wraps the session lookup to keep (question, reused chunks) per request ID."""
+    lookup = engine.asession_lookup
+    reused = {}
+
+    async def recording_lookup(session_id, user_query, source_files=None):
+        result = await lookup(session_id, user_query, source_files)
+        if result:
+            reused[engine.metrics.request_id_var.get()] = (user_query, result[0])
+        return result
+
+    engine.asession_lookup = recording_lookup
+    return reused
+
+
+async def overlap_with_fresh(engine, question, documents) -> float:
+    """Share of what a real search would have retrieved that the reused chunks contain."""
+    fresh, _ = await engine.aretrieve_documents(question)
+    reused_ids = {engine.chunk_id(doc) for doc in documents}
+    return sum(engine.chunk_id(doc) in reused_ids for doc in fresh) / len(fresh) if fresh else 1.0
+
+
+async def converse(engine, api, counter, reused, label: str, topic: str, other: str):
+    history, rows = [], []
+    for turn, template in enumerate(TURNS):
+        question = template.format(topic=topic, other=other)
+        request_id = f"{label}-{turn}"
+        searches_before = qdrant_searches()
+        result = await one_request(api.app, request_id, question, history=list(history), session_id=label)
+        roles = counter.calls.pop(request_id, Counter())
+        row = {
+            "turn": turn,
+            "total": result["total"] * 1000,
+            "searches": qdrant_searches() - searches_before,
+            "grader": roles["grader"],
+            "llm": sum(roles.values()),
+            "reused": request_id in reused,
+        }
+        if row["reused"]:
+            row["overlap"] = await overlap_with_fresh(engine, *reused.pop(request_id))
+        rows.append(row)
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": "(answer)"}]
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=24)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--thresholds", type=str, default="0.6,0.65,0.7")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    engine = await fakes.ainstall_offline_stack(llm_latency=args.llm_latency, n_chunks=args.chunks)
+    counter = RoleCounter()
+    engine.get_llm().callbacks.append(counter)
+    reused = record_reuse(engine)
+
+    from audit_ai import main as api
+
+    api.COALESCE_REQUESTS = False
+    await one_request(api.app, "warmup", "warm up the collection")
+
+    modes = [None] + [float(t) for t in args.thresholds.split(",")]
+    results = {}
+    for threshold in modes:
+        engine.SESSION_CACHE_ENABLED = threshold is not None
+        engine.session_store.threshold = threshold or 0.0
+        rows = []
+        for c in range(args.conversations):
+            topic, other = fakes.TOPICS[c % len(fakes.TOPICS)], fakes.TOPICS[(c + 5) % len(fakes.TOPICS)]
+            rows += await converse(engine, api, counter, reused, f"{threshold}-{c}", topic, other)
+        results[threshold] = [r for r in rows if r["turn"] > 0]
+
+    print(f"\n{args.conversations} conversations x {len(TURNS)} turns, LLM latency {args.llm_latency}s (turns 2-4)\n")
+    print("| Session cache | Reused (follow-up / switch) | Overlap | Qdrant / turn | Grader / turn | LLM calls / turn | Latency p50 ms |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    for threshold, rows in results.items():
+        follow_ups = [r for r in rows if r["turn"] != SWITCH_TURN]
+        switches = [r for r in rows if r["turn"] == SWITCH_TURN]
+        overlaps = [r["overlap"] for r in rows if r["reused"]]
+        print(
+            f"| {'off' if threshold is None else f'>= {threshold}'} "
+            f"| {sum(r['reused'] for r in follow_ups) / len(follow_ups):.0%} / {sum(r['reused'] for r in switches) / len(switches):.0%} "
+            f"| {f'{statistics.mean(overlaps):.0%}' if overlaps else '-'} "
+            f"| {statistics.mean(r['searches'] for r in rows):.2f} "
+            f"| {statistics.mean(r['grader'] for r in rows):.2f} "
+            f"| {statistics.mean(r['llm'] for r in rows):.2f} "
+            f"| {percentile([r['total'] for r in rows], 0.5):.0f} |"
+        )
+    print(f"\n/stats sessions: {engine.session_store.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,295 @@
+"""
+Dense search on the local vector snapshot vs. the Qdrant path.
+
+Search: for each corpus size, the same synthetic, clustered embeddings (as in
+collection_benchmark.py) go into a Qdrant collection and into snapshots of each
+dtype. Exact nearest neighbours are computed with float32 NumPy.
+
+  recall@k       share of the exact top-k the search returned
+  latency        p50 / p95 per query (snapshot: the engine's search call; Qdrant: query_points)
+  filtered       p50 with a source-file filter (10% of the points)
+  matrix         size of the memory-mapped matrix (shared by all workers of a host)
+
+By default Qdrant is the in-process one (no network). Pass --url (or set
+QDRANT_URL with --server) to measure a real server; scratch collections are deleted.
+
+Engine: the real retrieval path offline (in-memory Qdrant of synthetic chunks,
+hash embeddings, fake LLM), with --rtt seconds of simulated network round trip
+on every Qdrant request. Reports aretrieve_documents latency and Qdrant requests
+per query with LOCAL_SNAPSHOT off and on, then /chat answers while Qdrant is down.
+
+Usage: python benchmarks/snapshot_benchmark.py [--points 500,2000,5000] [--dim 3072] [--rtt 0.03]
+"""
+import fakes  # noqa: F401  (must be imported before audit_ai)
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import AsyncQdrantClient, models
+from prometheus_client import REGISTRY
+
+from chat_benchmark import send_request
+from collection_benchmark import synthetic_embeddings, source_file
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def counter_total(name: str, operations=None) -> float:
+    total = 0.0
+    for metric in REGISTRY.collect():
+        for sample in metric.samples:
+            if sample.name == name and (operations is None or sample.labels.get("operation") in operations):
+                total += sample.value
+    return total
+
+
+def exact_top(vectors: np.ndarray, query: np.ndarray, k: int) -> set:
+    return set(np.argsort(-(vectors @ query))[:k].tolist())
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+# =============================================================================
+# 1. SEARCH: SNAPSHOT DTYPES VS QDRANT
+# =============================================================================
+
+async def fill_qdrant(client: AsyncQdrantClient, name: str, vectors: np.ndarray) -> None:
+    from audit_ai.collection import ensure_payload_indexes
+
+    if await client.collection_exists(name):
+        await client.delete_collection(name)
+    await client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE),
+    )
+    await ensure_payload_indexes(client, name)
+    for start in range(0, len(vectors), 256):
+        await client.upsert(
+            collection_name=name,
+            points=[
+                models.PointStruct(
+                    id=start + i,
+                    vector=vector.tolist(),
+                    payload={"metadata": {"source_file": source_file(start + i), "page": (start + i) // 50}},
+                )
+                for i, vector in enumerate(vectors[start:start + 256])
+            ],
+        )
+
+
+async def measure_qdrant(client, name, vectors, queries, k, filtered_to):
+    from audit_ai.collection import search_filter
+
+    recalls, latencies, filtered = [], [], []
+    for query in queries:
+        started = time.perf_counter()
+        response = await client.query_points(collection_name=name, query=query.tolist(), limit=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(exact_top(vectors, query, k) & {point.id for point in response.points}) / k)
+
+        started = time.perf_counter()
+        await client.query_points(
+            collection_name=name, query=query.tolist(), limit=k, query_filter=search_filter(source_files=filtered_to)
+        )
+        filtered.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(recalls), *summarize(latencies), summarize(filtered)[0]
+
+
+def measure_snapshot(directory, dtype, vectors, queries, k, filtered_to):
+    from audit_ai.snapshot import VectorSnapshot
+
+    ids = [str(i) for i in range(len(vectors))]
+    metadatas = [{"source_file": source_file(i), "page": i // 50} for i in range(len(vectors))]
+    VectorSnapshot.build(ids, vectors, [""] * len(vectors), metadatas, dtype=dtype).save(directory)
+    started = time.perf_counter()
+    snapshot = VectorSnapshot.load(directory)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    recalls, latencies, filtered = [], [], []
+    files = set(filtered_to)
+    for query in queries:
+        started = time.perf_counter()
+        hits = snapshot.search(query.tolist(), k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(exact_top(vectors, query, k) & {int(doc.metadata["_id"]) for doc, _ in hits}) / k)
+
+        started = time.perf_counter()
+        snapshot.search(query.tolist(), k=k, source_files=files)
+        filtered.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(recalls), *summarize(latencies), summarize(filtered)[0], snapshot.vectors.nbytes / 2**20, load_ms
+
+
+async def run_search(args):
+    if args.url:
+        client = AsyncQdrantClient(url=args.url, api_key=os.getenv("QDRANT_API_KEY"), timeout=120)
+        where = f"Qdrant at {args.url}"
+    else:
+        client = AsyncQdrantClient(":memory:")
+        where = "in-process Qdrant (no network)"
+    rng = np.random.default_rng(1)
+    filtered_to = [source_file(i) for i in range(2)]  # 10% of the points
+
+    print(f"\nSearch: {args.dim} dims, {args.queries} queries, k={args.k}, vs. {where}\n")
+    print(f"| Points | Backend | Matrix MB | Recall@{args.k} | p50 / p95 ms | Filtered p50 ms | Load ms |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    for n_points in [int(n) for n in args.points.split(",")]:
+        vectors = synthetic_embeddings(n_points, args.dim)
+        queries = vectors[rng.integers(0, n_points, args.queries)] + 0.3 * rng.standard_normal(
+            (args.queries, args.dim)
+        ).astype(np.float32) / np.sqrt(args.dim)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        collection = "bench_snapshot"
+        try:
+            await fill_qdrant(client, collection, vectors)
+            recall, p50, p95, f_p50 = await measure_qdrant(client, collection, vectors, queries, args.k, filtered_to)
+            print(f"| {n_points} | Qdrant | - | {recall:.3f} | {p50:.2f} / {p95:.2f} | {f_p50:.2f} | - |")
+        finally:
+            await client.delete_collection(collection)
+
+        for dtype in DTYPES:
+            with tempfile.TemporaryDirectory() as directory:
+                recall, p50, p95, f_p50, size_mb, load_ms = measure_snapshot(
+                    directory, dtype, vectors, queries, args.k, filtered_to
+                )
+            print(
+                f"| {n_points} | snapshot {dtype} | {size_mb:.1f} | {recall:.3f} | {p50:.2f} / {p95:.2f} "
+                f"| {f_p50:.2f} | {load_ms:.1f} |"
+            )
+
+
+# =============================================================================
+# 2. ENGINE: RETRIEVAL LATENCY AND QDRANT OUTAGE
+# =============================================================================
+
+class SimulatedNetwork:
+    """Adds a round trip to every Qdrant request of a client, or fails them all while `down`."""
+
+    OPERATIONS = ("query_points", "query_batch_points", "get_collection", "retrieve", "scroll")
+
+    def __init__(self, client, rtt: float):
+        self.rtt = rtt
+        self.down = False
+        for operation in self.OPERATIONS:
+            setattr(client, operation, self._wrap(getattr(client, operation)))
+
+    def _wrap(self, call):
+        async def wrapper(*args, **kwargs):
+            if self.down:
+                raise ConnectionError("Qdrant unreachable (simulated outage)")
+            await asyncio.sleep(self.rtt)
+            return await call(*args, **kwargs)
+
+        return wrapper
+
+
+async def export_snapshot(engine, directory: str, dtype: str):
+    """The in-memory collection as ingestion exports it."""
+    from audit_ai.snapshot import VectorSnapshot
+
+    points, offset = [], None
+    while True:
+        batch, offset = await engine.get_async_client().scroll(
+            collection_name=engine.COLLECTION_NAME, with_payload=True, with_vectors=True, limit=256, offset=offset
+        )
+        points += batch
+        if offset is None:
+            break
+    engine.SNAPSHOT_DIR = directory
+    VectorSnapshot.build(
+        [str(point.id) for point in points],
+        [point.vector for point in points],
+        [point.payload[QdrantVectorStore.CONTENT_KEY] for point in points],
+        [point.payload[QdrantVectorStore.METADATA_KEY] for point in points],
+        dtype=dtype,
+        index_version=await engine.aget_index_version(),
+    ).save(directory)
+
+
+async def run_engine(args):
+    engine = await fakes.ainstall_offline_stack(llm_latency=args.llm_latency, n_chunks=args.chunks)
+    from audit_ai import main as api
+
+    api.COALESCE_REQUESTS = False
+    engine.HYBRID_RETRIEVAL = False  # Dense search only: that is what the snapshot replaces
+    network = SimulatedNetwork(engine.get_async_client(), args.rtt)
+    questions = [f"What does NIST require for {topic} ({i})?" for i, topic in enumerate(fakes.TOPICS * 4)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        await export_snapshot(engine, directory, args.engine_dtype)
+        for question in questions:  # Embeddings cached: only the search is timed
+            await engine.get_embeddings().aembed_query(question)
+
+        print(
+            f"\nEngine: {args.chunks} chunks, {args.engine_dtype} snapshot, simulated Qdrant round trip "
+            f"{args.rtt * 1000:.0f} ms, {len(questions)} queries\n"
+        )
+        print("| LOCAL_SNAPSHOT | aretrieve_documents p50 / p95 ms | Qdrant requests / query |")
+        print("| :--- | :--- | :--- |")
+        for enabled in (False, True):
+            engine.LOCAL_SNAPSHOT = enabled
+            await engine.aget_index_version()
+            before = counter_total("auditai_qdrant_latency_seconds_count")
+            latencies = []
+            for question in questions:
+                started = time.perf_counter()
+                await engine.aretrieve_documents(question)
+                latencies.append((time.perf_counter() - started) * 1000)
+            requests = counter_total("auditai_qdrant_latency_seconds_count") - before
+            p50, p95 = summarize(latencies)
+            print(f"| {'on' if enabled else 'off'} | {p50:.2f} / {p95:.2f} | {requests / len(questions):.2f} |")
+
+        network.down = True
+        print(f"\nQdrant down: {args.outage_requests} /chat requests\n")
+        print("| LOCAL_SNAPSHOT | Answered with sources | Failed |")
+        print("| :--- | :--- | :--- |")
+        for enabled in (False, True):
+            engine.LOCAL_SNAPSHOT = enabled
+            answered = failed = 0
+            for i in range(args.outage_requests):
+                result = await send_request(
+                    api.app, f"outage-{enabled}-{i}", f"What does NIST say about {fakes.TOPICS[i % len(fakes.TOPICS)]} (outage {i})?"
+                )
+                lines = [json.loads(line) for line in result["body"].decode("utf-8").splitlines() if line]
+                sources = next((line["content"] for line in lines if line["type"] == "sources"), [])
+                if result["status"] == 200 and not result["failed"] and sources:
+                    answered += 1
+                else:
+                    failed += 1
+            print(f"| {'on' if enabled else 'off'} | {answered} | {failed} |")
+        network.down = False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=str, default="500,2000,5000", help="Corpus sizes for the search table.")
+    parser.add_argument("--dim", type=int, default=3072, help="gemini-embedding-001 returns 3072 dims.")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--url", type=str, default=None, help="A real Qdrant server for the search table.")
+    parser.add_argument("--server", action="store_true", help="Use QDRANT_URL as --url.")
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks in the engine's in-memory collection.")
+    parser.add_argument("--engine-dtype", type=str, default="int8")
+    parser.add_argument("--rtt", type=float, default=0.03, help="Simulated Qdrant round trip, seconds.")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--outage-requests", type=int, default=10)
+    args = parser.parse_args()
+    if args.server:
+        args.url = os.getenv("QDRANT_URL")
+
+    await run_search(args)
+    await run_engine(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
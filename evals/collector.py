@@ -10,8 +10,11 @@ sys.path.append(os.path.join(PROJECT_ROOT, "src"))
 import csv
 import json
 import time
-import pandas as pd
-from audit_ai.engine import process_query
+import asyncio
+import argparse
+import hashlib
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from audit_ai import config, engine
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -37,40 +40,136 @@ def load_test_csv(file_path):
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 TEST_FILE = os.path.join(CURRENT_DIR, "test.csv")
 RESULTS_FILE = os.path.join(CURRENT_DIR, "rag_results.json")
-
-
-def collect_answers():
+# One line per finished question, appended as soon as it completes
+CHECKPOINT_FILE = os.path.join(CURRENT_DIR, "rag_results.jsonl")
+
+COLLECT_CONCURRENCY = int(os.getenv("COLLECT_CONCURRENCY", "4"))
+# Token bucket shared by every LLM call the engine makes (router, grader, rewrite, generation)
+COLLECT_LLM_RPS = float(os.getenv("COLLECT_LLM_RPS", "2"))
+# A checkpointed answer is reused only under the same settings: every upper-case value in
+# audit_ai.config, except credentials, machine-specific paths and the judge model
+UNFINGERPRINTED_SUFFIXES = ("_API_KEY", "_URL", "_PATH", "_DIR", "_FILE")
+
+
+def pipeline_config():
+    """The settings as the engine sees them (a value overridden on the engine module wins)."""
+    return {
+        name: getattr(engine, name, value)
+        for name, value in sorted(vars(config).items())
+        if name.isupper() and not name.endswith(UNFINGERPRINTED_SUFFIXES) and name != "EVAL_JUDGE_MODEL"
+    }
+
+
+def question_key(question, config):
+    fingerprint = json.dumps(config, sort_keys=True)
+    return hashlib.sha256(f"{question.strip()}\n{fingerprint}".encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(path):
+    """Latest checkpointed answer per question key."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A crash can leave a torn last line
+            done[record["key"]] = record
+    return done
+
+
+async def collect_answers(concurrency=COLLECT_CONCURRENCY, llm_rps=COLLECT_LLM_RPS, fresh=False, output=None):
+    output = output or RESULTS_FILE
     test_questions = load_test_csv(TEST_FILE)
-    collected_data = []
-
-    print(f"🚀 Starting collection for {len(test_questions)} questions...")
-
-    for i, item in enumerate(test_questions):
-        print(f"[{i+1}/50] Processing: {item['question'][:50]}...")
-
-        # Run your actual RAG system
-        response = process_query(item["question"])
-
-        collected_data.append(
-            {
+    index_version = await engine.aget_index_version()
+    config = pipeline_config()
+
+    if fresh and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+    checkpoint = load_checkpoint(CHECKPOINT_FILE)
+
+    # Answers are reused only if they were collected against the same index (the key covers the config)
+    def is_current(record):
+        return record is not None and record.get("index_version") == index_version
+
+    pending = [item for item in test_questions if not is_current(checkpoint.get(question_key(item["question"], config)))]
+    print(
+        f"🚀 Collecting {len(pending)} of {len(test_questions)} questions "
+        f"({len(test_questions) - len(pending)} reused, index version {index_version}, "
+        f"concurrency {concurrency}, {llm_rps} LLM calls/s)..."
+    )
+
+    engine.llm.rate_limiter = InMemoryRateLimiter(
+        requests_per_second=llm_rps, check_every_n_seconds=0.05, max_bucket_size=max(1, concurrency)
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = {"ok": 0, "failed": 0}
+    started = time.perf_counter()
+
+    with open(CHECKPOINT_FILE, "a", encoding="utf-8") as checkpoint_file:
+
+        async def collect_one(item):
+            async with semaphore:
+                try:
+                    # Every question runs the pipeline: a cache hit would return another question's answer
+                    response = await engine.aprocess_query(item["question"], use_cache=False)
+                except Exception as e:
+                    # A 429 or timeout fails this question only, not the whole run
+                    print(f"   ⚠️ {type(e).__name__}: {e}")
+                    response = {"error": True}
+            if response.get("error"):
+                finished["failed"] += 1
+                print(f"   ✗ {item['question'][:50]}... (will be retried on the next run)")
+                return
+
+            record = {
+                "key": question_key(item["question"], config),
+                "index_version": index_version,
+                "config": config,
                 "question": item["question"],
                 "answer": str(response.get("answer", "")),
-                "contexts": [
-                    str(doc.page_content) for doc in response.get("context", [])
-                ],
+                "contexts": [str(doc.page_content) for doc in response.get("context", [])],
                 "ground_truth": item["ground_truth"],
             }
-        )
+            checkpoint_file.write(json.dumps(record) + "\n")
+            checkpoint_file.flush()
+            checkpoint[record["key"]] = record
+            finished["ok"] += 1
+            done = finished["ok"] + finished["failed"]
+            print(f"[{done}/{len(pending)}] {item['question'][:50]}... ({time.perf_counter() - started:.0f}s)")
 
-        # Prevent hitting Groq/Gemini rate limits during collection
-        time.sleep(1)
+        await asyncio.gather(*(collect_one(item) for item in pending))
 
-    # Save to a local file
-    with open(RESULTS_FILE, "w") as f:
+    # The evaluator reads the merged, ordered dataset
+    collected_data = []
+    for item in test_questions:
+        record = checkpoint.get(question_key(item["question"], config))
+        if is_current(record):
+            collected_data.append(
+                {
+                    "question": record["question"],
+                    "answer": record["answer"],
+                    "contexts": record["contexts"],
+                    "ground_truth": item["ground_truth"],
+                }
+            )
+
+    with open(output, "w") as f:
         json.dump(collected_data, f, indent=4)
 
-    print("✅ Collection complete! Data saved to 'rag_results.json'")
+    print(
+        f"✅ Collection complete! {len(collected_data)}/{len(test_questions)} answers saved to '{os.path.relpath(output)}' "
+        f"({finished['failed']} failed)."
+    )
 
 
 if __name__ == "__main__":
-    collect_answers()
+    parser = argparse.ArgumentParser(description="Collect RAG answers for the eval dataset (resumable).")
+    parser.add_argument("--concurrency", type=int, default=COLLECT_CONCURRENCY, help="Questions in flight at once.")
+    parser.add_argument("--llm-rps", type=float, default=COLLECT_LLM_RPS, help="Token-bucket rate for LLM calls.")
+    parser.add_argument("--fresh", action="store_true", help="Discard the checkpoint and collect everything again.")
+    parser.add_argument("--output", default=RESULTS_FILE, help="Where to write the dataset (default: evals/rag_results.json).")
+    args = parser.parse_args()
+    asyncio.run(collect_answers(args.concurrency, args.llm_rps, args.fresh, args.output))
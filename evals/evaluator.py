@@ -8,6 +8,9 @@ PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
 sys.path.append(os.path.join(PROJECT_ROOT, "src"))
 
 import json
+import hashlib
+import argparse
+from collections import defaultdict
 import pandas as pd
 from datasets import Dataset
 from ragas import evaluate
@@ -18,8 +21,10 @@ from ragas.metrics import (
     ContextPrecision,
     ContextRecall,
 )
-from audit_ai.config import EVAL_JUDGE_MODEL, GOOGLE_API_KEY, EMBEDDING_MODEL
+from audit_ai.config import EVAL_JUDGE_MODEL, GOOGLE_API_KEY, EMBEDDING_MODEL, EMBEDDING_CACHE_PATH
+from audit_ai.cache import CachedEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from dotenv import load_dotenv
 import numpy as np
 import warnings
@@ -35,13 +40,19 @@ load_dotenv()
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 RESULTS_FILE = os.path.join(CURRENT_DIR, "rag_results.json")
 REPORT_FILE = os.path.join(CURRENT_DIR, "ragas_report.md")
+EMBEDDING_CACHE_FILE = EMBEDDING_CACHE_PATH or os.path.join(CURRENT_DIR, ".embedding_cache.sqlite")
+# Append-only store of judge scores, one line per (row, metric)
+SCORES_FILE = os.path.join(CURRENT_DIR, "ragas_scores.jsonl")
 
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "8"))
+EVAL_JUDGE_RPS = float(os.getenv("EVAL_JUDGE_RPS", "2"))
 
-def generate_markdown_report(df, averages):
+
+def generate_markdown_report(df, averages, report_file=REPORT_FILE):
     """
     Creates a professional-grade Markdown report of the evaluation.
     """
-    with open(REPORT_FILE, "w") as f:
+    with open(report_file, "w") as f:
         f.write("# 📊 AuditAI: RAG Evaluation Report\n\n")
         f.write("Generated on: " + pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S") + "\n\n")
         
@@ -81,70 +92,124 @@ def generate_markdown_report(df, averages):
                     f.write(f"- {m.replace('_', ' ').title()}: {val_str}\n")
             f.write("\n---\n\n")
 
-    print(f"✅ Complete report generated: '{REPORT_FILE}'")
+    print(f"✅ Complete report generated: '{report_file}'")
 
 
-def run_ragas_eval():
+def row_key(entry):
+    """Identifies a dataset row by everything the judges look at."""
+    payload = json.dumps(
+        [entry["question"], entry["answer"], entry["contexts"], entry["ground_truth"]], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_score_store(path):
+    """{(row_key, metric): score} for scores produced by the current judge model."""
+    scores = {}
+    if not os.path.exists(path):
+        return scores
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A crash can leave a torn last line
+            if record.get("judge") == EVAL_JUDGE_MODEL:
+                scores[(record["key"], record["metric"])] = record["score"]
+    return scores
+
+
+def run_ragas_eval(results_file=RESULTS_FILE, report_file=REPORT_FILE, workers=EVAL_WORKERS, judge_rps=EVAL_JUDGE_RPS):
     # 1. Load Data (Generated by collector.py)
-    if not os.path.exists(RESULTS_FILE):
-        print(f"❌ Error: '{RESULTS_FILE}' not found.")
+    if not os.path.exists(results_file):
+        print(f"❌ Error: '{results_file}' not found.")
         print("   Please run 'python evals/collector.py' first to generate the dataset.")
         return
 
-    with open(RESULTS_FILE, "r") as f:
+    with open(results_file, "r") as f:
         raw_data = json.load(f)
 
-    print(f"📂 Loaded {len(raw_data)} records from {RESULTS_FILE}")
+    print(f"📂 Loaded {len(raw_data)} records from {results_file}")
 
-    # ⚠️ LIMIT DATASET TO SAVE TOKENS (Rate Limit Protection)
-    raw_data = raw_data[:10]
-    print(f"⚠️  Running on {len(raw_data)} records...")
+    metrics = [Faithfulness(), AnswerRelevancy(), ContextPrecision(), ContextRecall()]
+    keys = [row_key(e) for e in raw_data]
+    store = load_score_store(SCORES_FILE)
 
-    # 2. Prepare Dataset for RAGAS
-    dataset = Dataset.from_dict({
-        "question": [e["question"] for e in raw_data],
-        "answer": [e["answer"] for e in raw_data],
-        "contexts": [e["contexts"] for e in raw_data],
-        "ground_truth": [e["ground_truth"] for e in raw_data],
-    })
+    # 2. Only rows whose content changed (or whose scores failed before) are judged again
+    pending = defaultdict(list)  # Missing metric names -> row indices
+    for i, key in enumerate(keys):
+        missing = tuple(m.name for m in metrics if (key, m.name) not in store)
+        if missing:
+            pending[missing].append(i)
+    n_pending = sum(len(rows) for rows in pending.values())
+    print(f"♻️  {len(raw_data) - n_pending} rows fully scored already, {n_pending} to judge.")
 
     # 3. Configure Judge Models from config
+    # The token bucket caps judge calls across all parallel workers
     judge_llm = ChatGoogleGenerativeAI(
         model=EVAL_JUDGE_MODEL,
         temperature=0,
         google_api_key=GOOGLE_API_KEY,
+        rate_limiter=InMemoryRateLimiter(
+            requests_per_second=judge_rps, check_every_n_seconds=0.05, max_bucket_size=max(1, workers)
+        ),
     )
 
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model=EMBEDDING_MODEL,
-        google_api_key=GOOGLE_API_KEY,
+    # Disk-backed, so re-running the eval does not re-embed the same answers and questions
+    embeddings = CachedEmbeddings(
+        GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=GOOGLE_API_KEY),
+        model_name=EMBEDDING_MODEL,
+        disk_path=EMBEDDING_CACHE_FILE,
     )
 
-    # 4. Run Evaluation
-    print(f"🚀 Starting RAGAS Evaluation using {EVAL_JUDGE_MODEL}...")
-    results = evaluate(
-        dataset=dataset,
-        metrics=[
-            Faithfulness(),
-            AnswerRelevancy(),
-            ContextPrecision(),
-            ContextRecall(),
-        ],
-        llm=judge_llm,
-        embeddings=embeddings,
-        raise_exceptions=False,
-        run_config=RunConfig(max_workers=1),
-    )
+    # 4. Run Evaluation in batches, appending every score to the store as soon as its batch finishes
+    print(f"🚀 Starting RAGAS Evaluation using {EVAL_JUDGE_MODEL} ({workers} workers, {judge_rps} judge calls/s)...")
+    batch_size = max(1, workers)
+    with open(SCORES_FILE, "a", encoding="utf-8") as store_file:
+        for missing, rows in pending.items():
+            batch_metrics = [m for m in metrics if m.name in missing]
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                dataset = Dataset.from_dict({
+                    "question": [raw_data[i]["question"] for i in batch],
+                    "answer": [raw_data[i]["answer"] for i in batch],
+                    "contexts": [raw_data[i]["contexts"] for i in batch],
+                    "ground_truth": [raw_data[i]["ground_truth"] for i in batch],
+                })
+                results = evaluate(
+                    dataset=dataset,
+                    metrics=batch_metrics,
+                    llm=judge_llm,
+                    embeddings=embeddings,
+                    raise_exceptions=False,
+                    run_config=RunConfig(max_workers=workers),
+                    show_progress=False,
+                )
+                batch_df = results.to_pandas()
+                for position, i in enumerate(batch):
+                    for metric in batch_metrics:
+                        score = batch_df.iloc[position].get(metric.name)
+                        if score is None or np.isnan(score):
+                            continue  # Failed judge calls are retried on the next run
+                        store[(keys[i], metric.name)] = float(score)
+                        store_file.write(json.dumps({
+                            "key": keys[i],
+                            "metric": metric.name,
+                            "judge": EVAL_JUDGE_MODEL,
+                            "score": float(score),
+                        }) + "\n")
+                store_file.flush()
+                print(f"   ✔ {min(start + batch_size, len(rows))}/{len(rows)} rows scored for {', '.join(missing)}")
+
+    # 5. Generate Reports from the merged store
+    df = pd.DataFrame({
+        "question": [e["question"] for e in raw_data],
+        "answer": [e["answer"] for e in raw_data],
+        "ground_truth": [e["ground_truth"] for e in raw_data],
+    })
+    for metric in metrics:
+        df[metric.name] = [store.get((key, metric.name), np.nan) for key in keys]
 
-    # 5. Generate Reports
-    df = results.to_pandas()
-    df_input = dataset.to_pandas()
-    
-    # CRITICAL: Re-attach input columns if RAGAS stripped them (Fixes KeyError: 'question')
-    for col in ["question", "answer", "ground_truth"]:
-        if col not in df.columns and col in df_input.columns:
-            df[col] = df_input[col]
-    
     # Calculate absolute averages from the dataframe (safest method)
     numeric_df = df.select_dtypes(include=[np.number])
     averages = numeric_df.mean().to_dict()
@@ -153,11 +218,23 @@ def run_ragas_eval():
     for k, v in averages.items():
         print(f"{k}: {v:.4f}")
 
+    cache_stats = embeddings.stats()
+    print(
+        f"🧠 Embedding cache: {cache_stats['hit_ratio']:.0%} hit ratio, "
+        f"~{cache_stats['latency_saved_ms'] / 1000:.1f}s of embedding latency saved"
+    )
+
     df.to_csv("ragas_results.csv", index=False)
     
     # NEW: Generate the Markdown Report
-    generate_markdown_report(df, averages)
+    generate_markdown_report(df, averages, report_file)
 
 
 if __name__ == "__main__":
-    run_ragas_eval()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Score collected RAG results with RAGAS.")
+    parser.add_argument("--results", default=RESULTS_FILE, help="Collector-format JSON file (default: evals/rag_results.json).")
+    parser.add_argument("--report", default=REPORT_FILE, help="Markdown report to write (default: evals/ragas_report.md).")
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS, help="Parallel RAGAS jobs.")
+    parser.add_argument("--judge-rps", type=float, default=EVAL_JUDGE_RPS, help="Token-bucket rate for judge LLM calls.")
+    args = parser.parse_args()
+    run_ragas_eval(args.results, args.report, args.workers, args.judge_rps)
\ No newline at end of file
@@ -0,0 +1,387 @@
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from audit_ai.limits import UpstreamLimiter, limiter_context
+
+# Key under which ingestion stamps the collection metadata with a fresh version
+# every time it rewrites the index. Anything cached against an older version is stale.
+INDEX_VERSION_KEY = "index_version"
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    documents: List[Document]
+    embedding: np.ndarray
+    created_at: float
+    size_bytes: int
+    hits: int = 0
+    similarity: float = 0.0  # Similarity of the lookup that last hit this entry
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by query-embedding similarity.
+
+    A lookup returns the most similar cached query if its cosine similarity is
+    at least `threshold`. Entries are evicted LRU-first when the cache holds more
+    than `max_entries` or more than `max_bytes`, and expire after `ttl_seconds`.
+    The whole cache is dropped when the index version changes.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl_seconds: float, max_bytes: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        self._bytes = 0
+        self._index_version: Optional[str] = None
+        # Stacked, normalized embeddings of all entries (rebuilt lazily after writes)
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # --- Lookup / Store ---
+
+    def lookup(self, embedding: List[float], index_version: Optional[str] = None) -> Optional[CachedAnswer]:
+        self._check_version(index_version)
+        self._expire()
+
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        query = self._normalize(embedding)
+        matrix, keys = self._stacked()
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        key = keys[best]
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        entry.similarity = similarity
+        self.hits += 1
+        return entry
+
+    def store(
+        self,
+        query: str,
+        embedding: List[float],
+        answer: str,
+        documents: List[Document],
+        index_version: Optional[str] = None,
+    ) -> None:
+        self._check_version(index_version)
+
+        vector = self._normalize(embedding)
+        size = vector.nbytes + len(query) + len(answer) + sum(
+            len(doc.page_content) + len(str(doc.metadata)) for doc in documents
+        )
+        if size > self.max_bytes:
+            return
+
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = CachedAnswer(
+            query=query,
+            answer=answer,
+            documents=documents,
+            embedding=vector,
+            created_at=time.monotonic(),
+            size_bytes=size,
+        )
+        self._bytes += size
+        self._matrix = None
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict_oldest()
+
+    # --- Invalidation ---
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._matrix = None
+        self.invalidations += 1
+
+    def _check_version(self, index_version: Optional[str]) -> None:
+        if index_version is None or index_version == self._index_version:
+            return
+        if self._index_version is not None:
+            print(f"🗑️  Index version changed ({self._index_version} -> {index_version}), clearing answer cache.")
+            self.invalidate()
+        self._index_version = index_version
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        # Insertion order is refreshed on hits, so scan everything rather than stopping early
+        expired = [key for key, entry in self._entries.items() if entry.created_at < cutoff]
+        for key in expired:
+            self._remove(key)
+            self.evictions += 1
+
+    def _evict_oldest(self) -> None:
+        key = next(iter(self._entries))
+        self._remove(key)
+        self.evictions += 1
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size_bytes
+        self._matrix = None
+
+    # --- Helpers ---
+
+    def _stacked(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.vstack([self._entries[k].embedding for k in self._matrix_keys])
+        return self._matrix, self._matrix_keys
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "index_version": self._index_version,
+        }
+
+
+# Cache-key tasks: a text embedded as a query and as a document yields different vectors
+TASK_QUERY = "query"
+TASK_DOCUMENT = "document"
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with a bounded in-process LRU and an optional SQLite tier.
+
+    Keys are `sha256(model + task + normalized text)`, so the same question (or an
+    identical rewrite) is only embedded once per process, and once overall
+    when `disk_path` is set. Query and document embeddings of one text are
+    different vectors (Gemini's RETRIEVAL_QUERY vs RETRIEVAL_DOCUMENT), so the
+    task is part of the key. Concurrent `aembed_query` calls for one key share a
+    single model call. Only cache misses reach the wrapped model; each such
+    call is reported to `observer(texts, seconds)` if one is given, and async calls
+    hold a slot of `limiter` if one is given. `query_task_type` is passed to the wrapped
+    model when many queries are embedded in one call (Gemini: "RETRIEVAL_QUERY").
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 4096,
+        disk_path: Optional[str] = None,
+        observer: Optional[Callable[[int, float], None]] = None,
+        limiter: Optional[UpstreamLimiter] = None,
+        query_task_type: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.observer = observer
+        self.limiter = limiter
+        self.query_task_type = query_task_type
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}  # Key -> the model call every caller awaits
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            # 'embeddings' (without the task) mixed query and document vectors and is no longer read
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS task_embeddings (key TEXT PRIMARY KEY, task TEXT NOT NULL, vector BLOB)"
+            )
+            self._disk.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.in_flight_hits = 0  # Callers that joined another caller's model call
+        self.misses = 0
+        self.miss_seconds = 0.0  # Time spent in the wrapped model (per text, summed)
+
+    # --- Keys & Tiers ---
+
+    def _key(self, text: str, task: str) -> str:
+        normalized = re.sub(r"\s+", " ", text).strip().casefold()
+        return hashlib.sha256(f"{self.model_name}\n{task}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+
+        if self._disk is not None:
+            with self._disk_lock:
+                row = self._disk.execute("SELECT vector FROM task_embeddings WHERE key = ?", (key,)).fetchone()
+            if row:
+                vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+        return None
+
+    def _put(self, key: str, task: str, vector: List[float]) -> None:
+        self._remember(key, vector)
+        if self._disk is not None:
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO task_embeddings (key, task, vector) VALUES (?, ?, ?)", (key, task, blob)
+                )
+                self._disk.commit()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _split(self, texts: List[str], task: str):
+        """Returns cached vectors (None for misses) plus the unique missing texts by key."""
+        keys = [self._key(t, task) for t in texts]
+        vectors = [self._get(k) for k in keys]
+        missing: "OrderedDict[str, str]" = OrderedDict()
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        return keys, vectors, missing
+
+    def _fill(self, keys, vectors, missing, computed, elapsed: float, task: str) -> List[List[float]]:
+        self.misses += len(missing)
+        self.miss_seconds += elapsed
+        if missing and self.observer:
+            self.observer(len(missing), elapsed)
+        fresh = dict(zip(missing.keys(), computed))
+        for key, vector in fresh.items():
+            self._put(key, task, vector)
+        return [v if v is not None else fresh[k] for k, v in zip(keys, vectors)]
+
+    # --- Embeddings Interface ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._split(texts, TASK_DOCUMENT)
+        computed, elapsed = [], 0.0
+        if missing:
+            started = time.perf_counter()
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            elapsed = time.perf_counter() - started
+        return self._fill(keys, vectors, missing, computed, elapsed, TASK_DOCUMENT)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._split(texts, TASK_DOCUMENT)
+        computed, elapsed = [], 0.0
+        if missing:
+            async with limiter_context(self.limiter):
+                started = time.perf_counter()
+                computed = await self.embeddings.aembed_documents(list(missing.values()))
+                elapsed = time.perf_counter() - started
+        return self._fill(keys, vectors, missing, computed, elapsed, TASK_DOCUMENT)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Query embeddings for many texts in a single model call (misses only). They are
+        cached like `aembed_query` results, so later lookups of the same texts are free.
+        """
+        keys, vectors, missing = self._split(texts, TASK_QUERY)
+        computed, elapsed = [], 0.0
+        if missing:
+            kwargs = {"task_type": self.query_task_type} if self.query_task_type else {}
+            async with limiter_context(self.limiter):
+                started = time.perf_counter()
+                computed = await self.embeddings.aembed_documents(list(missing.values()), **kwargs)
+                elapsed = time.perf_counter() - started
+        return self._fill(keys, vectors, missing, computed, elapsed, TASK_QUERY)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text, TASK_QUERY)
+        vector = self._get(key)
+        if vector is not None:
+            return vector
+        started = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        return self._fill([key], [None], {key: text}, [vector], time.perf_counter() - started, TASK_QUERY)[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text, TASK_QUERY)
+        vector = self._get(key)
+        if vector is not None:
+            return vector
+        # E.g. speculative retrieval and the router embed the same question at the same time
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._aembed_query_miss(key, text))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._settle(key, done))
+        else:
+            self.in_flight_hits += 1
+        # Shielded: a caller that is cancelled does not cancel the call the others wait for
+        return await asyncio.shield(task)
+
+    def _settle(self, key: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved here, so a failure nobody awaited any more is not logged as lost
+
+    async def _aembed_query_miss(self, key: str, text: str) -> List[float]:
+        async with limiter_context(self.limiter):
+            started = time.perf_counter()
+            vector = await self.embeddings.aembed_query(text)
+            elapsed = time.perf_counter() - started
+        return self._fill([key], [None], {key: text}, [vector], elapsed, TASK_QUERY)[0]
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits + self.in_flight_hits
+        lookups = hits + self.misses
+        avg_miss_ms = self.miss_seconds * 1000 / self.misses if self.misses else 0.0
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "in_flight_hits": self.in_flight_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+            "avg_miss_latency_ms": avg_miss_ms,
+            # Every hit would otherwise have cost one (average) embedding call
+            "latency_saved_ms": hits * avg_miss_ms,
+        }
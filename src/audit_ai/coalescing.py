@@ -0,0 +1,172 @@
+import re
+import json
+import asyncio
+import hashlib
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from audit_ai import metrics
+
+_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Case, repeated whitespace and trailing punctuation do not make a different question."""
+    return _PUNCTUATION.sub("", " ".join(query.casefold().split()))
+
+
+def request_key(
+    query: str,
+    source_files: Optional[List[str]] = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    session_id: Optional[str] = None,
+) -> str:
+    """
+    Requests only share a run if they would get the same answer: same question, document
+    filter and conversation so far. A session's follow-ups also update that session's documents.
+    """
+    conversation = hashlib.sha256(json.dumps(history or [], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return "|".join([normalize_query(query), ",".join(sorted(source_files or [])), session_id or "", conversation])
+
+
+class _Flight:
+    """One pipeline run and everything it has streamed so far."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0  # Currently attached
+        self.joined = 0       # Ever attached
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class Subscription:
+    """One request's attachment to a flight. `SingleFlight.leave` detaches it (once)."""
+
+    def __init__(self, key: str, flight: _Flight, leader: bool):
+        self.key = key
+        self.flight = flight
+        self.leader = leader
+        self.active = True
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests onto one producer.
+
+    The first request for a key (the leader) starts the producer in a task;
+    requests for the same key arriving while it runs (followers) attach to it.
+    `join` and `start` decide and attach in one step (no await in between), so a
+    flight cannot finish between "is it running?" and attaching to it.
+    Every subscriber first receives the lines already streamed, then each new
+    line as it is produced. The producer is cancelled once every subscriber has
+    gone. Finished flights are forgotten: a later request starts a new run.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.cancelled = 0
+
+    async def _produce(self, key: str, flight: _Flight, producer: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for line in producer():
+                async with flight.changed:
+                    flight.lines.append(line)
+                    flight.changed.notify_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            metrics.FLIGHT_SUBSCRIBERS.observe(flight.joined)
+            flight.done = True
+            async with flight.changed:
+                flight.changed.notify_all()
+
+    @staticmethod
+    def _attach(key: str, flight: _Flight, leader: bool) -> Subscription:
+        flight.subscribers += 1
+        flight.joined += 1
+        return Subscription(key, flight, leader)
+
+    def join(self, key: str) -> Optional[Subscription]:
+        """Attaches to the run in flight for `key`, if there is one."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        self.followers += 1
+        metrics.COALESCED_REQUESTS.labels("follower").inc()
+        print(f"---COALESCED: joined an in-flight run ({len(flight.lines)} lines buffered)---")
+        return self._attach(key, flight, leader=False)
+
+    def start(
+        self,
+        key: str,
+        producer: Callable[[], AsyncIterator[str]],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> Subscription:
+        """
+        Starts a run for `key` and attaches to it. `on_done` is called when the run
+        ends (finished, failed or cancelled), however many subscribers are left.
+        """
+        flight = self._flights[key] = _Flight()
+        flight.task = asyncio.create_task(self._produce(key, flight, producer))
+        if on_done is not None:
+            flight.task.add_done_callback(lambda _: on_done())
+        self.leaders += 1
+        metrics.COALESCED_REQUESTS.labels("leader").inc()
+        return self._attach(key, flight, leader=True)
+
+    def leave(self, subscription: Subscription) -> None:
+        """Detaches a subscriber; the last one to leave cancels an unfinished run."""
+        if not subscription.active:
+            return
+        subscription.active = False
+        flight = subscription.flight
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            # Every client disconnected: stop spending LLM calls on the answer
+            self.cancelled += 1
+            if self._flights.get(subscription.key) is flight:
+                del self._flights[subscription.key]
+            flight.task.cancel()
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[str]:
+        """The flight's lines, from the first one, then `leave` however the stream ends."""
+        flight = subscription.flight
+        sent = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: flight.done or len(flight.lines) > sent)
+                    pending = flight.lines[sent:]
+                for line in pending:
+                    yield line
+                sent += len(pending)
+                if flight.done and sent == len(flight.lines):
+                    break
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            self.leave(subscription)
+
+    async def subscribe(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Joins the run for `key`, or starts one, and streams it."""
+        subscription = self.join(key) or self.start(key, producer)
+        async for line in self.stream(subscription):
+            yield line
+
+    def stats(self) -> Dict[str, float]:
+        total = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_ratio": self.followers / total if total else 0.0,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._flights),
+        }
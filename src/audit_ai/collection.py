@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from qdrant_client import AsyncQdrantClient, models
+
+# Payload fields that searches filter on. Without an index Qdrant has to check
+# the payload of every candidate, which also degrades filtered HNSW search.
+PAYLOAD_INDEXES: Dict[str, models.PayloadSchemaType] = {
+    "metadata.source_file": models.PayloadSchemaType.KEYWORD,
+    "metadata.page": models.PayloadSchemaType.INTEGER,
+}
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    How the collection is indexed (applied by ingestion) and searched (used by the engine).
+
+    Quantized profiles keep compressed vectors in RAM for the HNSW walk, fetch
+    `oversampling` times more candidates and rescore them with the original vectors.
+    """
+
+    name: str
+    quantization: str = "none"       # 'none' | 'scalar' (int8) | 'binary'
+    hnsw_m: int = 16                  # Graph degree: recall and memory go up with it
+    hnsw_ef_construct: int = 100      # Build-time beam width
+    hnsw_ef: Optional[int] = None     # Search-time beam width (None: Qdrant's default)
+    rescore: bool = True
+    oversampling: float = 1.0
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self) -> models.SearchParams:
+        quantization = None
+        if self.quantization != "none":
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+
+PROFILES: Dict[str, CollectionProfile] = {
+    # Full-precision vectors, Qdrant's default graph
+    "default": CollectionProfile("default"),
+    # Denser graph and a wider search beam: best recall, most memory and latency
+    "accurate": CollectionProfile("accurate", hnsw_m=32, hnsw_ef_construct=256, hnsw_ef=128),
+    # int8 vectors (4x smaller), rescored with the originals
+    "scalar": CollectionProfile("scalar", quantization="scalar", hnsw_ef=64, oversampling=2.0),
+    # 1 bit per dimension (32x smaller); works best with high-dimensional embeddings such as Gemini's
+    "binary": CollectionProfile("binary", quantization="binary", hnsw_ef=64, oversampling=3.0),
+}
+
+
+def get_profile(name: str) -> CollectionProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown collection profile '{name}' (choose from {', '.join(PROFILES)})") from None
+
+
+def _quantization_name(config) -> str:
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return "none" if config is None else "other"
+
+
+async def create_collection(client: AsyncQdrantClient, collection_name: str, dimension: int, profile: CollectionProfile) -> None:
+    await client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+    )
+    await ensure_payload_indexes(client, collection_name)
+
+
+async def apply_profile(client: AsyncQdrantClient, collection_name: str, profile: CollectionProfile) -> bool:
+    """
+    Brings an existing collection in line with `profile`. Qdrant rebuilds the index in
+    the background and keeps serving searches meanwhile. Returns True if anything changed.
+    """
+    info = await client.get_collection(collection_name)
+    hnsw = info.config.hnsw_config
+    changed = await ensure_payload_indexes(client, collection_name, existing=info.payload_schema)
+    if (hnsw.m, hnsw.ef_construct) != (profile.hnsw_m, profile.hnsw_ef_construct):
+        await client.update_collection(collection_name=collection_name, hnsw_config=profile.hnsw_config())
+        changed = True
+    if _quantization_name(info.config.quantization_config) != profile.quantization:
+        await client.update_collection(
+            collection_name=collection_name,
+            quantization_config=profile.quantization_config() or models.Disabled.DISABLED,
+        )
+        changed = True
+    return changed
+
+
+async def ensure_payload_indexes(client: AsyncQdrantClient, collection_name: str, existing: Optional[Dict] = None) -> bool:
+    if existing is None:
+        existing = (await client.get_collection(collection_name)).payload_schema
+    missing = [field for field in PAYLOAD_INDEXES if field not in (existing or {})]
+    for field in missing:
+        await client.create_payload_index(
+            collection_name=collection_name, field_name=field, field_schema=PAYLOAD_INDEXES[field], wait=True
+        )
+    return bool(missing)
+
+
+def search_filter(exclude_ids: Optional[List[str]] = None, source_files: Optional[List[str]] = None) -> Optional[models.Filter]:
+    """Restricts a search to some source documents and/or skips some chunks."""
+    must = []
+    must_not = []
+    if source_files:
+        must.append(models.FieldCondition(key="metadata.source_file", match=models.MatchAny(any=list(source_files))))
+    if exclude_ids:
+        must_not.append(models.HasIdCondition(has_id=list(exclude_ids)))
+    if not must and not must_not:
+        return None
+    return models.Filter(must=must or None, must_not=must_not or None)
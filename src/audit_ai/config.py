@@ -4,7 +4,6 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # --- API Keys ---
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
@@ -14,10 +13,144 @@ EMBEDDING_MODEL = "models/gemini-embedding-001"
 LLM_MODEL = "gemini-2.0-flash-lite"
 EVAL_JUDGE_MODEL = "gemini-2.5-flash-lite"
 COLLECTION_NAME = "compliance_audit"
+# How the collection is indexed and searched: 'default', 'accurate', 'scalar' or 'binary'
+# (see audit_ai/collection.py). Ingestion applies it, the engine searches with it.
+COLLECTION_PROFILE = os.getenv("COLLECTION_PROFILE", "default")
+# Talk to Qdrant over gRPC (port 6334) instead of REST
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+
+# --- Retrieval Configs ---
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "10"))
+# Fuse dense results with the local BM25 index (built by ingestion) via reciprocal rank fusion
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Adaptive k: keep chunks scoring within RETRIEVAL_SCORE_MARGIN of the top hit (at least RETRIEVAL_MIN_K).
+# Off by default (every search keeps RETRIEVAL_K): the margin is uncalibrated, like the score gate's thresholds.
+ADAPTIVE_K = os.getenv("ADAPTIVE_K", "false").lower() == "true"
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", "3"))
+RETRIEVAL_SCORE_MARGIN = float(os.getenv("RETRIEVAL_SCORE_MARGIN", "0.1"))
+
+# --- Control-ID Lookup ---
+# Questions naming CSF control IDs ("PR.AA-05", "GV.RM") are answered from the chunks the
+# control-ID index (built by ingestion) maps them to: no embedding, no vector search, no grader
+CONTROL_ID_LOOKUP = os.getenv("CONTROL_ID_LOOKUP", "true").lower() == "true"
+CONTROL_LOOKUP_MAX_CHUNKS = int(os.getenv("CONTROL_LOOKUP_MAX_CHUNKS", "5"))
+
+# --- Local Vector Snapshot ---
+# With LOCAL_SNAPSHOT on, ingestion exports the collection's vectors and payloads to SNAPSHOT_DIR as a
+# memory-mapped matrix ('int8', 'float16' or 'float32', see audit_ai/snapshot.py), and dense
+# search runs in-process on it while its index version matches the live collection's. It goes
+# to Qdrant otherwise (no snapshot, stale snapshot or a local error).
+LOCAL_SNAPSHOT = os.getenv("LOCAL_SNAPSHOT", "false").lower() == "true"
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "int8")
+
+# --- Score Gate ---
+# Top cosine score >= ACCEPT: generate without grading. Every score < REJECT: rewrite without grading.
+# Only the band in between goes to the LLM grader. Off by default: the thresholds are placeholders
+# until calibrated against the grader's verdicts for your embedding model and collection.
+SCORE_GATING = os.getenv("SCORE_GATING", "false").lower() == "true"
+SCORE_ACCEPT_THRESHOLD = float(os.getenv("SCORE_ACCEPT_THRESHOLD", "0.85"))
+SCORE_REJECT_THRESHOLD = float(os.getenv("SCORE_REJECT_THRESHOLD", "0.55"))
+
+# --- Context Packing ---
+# Merge overlapping chunks of the same page, drop near-duplicates, fill a token budget in relevance order
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # Shingle Jaccard similarity
+
+# --- Grader Configs ---
+# 'sequential': one LLM call per chunk, stop at the first relevant one
+# 'concurrent': parallel per-chunk calls, in-flight calls cancelled on the first 'yes'
+# 'listwise':   a single LLM call grading all chunks at once
+GRADER_MODE = os.getenv("GRADER_MODE", "concurrent")
+GRADER_CONCURRENCY = int(os.getenv("GRADER_CONCURRENCY", "4"))
+# Query rewrites exclude chunks already graded for the request, so nothing is graded twice
+RETRY_EXCLUDE_SEEN = os.getenv("RETRY_EXCLUDE_SEEN", "true").lower() == "true"
+
+# --- Intent Router ---
+# 'embedding': classify locally from the query embedding, ask the LLM only when unsure
+# 'llm':       always ask the LLM
+# The embedding router's threshold is uncalibrated: measure it with benchmarks/router_benchmark.py
+# against your embedding model before switching to 'embedding'
+ROUTER_MODE = os.getenv("ROUTER_MODE", "llm")
+ROUTER_STRATEGY = os.getenv("ROUTER_STRATEGY", "centroid")  # 'centroid' | 'knn'
+ROUTER_KNN_K = int(os.getenv("ROUTER_KNN_K", "5"))
+# Minimum similarity margin between the two intents before the LLM is skipped
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.04"))
+# Optional JSON file with {"chat": [...], "search": [...]} example utterances
+ROUTER_EXAMPLES_FILE = os.getenv("ROUTER_EXAMPLES_FILE", "")
+
+# Start retrieval while the router is still deciding (wasted work on 'chat' queries)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+
+# --- Embedding Cache ---
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+# Optional SQLite file that keeps embeddings across restarts (disabled when empty)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+# --- Semantic Answer Cache ---
+# Off by default: 0.95 is a placeholder until calibrated on your questions. It must sit above the
+# similarity of questions that need different answers (e.g. two control IDs) and below that of paraphrases.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # Cosine similarity
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+SEMANTIC_CACHE_MAX_MB = float(os.getenv("SEMANTIC_CACHE_MAX_MB", "64"))
+# How often the live collection is asked for its index version
+INDEX_VERSION_CHECK_SECONDS = float(os.getenv("INDEX_VERSION_CHECK_SECONDS", "30"))
+
+# --- Conversation Sessions ---
+# Follow-ups are rewritten into a standalone question from the last HISTORY_MAX_TURNS messages
+HISTORY_CONDENSING = os.getenv("HISTORY_CONDENSING", "true").lower() == "true"
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+# Chunks recent turns of a session were answered from. A follow-up whose best cosine score
+# against them reaches SESSION_REUSE_THRESHOLD is answered from them (no search, no grader).
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+SESSION_REUSE_THRESHOLD = float(os.getenv("SESSION_REUSE_THRESHOLD", "0.85"))
+SESSION_MAX_DOCUMENTS = int(os.getenv("SESSION_MAX_DOCUMENTS", "30"))  # Per session
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))  # Since the session's last turn
+SESSION_MAX_MB = float(os.getenv("SESSION_MAX_MB", "64"))
+
+# --- Request Coalescing ---
+# Concurrent /chat requests with the same normalized query share one pipeline run
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+
+# --- Batch Audits ---
+# POST /chat/batch answers a checklist of questions: embedded, routed and searched in bulk,
+# then graded and answered BATCH_CONCURRENCY at a time
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# --- Admission Control ---
+# At most ADMISSION_MAX_IN_FLIGHT /chat requests run at once and up to ADMISSION_MAX_QUEUE more wait
+# for a slot, for at most ADMISSION_QUEUE_TIMEOUT_SECONDS. Beyond that requests are shed at once
+# (429 when the queue is full, 503 when the wait runs out). 0 disables admission control.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+
+# --- Upstream Concurrency ---
+# Calls in flight per upstream across all requests of a worker (0: unbounded)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+QDRANT_MAX_CONCURRENCY = int(os.getenv("QDRANT_MAX_CONCURRENCY", "16"))
 
 # --- Project Base Directory ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SPARSE_INDEX_PATH = os.getenv("SPARSE_INDEX_PATH", os.path.join(BASE_DIR, "data", "sparse_index.json"))
+CONTROL_INDEX_PATH = os.getenv("CONTROL_INDEX_PATH", os.path.join(BASE_DIR, "data", "control_index.json"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(BASE_DIR, "data", "snapshot"))
+
+# --- Startup ---
+# Open the Qdrant connection, embed the router examples and load the sparse index
+# during API startup instead of on the first request
+PREWARM_CONNECTIONS = os.getenv("PREWARM_CONNECTIONS", "false").lower() == "true"
+
 
 # --- Validation ---
-if not QDRANT_URL or not QDRANT_API_KEY or not GOOGLE_API_KEY or not GROQ_API_KEY:
-    raise ValueError("Missing critical API Keys in .env file")
+# Checked when the component that needs the setting is built, not at import time
+def require(*names: str) -> None:
+    missing = [name for name in names if not globals().get(name)]
+    if missing:
+        raise ValueError(f"Missing critical API Keys in .env file: {', '.join(missing)}")
@@ -0,0 +1,115 @@
+import re
+from typing import List, Optional, Set
+
+from langchain_core.documents import Document
+
+# Ingestion splits with chunk_overlap=200, so neighbouring chunks share up to 200 characters.
+# Shorter common prefixes/suffixes are treated as coincidence, not overlap.
+MIN_OVERLAP_CHARS = 20
+SHINGLE_SIZE = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _shingles(text: str) -> Set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Block:
+    """One or more chunks from the same page, merged into contiguous text."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.text = doc.page_content.strip()
+        self.metadata = dict(doc.metadata)
+        self.rank = rank  # Best retrieval rank of any merged chunk
+        self.page_key = (doc.metadata.get("source_file"), doc.metadata.get("page"))
+
+    def try_merge(self, doc: Document, rank: int) -> bool:
+        text = doc.page_content.strip()
+        if text in self.text:
+            merged = self.text
+        elif self.text in text:
+            merged = text
+        elif (size := _overlap(self.text, text)):
+            merged = self.text + text[size:]
+        elif (size := _overlap(text, self.text)):
+            merged = text + self.text[size:]
+        else:
+            return False
+        self.text = merged
+        self.rank = min(self.rank, rank)
+        return True
+
+
+def pack_context(documents: List[Document], token_budget: int, dedup_threshold: float = 0.8) -> List[Document]:
+    """
+    Turns ranked retrieval results into a compact prompt context:
+
+    1. chunks from the same page whose text overlaps (the splitter's chunk_overlap)
+       are stitched into one block,
+    2. blocks whose word-shingle Jaccard similarity with a better-ranked block is at
+       least `dedup_threshold` are dropped,
+    3. blocks are taken in relevance order until `token_budget` is spent.
+
+    `documents` must be ordered most relevant first. The best block is always
+    kept, truncated if it alone exceeds the budget.
+    """
+    blocks: List[_Block] = []
+    for rank, doc in enumerate(documents):
+        page_key = (doc.metadata.get("source_file"), doc.metadata.get("page"))
+        target: Optional[_Block] = None
+        for block in blocks:
+            if block.page_key == page_key and block.try_merge(doc, rank):
+                target = block
+                break
+        if target is None:
+            blocks.append(_Block(doc, rank))
+            continue
+        # The new chunk may bridge the gap between two blocks of the same page
+        for other in [b for b in blocks if b is not target and b.page_key == page_key]:
+            if target.try_merge(Document(page_content=other.text, metadata=other.metadata), other.rank):
+                blocks.remove(other)
+
+    blocks.sort(key=lambda block: block.rank)
+
+    kept: List[_Block] = []
+    kept_shingles: List[Set[str]] = []
+    for block in blocks:
+        shingles = _shingles(block.text)
+        if any(_jaccard(shingles, seen) >= dedup_threshold for seen in kept_shingles):
+            continue
+        kept.append(block)
+        kept_shingles.append(shingles)
+
+    packed: List[Document] = []
+    used = 0
+    for block in kept:
+        tokens = estimate_tokens(block.text)
+        if used + tokens > token_budget:
+            if not packed:
+                packed.append(Document(page_content=block.text[: token_budget * 4], metadata=block.metadata))
+                used = token_budget
+            continue  # A smaller, lower-ranked block may still fit
+        packed.append(Document(page_content=block.text, metadata=block.metadata))
+        used += tokens
+    return packed
@@ -0,0 +1,145 @@
+import os
+import re
+import json
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.documents import Document
+
+FUNCTIONS = {
+    "GV": "Govern", "ID": "Identify", "PR": "Protect", "DE": "Detect", "RS": "Respond", "RC": "Recover",
+}
+# A CSF 2.0 category ("GV.RM") or subcategory ("PR.AA-05")
+CONTROL_ID_PATTERN = re.compile(r"\b(GV|ID|PR|DE|RS|RC)\.([A-Z]{2})(?:-(\d{2}))?\b")
+# Questions may spell IDs in lower case ("pr.aa-05")
+QUERY_CONTROL_ID_PATTERN = re.compile(CONTROL_ID_PATTERN.pattern, re.IGNORECASE)
+
+
+def control_ids(text: str, pattern: re.Pattern = CONTROL_ID_PATTERN) -> List[str]:
+    """The control IDs in `text`, upper-cased, in order of first appearance."""
+    found = []
+    for function, category, number in pattern.findall(text):
+        control = f"{function}.{category}".upper() + (f"-{number}" if number else "")
+        if control not in found:
+            found.append(control)
+    return found
+
+
+def query_control_ids(text: str) -> List[str]:
+    return control_ids(text, QUERY_CONTROL_ID_PATTERN)
+
+
+def parent_function(control: str) -> str:
+    return FUNCTIONS[control[:2]]
+
+
+class ControlIndex:
+    """
+    Maps every CSF control ID found in the collection to the chunks that mention it.
+
+    Ingestion builds it from the Qdrant payloads next to the BM25 index. A chunk
+    that *defines* a control ("PR.AA-05: Access permissions ...") ranks before
+    chunks that only refer to it. A category ("GV.RM") also covers the chunks of its
+    subcategories. Chunk text and metadata are stored, so lookups need no Qdrant
+    round trip and no embedding.
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        # Control ID -> [(chunk position, defines it, mentions)]
+        self._entries: Dict[str, List[tuple]] = defaultdict(list)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            mentioned = control_ids(text)
+            if not mentioned:
+                continue
+            position = len(self.ids)
+            self.ids.append(chunk_id)
+            self.texts.append(text)
+            self.metadatas.append(metadata)
+            for control in mentioned:
+                defines = re.search(rf"(^|\n)\s*{re.escape(control)}\s*:", text) is not None
+                self._entries[control].append((position, defines, text.count(control)))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def controls(self) -> Dict[str, Dict[str, Any]]:
+        """Every indexed control with its parent function, chunk IDs and pages."""
+        return {
+            control: {
+                "function": parent_function(control),
+                "chunks": [self.ids[position] for position, _, _ in entries],
+                "pages": sorted({self.metadatas[position].get("page", 0) for position, _, _ in entries}),
+            }
+            for control, entries in sorted(self._entries.items())
+        }
+
+    # --- Lookup ---
+
+    def _ranked(self, control: str, source_files: Optional[Set[str]]) -> List[int]:
+        # (chunk position, defines it, mentions, names this very ID)
+        entries = [(position, defines, mentions, True) for position, defines, mentions in self._entries.get(control, [])]
+        if "-" not in control:
+            # A category also covers the chunks of its subcategories
+            for key, subentries in self._entries.items():
+                if key.startswith(f"{control}-"):
+                    entries += [(position, defines, mentions, False) for position, defines, mentions in subentries]
+        if source_files:
+            entries = [e for e in entries if self.metadatas[e[0]].get("source_file") in source_files]
+        # Definitions first, then the ID itself before its subcategories, the most mentions, document order
+        entries.sort(key=lambda e: (not e[1], not e[3], -e[2], self.metadatas[e[0]].get("page", 0), e[0]))
+        ranked, seen = [], set()
+        for position, _, _, _ in entries:
+            if position not in seen:
+                seen.add(position)
+                ranked.append(position)
+        return ranked
+
+    def lookup(self, query: str, limit: int = 5, source_files: Optional[Set[str]] = None) -> Optional[List[Document]]:
+        """
+        The chunks for the control IDs named in `query` (round-robin across IDs, at most
+        `limit`), or None when the query names none or any of them is not indexed.
+        """
+        controls = query_control_ids(query)
+        if not controls:
+            return None
+        rankings = [self._ranked(control, source_files) for control in controls]
+        if not all(rankings):
+            return None
+
+        chosen: List[int] = []
+        for rank in range(max(len(r) for r in rankings)):
+            for ranking in rankings:
+                if rank < len(ranking) and ranking[rank] not in chosen:
+                    chosen.append(ranking[rank])
+        return [
+            Document(page_content=self.texts[i], metadata=dict(self.metadatas[i], _id=self.ids[i]))
+            for i in chosen[: max(limit, len(controls))]
+        ]
+
+    # --- Persistence ---
+
+    def save(self, path: str, index_version: Optional[str] = None) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "index_version": index_version,
+                    # For people and other tools; lookups are rebuilt from the chunks on load
+                    "controls": self.controls(),
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                },
+                f,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ControlIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["texts"], data["metadatas"])
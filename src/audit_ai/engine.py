@@ -1,23 +1,47 @@
 import os
+import time
 import asyncio
-from typing import List, Literal, TypedDict
+import threading
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, TypedDict
 
 from audit_ai.config import (
-    GROQ_API_KEY, GOOGLE_API_KEY, QDRANT_URL, QDRANT_API_KEY, 
-    LLM_MODEL, EMBEDDING_MODEL, COLLECTION_NAME
+    GOOGLE_API_KEY, QDRANT_URL, QDRANT_API_KEY, QDRANT_PREFER_GRPC, require,
+    LLM_MODEL, EMBEDDING_MODEL, COLLECTION_NAME, COLLECTION_PROFILE,
+    GRADER_MODE, GRADER_CONCURRENCY, RETRY_EXCLUDE_SEEN,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_MB, INDEX_VERSION_CHECK_SECONDS,
+    EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PATH,
+    ROUTER_MODE, ROUTER_STRATEGY, ROUTER_KNN_K, ROUTER_CONFIDENCE_THRESHOLD, ROUTER_EXAMPLES_FILE,
+    SPECULATIVE_RETRIEVAL,
+    RETRIEVAL_K, HYBRID_RETRIEVAL, RRF_K, SPARSE_INDEX_PATH, ADAPTIVE_K, RETRIEVAL_MIN_K, RETRIEVAL_SCORE_MARGIN,
+    CONTROL_ID_LOOKUP, CONTROL_INDEX_PATH, CONTROL_LOOKUP_MAX_CHUNKS,
+    LOCAL_SNAPSHOT, SNAPSHOT_DIR,
+    SCORE_GATING, SCORE_ACCEPT_THRESHOLD, SCORE_REJECT_THRESHOLD,
+    CONTEXT_PACKING, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD,
+    HISTORY_CONDENSING, HISTORY_MAX_TURNS,
+    SESSION_CACHE_ENABLED, SESSION_REUSE_THRESHOLD, SESSION_MAX_DOCUMENTS, SESSION_MAX_SESSIONS,
+    SESSION_TTL_SECONDS, SESSION_MAX_MB,
+    BATCH_CONCURRENCY,
+    LLM_MAX_CONCURRENCY, EMBEDDING_MAX_CONCURRENCY, QDRANT_MAX_CONCURRENCY,
 )
 
 # --- LangChain & Qdrant Imports ---
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
 from langchain_core.runnables import RunnableConfig
 
-# --- LangGraph Imports ---
-from langgraph.graph import StateGraph, END
+# Gemini, Qdrant and LangGraph are imported by the builders below, on first use
+
+from audit_ai.cache import SemanticCache, CachedAnswer, CachedEmbeddings, INDEX_VERSION_KEY
+from audit_ai.router import EmbeddingRouter, load_router_examples
+from audit_ai.sparse import BM25Index, reciprocal_rank_fusion
+from audit_ai.controls import ControlIndex
+from audit_ai.snapshot import CURRENT_FILE, VectorSnapshot
+from audit_ai.context import pack_context, estimate_tokens
+from audit_ai.session import SessionStore
+from audit_ai.limits import BoundedChatModel, UpstreamLimiter
+from audit_ai import metrics
 
 # =============================================================================
 # 1. STATE DEFINITION
@@ -31,84 +55,672 @@ class GraphState(TypedDict):
     search_query: str          # The query used for retrieval (can be rewritten)
     generation: str            # The final answer
     documents: List[Document]  # The retrieved context chunks
+    scores: List[Optional[float]]  # Dense similarity per chunk (None for BM25-only hits)
+    retrieval_decision: str    # Score gate: 'accept', 'reject' or 'grade'
     grade: str                 # 'yes' or 'no' (Relevance check)
     retry_count: int           # Tracks retries
+    grader_latency_ms: float   # Total time spent in the grader for this request
+    chunk_grades: Dict[str, str]  # Chunk ID -> 'yes'/'no' for every chunk graded so far
+    relevant_documents: List[Document]  # Chunks graded relevant, accumulated across retries
+    grader_calls: int          # Grader LLM calls made for this request
+    context_documents: List[Document]  # What generate actually put in the prompt (packed)
+    context_tokens: int        # Estimated prompt tokens of that context
+    generation_latency_ms: float
+    prefetched_documents: Optional[List[Document]]  # Speculative retrieval for the original question
+    prefetched_scores: Optional[List[Optional[float]]]
+    prefetched_decision: Optional[str]  # Score gate decided by the prefetch (session reuse: 'accept')
+    source_files: Optional[List[str]]  # Restricts retrieval to these documents (None: all)
 
 # =============================================================================
 # 2. INITIALIZATION
 # =============================================================================
 
-# Initialize Components using Centralized Config
-llm = ChatGoogleGenerativeAI(
-    model=LLM_MODEL,
-    temperature=0,
-    google_api_key=GOOGLE_API_KEY,
-)
+# Nothing is built at import time: importing the engine costs no network round
+# trips and none of the heavy client libraries. Each component is built on first
+# use (or up front by `init_components()` in the API lifespan) and cached here.
+_components: Dict[str, Any] = {}
+_components_lock = threading.RLock()  # Builders call other getters
+
+# Calls in flight per upstream, shared by every request of this process
+upstream_limits = {
+    "llm": UpstreamLimiter("llm", LLM_MAX_CONCURRENCY),
+    "embeddings": UpstreamLimiter("embeddings", EMBEDDING_MAX_CONCURRENCY),
+    "qdrant": UpstreamLimiter("qdrant", QDRANT_MAX_CONCURRENCY),
+}
+
+
+def _component(name: str, build: Callable[[], Any]) -> Any:
+    component = _components.get(name)
+    if component is None:
+        with _components_lock:
+            component = _components.get(name)
+            if component is None:
+                component = _components[name] = build()
+    return component
+
+
+def _build_llm():
+    require("GOOGLE_API_KEY")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return BoundedChatModel(
+        model=ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0, google_api_key=GOOGLE_API_KEY),
+        limiter=upstream_limits["llm"],
+        callbacks=[metrics.llm_metrics_handler],
+    )
+
+
+def _build_embeddings():
+    require("GOOGLE_API_KEY")
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    # Cached, so the answer-cache lookup, retrieve and rewrite loops share one embedding per query
+    return CachedEmbeddings(
+        GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=GOOGLE_API_KEY),
+        model_name=EMBEDDING_MODEL,
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        disk_path=EMBEDDING_CACHE_PATH or None,
+        observer=metrics.observe_embedding,
+        limiter=upstream_limits["embeddings"],
+        query_task_type="RETRIEVAL_QUERY",
+    )
+
+
+# check_compatibility=False: the server-version check is a blocking HTTP request at construction time
+def _build_client():
+    require("QDRANT_URL", "QDRANT_API_KEY")
+    from qdrant_client import QdrantClient
+
+    return QdrantClient(
+        url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC, check_compatibility=False
+    )
+
+
+def _build_async_client():
+    require("QDRANT_URL", "QDRANT_API_KEY")
+    from qdrant_client import AsyncQdrantClient
+
+    return AsyncQdrantClient(
+        url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC, check_compatibility=False
+    )
+
+
+def _build_vector_store():
+    from audit_ai.vectorstore import AsyncQdrantVectorStore
+
+    # Sync methods use `client`, async methods (used by the graph) use `async_client`.
+    # The collection check (a live embedding + Qdrant call) is left to the first query / pre-warm.
+    return AsyncQdrantVectorStore(
+        client=get_client(),
+        async_client=get_async_client(),
+        collection_name=COLLECTION_NAME,
+        embedding=get_embeddings(),
+        validate_collection_config=False,
+        limiter=upstream_limits["qdrant"],
+    )
+
+
+def _build_intent_router():
+    return EmbeddingRouter(
+        embeddings=get_embeddings(),
+        examples=load_router_examples(ROUTER_EXAMPLES_FILE),
+        threshold=ROUTER_CONFIDENCE_THRESHOLD,
+        strategy=ROUTER_STRATEGY,
+        k=ROUTER_KNN_K,
+    )
+
+
+def _build_collection_profile():
+    from audit_ai.collection import get_profile
+
+    return get_profile(COLLECTION_PROFILE)
+
+
+def get_llm():
+    return _component("llm", _build_llm)
+
+
+def get_embeddings() -> CachedEmbeddings:
+    return _component("embeddings", _build_embeddings)
+
+
+def get_client():
+    return _component("client", _build_client)
+
+
+def get_async_client():
+    return _component("async_client", _build_async_client)
 
-embeddings = GoogleGenerativeAIEmbeddings(
-    model=EMBEDDING_MODEL, 
-    google_api_key=GOOGLE_API_KEY
-)
 
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+def get_vector_store():
+    return _component("vector_store", _build_vector_store)
 
-vector_store = QdrantVectorStore(
-    client=client,
-    collection_name=COLLECTION_NAME,
-    embedding=embeddings,
+
+def get_intent_router() -> EmbeddingRouter:
+    return _component("intent_router", _build_intent_router)
+
+
+def get_collection_profile():
+    """Search parameters (HNSW beam, quantization rescoring) matching how the collection is indexed."""
+    return _component("collection_profile", _build_collection_profile)
+
+
+def get_graph():
+    """The compiled LangGraph app."""
+    return _component("app", _build_graph)
+
+
+def set_components(**components: Any) -> None:
+    """Replaces components (llm, embeddings, vector_store, collection_profile, app, ...), e.g. with fakes."""
+    unknown = set(components) - set(_COMPONENT_GETTERS)
+    if unknown:
+        raise ValueError(f"Unknown engine components: {', '.join(sorted(unknown))}")
+    with _components_lock:
+        _components.update(components)
+
+
+def __getattr__(name: str) -> Any:
+    # `engine.llm`, `engine.app`, ... keep working for callers of the old module globals
+    getter = _COMPONENT_GETTERS.get(name)
+    if getter is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getter()
+
+
+def init_components() -> None:
+    """
+    Builds every component now (API startup) instead of on the first request.
+    Clients are only constructed; connections are opened by the first call or `aprewarm`.
+    """
+    for getter in _COMPONENT_GETTERS.values():
+        getter()
+
+
+async def aprewarm() -> None:
+    """
+    Opens the Qdrant connection, embeds the router examples and loads the sparse
+    index and the vector snapshot, so the first request does not pay for them.
+    Failures are only logged.
+    """
+    started = time.perf_counter()
+    steps = {"qdrant": aget_index_version()}
+    if ROUTER_MODE == "embedding":
+        steps["router"] = get_intent_router().aprepare()
+    if HYBRID_RETRIEVAL:
+        steps["sparse_index"] = asyncio.to_thread(get_sparse_index)
+    if LOCAL_SNAPSHOT:
+        steps["vector_snapshot"] = asyncio.to_thread(get_local_snapshot)
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            print(f"Prewarm Error ({step}): {result}")
+    print(f"---PREWARM: {', '.join(steps)} in {(time.perf_counter() - started) * 1000:.0f} ms---")
+
+
+answer_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+    max_bytes=int(SEMANTIC_CACHE_MAX_MB * 1024 * 1024),
+)
+
+session_store = SessionStore(
+    threshold=SESSION_REUSE_THRESHOLD,
+    margin=RETRIEVAL_SCORE_MARGIN,
+    max_documents=SESSION_MAX_DOCUMENTS,
+    max_sessions=SESSION_MAX_SESSIONS,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    max_bytes=int(SESSION_MAX_MB * 1024 * 1024),
 )
 
 # =============================================================================
 # 2. DEFINE THE NODES (AGENTS)
 # =============================================================================
 
-def retrieve(state: GraphState):
+_sparse_index: Dict[str, Any] = {"index": None, "mtime": None}
+
+
+def get_sparse_index() -> Optional[BM25Index]:
+    """
+    The BM25 index written by ingestion, reloaded whenever the file changes.
+    Returns None if ingestion has not built one yet (dense-only retrieval).
+    """
+    try:
+        mtime = os.path.getmtime(SPARSE_INDEX_PATH)
+    except OSError:
+        return None
+    if mtime != _sparse_index["mtime"]:
+        try:
+            _sparse_index["index"] = BM25Index.load(SPARSE_INDEX_PATH)
+            print(f"---LOADED SPARSE INDEX: {len(_sparse_index['index'])} chunks---")
+        except Exception as e:
+            print(f"Sparse Index Error: {e}")
+        _sparse_index["mtime"] = mtime
+    return _sparse_index["index"]
+
+
+async def _areload(getter: Callable[[], Any], state: Dict[str, Any], path: str) -> Any:
+    """
+    `getter()` for async callers: when `path` changed, the (re)load runs in a worker thread,
+    shared by every caller that arrives meanwhile, so parsing never blocks the event loop.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if mtime is None or mtime == state["mtime"]:
+        return getter()
+    reload = state.get("reload")
+    if reload is None:
+        reload = state["reload"] = asyncio.ensure_future(asyncio.to_thread(getter))
+        reload.add_done_callback(lambda _: state.pop("reload", None))
+    return await asyncio.shield(reload)
+
+
+async def aget_sparse_index() -> Optional[BM25Index]:
+    return await _areload(get_sparse_index, _sparse_index, SPARSE_INDEX_PATH)
+
+
+_control_index: Dict[str, Any] = {"index": None, "mtime": None}
+
+
+def get_control_index() -> Optional[ControlIndex]:
+    """The control-ID index written by ingestion, reloaded whenever the file changes (None if absent)."""
+    try:
+        mtime = os.path.getmtime(CONTROL_INDEX_PATH)
+    except OSError:
+        return None
+    if mtime != _control_index["mtime"]:
+        try:
+            _control_index["index"] = ControlIndex.load(CONTROL_INDEX_PATH)
+            print(f"---LOADED CONTROL INDEX: {len(_control_index['index'])} controls---")
+        except Exception as e:
+            print(f"Control Index Error: {e}")
+        _control_index["mtime"] = mtime
+    return _control_index["index"]
+
+
+async def aget_control_index() -> Optional[ControlIndex]:
+    return await _areload(get_control_index, _control_index, CONTROL_INDEX_PATH)
+
+
+async def acontrol_lookup(
+    user_query: str, source_files: Optional[List[str]] = None
+) -> Optional[Tuple[List[Document], List[Optional[float]]]]:
+    """
+    The chunks mapped to the control IDs the question names, or None when it names none
+    (or one the index does not know): then it takes the normal route.
+    """
+    index = await aget_control_index() if CONTROL_ID_LOOKUP else None
+    if index is None:
+        return None
+    documents = index.lookup(user_query, limit=CONTROL_LOOKUP_MAX_CHUNKS, source_files=set(source_files or ()))
+    if not documents:
+        return None
+    return documents, [None] * len(documents)
+
+
+_local_snapshot: Dict[str, Any] = {"snapshot": None, "mtime": None}
+local_snapshot_stats = {"hit": 0, "stale": 0, "error": 0}
+
+
+def get_local_snapshot() -> Optional[VectorSnapshot]:
+    """
+    The vector snapshot written by ingestion, reloaded whenever ingestion switches
+    CURRENT to a new one (None if absent). Searches already running keep the old one.
+    """
+    try:
+        mtime = os.path.getmtime(os.path.join(SNAPSHOT_DIR, CURRENT_FILE))
+    except OSError:
+        return None
+    if mtime != _local_snapshot["mtime"]:
+        try:
+            _local_snapshot["snapshot"] = VectorSnapshot.load(SNAPSHOT_DIR)
+            print(f"---LOADED VECTOR SNAPSHOT: {len(_local_snapshot['snapshot'])} chunks---")
+        except Exception as e:
+            print(f"Vector Snapshot Error: {e}")
+        _local_snapshot["mtime"] = mtime
+    return _local_snapshot["snapshot"]
+
+
+async def alocal_snapshot() -> Optional[VectorSnapshot]:
+    """
+    The snapshot to search instead of Qdrant, if local search is on and the snapshot was
+    exported from the collection's current index version. While Qdrant cannot be asked
+    for its version (outage), the snapshot is used as it is.
+    """
+    if not LOCAL_SNAPSHOT:
+        return None
+    snapshot = await _areload(get_local_snapshot, _local_snapshot, os.path.join(SNAPSHOT_DIR, CURRENT_FILE))
+    if snapshot is None:
+        return None
+    live_version = await aget_index_version()
+    if live_version is not None and snapshot.index_version != live_version:
+        local_snapshot_stats["stale"] += 1
+        metrics.LOCAL_SEARCHES.labels("stale").inc()
+        return None
+    return snapshot
+
+
+async def _asearch_snapshot(snapshot: VectorSnapshot, search: Callable[[], Any]) -> Optional[Any]:
+    """Runs a snapshot search off the event loop; None (use Qdrant) if it fails."""
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(search)
+    except Exception as e:
+        print(f"Vector Snapshot Error: {e}")
+        local_snapshot_stats["error"] += 1
+        metrics.LOCAL_SEARCHES.labels("error").inc()
+        return None
+    metrics.LOCAL_SEARCH_LATENCY.observe(time.perf_counter() - started)
+    local_snapshot_stats["hit"] += 1
+    metrics.LOCAL_SEARCHES.labels("hit").inc()
+    return result
+
+
+def adaptive_k(scored: List[Tuple[Document, float]]) -> int:
+    """
+    How many of the (score-ordered) hits to keep: those within RETRIEVAL_SCORE_MARGIN
+    of the top score, but never fewer than RETRIEVAL_MIN_K.
+    A clear winner yields a short context, a flat distribution a long one.
+    With ADAPTIVE_K off, all RETRIEVAL_K hits are kept.
+    """
+    if not scored:
+        return 0
+    if not ADAPTIVE_K:
+        return min(len(scored), RETRIEVAL_K)
+    top = scored[0][1]
+    within = sum(1 for _, score in scored if score >= top - RETRIEVAL_SCORE_MARGIN)
+    return min(len(scored), max(RETRIEVAL_MIN_K, within))
+
+
+def chunk_id(doc: Document) -> str:
+    return str(doc.metadata.get("_id", doc.page_content))
+
+
+def answer_documents(relevant: Optional[List[Document]], retrieved: List[Document]) -> List[Document]:
+    """What the answer is generated from: chunks graded relevant on any pass, then the latest retrieval."""
+    documents = list(relevant or [])
+    seen = {chunk_id(doc) for doc in documents}
+    return documents + [doc for doc in retrieved if chunk_id(doc) not in seen]
+
+
+async def aretrieve_documents(
+    query: str, exclude_ids: Optional[List[str]] = None, source_files: Optional[List[str]] = None
+) -> Tuple[List[Document], List[Optional[float]]]:
+    """
+    Dense search (the local vector snapshot when it is current, else Qdrant), fused
+    with BM25 via reciprocal rank fusion when hybrid retrieval is on. BM25 catches
+    exact terms such as control IDs ("GV.SC-04").
+    Chunks in `exclude_ids` are filtered out, and `source_files` limits the search
+    to those documents (payload-indexed filters in Qdrant, the same rules locally and for BM25).
+    Returns the documents and their dense similarity scores.
+    """
+    from audit_ai.collection import search_filter
+
+    scored = None
+    snapshot = await alocal_snapshot()
+    if snapshot is not None:
+        embedding = await get_embeddings().aembed_query(query)
+        scored = await _asearch_snapshot(
+            snapshot,
+            lambda: snapshot.search(
+                embedding, k=RETRIEVAL_K, exclude_ids=set(exclude_ids or ()), source_files=set(source_files or ())
+            ),
+        )
+    if scored is None:
+        scored = await get_vector_store().asimilarity_search_with_score(
+            query,
+            k=RETRIEVAL_K,
+            filter=search_filter(exclude_ids, source_files),
+            search_params=get_collection_profile().search_params(),
+        )
+    sparse_index = await aget_sparse_index() if HYBRID_RETRIEVAL else None
+    return _select_and_fuse(query, scored, sparse_index, exclude_ids, source_files)
+
+
+async def aretrieve_many(
+    queries: List[str], embeddings: List[List[float]], source_files: Optional[List[str]] = None
+) -> List[Tuple[List[Document], List[Optional[float]]]]:
+    """
+    `aretrieve_documents` for already embedded queries: one pass over the local
+    snapshot, or one batched Qdrant request.
+    """
+    from audit_ai.collection import search_filter
+
+    batches = None
+    snapshot = await alocal_snapshot()
+    if snapshot is not None:
+        batches = await _asearch_snapshot(
+            snapshot, lambda: snapshot.search_many(embeddings, k=RETRIEVAL_K, source_files=set(source_files or ()))
+        )
+    if batches is None:
+        batches = await get_vector_store().asimilarity_search_with_score_by_vectors(
+            embeddings,
+            k=RETRIEVAL_K,
+            filter=search_filter(None, source_files),
+            search_params=get_collection_profile().search_params(),
+        )
+    sparse_index = await aget_sparse_index() if HYBRID_RETRIEVAL else None
+    return [_select_and_fuse(query, scored, sparse_index, None, source_files) for query, scored in zip(queries, batches)]
+
+
+def _select_and_fuse(
+    query: str,
+    scored: List[Tuple[Document, float]],
+    sparse_index: Optional[BM25Index] = None,
+    exclude_ids: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+) -> Tuple[List[Document], List[Optional[float]]]:
+    """Adaptive k over the dense hits, fused with BM25 when a sparse index is given."""
+    k = adaptive_k(scored)
+    dense = [doc for doc, _ in scored[:k]]
+    dense_scores = {doc.metadata.get("_id"): score for doc, score in scored}
+
+    if sparse_index is None:
+        documents = dense
+    else:
+        hits = sparse_index.search(
+            query, k=k, exclude_ids=set(exclude_ids or ()), source_files=set(source_files or ())
+        )
+        sparse = [doc for doc, _ in hits]
+        documents = reciprocal_rank_fusion([dense, sparse], k=RRF_K, limit=k)
+    return documents, [dense_scores.get(doc.metadata.get("_id")) for doc in documents]
+
+
+score_gate_stats = {"accept": 0, "reject": 0, "grade": 0}
+
+
+def gate_on_scores(scores: List[Optional[float]]) -> str:
+    """
+    'accept' when the top dense score is decisive, 'reject' when every chunk scored low,
+    'grade' for the ambiguous band. BM25-only hits have no dense score, so they always
+    leave the decision to the grader.
+    """
+    if not SCORE_GATING or not scores:
+        return "grade"
+    dense = [score for score in scores if score is not None]
+    if dense and max(dense) >= SCORE_ACCEPT_THRESHOLD:
+        return "accept"
+    if len(dense) == len(scores) and max(dense) < SCORE_REJECT_THRESHOLD:
+        return "reject"
+    return "grade"
+
+
+async def retrieve(state: GraphState):
     """
     Node 1: RETRIEVE
     Queries Qdrant using either the 'search_query' (if rewritten) or original 'question'.
     """
-    print("---RETRIEVE NODE---")
-    query = state.get("search_query") or state["question"]
-    documents = vector_store.similarity_search(query, k=10)
-    return {"documents": documents, "question": state["question"]}
+    print(f"---RETRIEVE NODE [{metrics.request_id_var.get()}]---")
+    # The first pass can reuse documents retrieved speculatively while the router ran
+    if state.get("prefetched_documents") is not None and not state.get("search_query"):
+        print("---USING SPECULATIVE RETRIEVAL---")
+        documents = state["prefetched_documents"]
+        scores = state.get("prefetched_scores") or [None] * len(documents)
+        decision = state.get("prefetched_decision")
+    else:
+        query = state.get("search_query") or state["question"]
+        # Rewrites skip every chunk already graded for this request
+        exclude_ids = list(state.get("chunk_grades") or {}) if RETRY_EXCLUDE_SEEN else None
+        documents, scores = await aretrieve_documents(
+            query, exclude_ids=exclude_ids, source_files=state.get("source_files")
+        )
+        if exclude_ids:
+            print(f"---EXCLUDED {len(exclude_ids)} ALREADY GRADED CHUNKS---")
+        decision = None
+
+    decision = decision or gate_on_scores(scores)
+    score_gate_stats[decision] += 1
+    top = max((score for score in scores if score is not None), default=None)
+    top_text = f"{top:.3f}" if top is not None else "n/a"
+    print(f"---SCORE GATE: {decision.upper()} (top score {top_text}, k={len(documents)})---")
+    return {
+        "documents": documents,
+        "scores": scores,
+        "retrieval_decision": decision,
+        "question": state["question"],
+    }
+
+
+# Each strategy returns the overall grade, the per-chunk grades (None where a chunk
+# was never graded because of the early exit) and the number of grader LLM calls.
+GradeResult = Tuple[str, List[Optional[str]], int]
+
 
+async def _grade_sequential(chain, question: str, documents: List[Document], config: RunnableConfig) -> GradeResult:
+    """Grades one chunk at a time and stops at the first relevant one."""
+    grades: List[Optional[str]] = [None] * len(documents)
+    for i, doc in enumerate(documents):
+        grade = await chain.ainvoke({"question": question, "context": doc.page_content}, config=config)
+        grades[i] = "yes" if "yes" in grade.lower() else "no"
+        if grades[i] == "yes":
+            return "yes", grades, i + 1
+    return "no", grades, len(documents)
 
-def grade_documents(state: GraphState):
+
+async def _grade_concurrent(chain, question: str, documents: List[Document], config: RunnableConfig) -> GradeResult:
     """
-    Node 2: GRADE DOCUMENTS (The Critic)
-    Checks if retrieved documents are relevant.
+    Grades chunks in parallel (bounded by GRADER_CONCURRENCY).
+    As soon as one grader says 'yes', the calls still in flight are cancelled.
     """
-    print("---GRADE DOCUMENTS NODE---")
-    question = state["question"]
-    documents = state["documents"]
+    semaphore = asyncio.Semaphore(max(1, GRADER_CONCURRENCY))
+    grades: List[Optional[str]] = [None] * len(documents)
+    started = {"calls": 0}
+
+    async def grade_one(i: int, doc: Document) -> bool:
+        async with semaphore:
+            started["calls"] += 1
+            grade = await chain.ainvoke({"question": question, "context": doc.page_content}, config=config)
+        grades[i] = "yes" if "yes" in grade.lower() else "no"
+        return grades[i] == "yes"
+
+    tasks = [asyncio.create_task(grade_one(i, doc)) for i, doc in enumerate(documents)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            if await finished:
+                return "yes", grades, started["calls"]
+        return "no", grades, started["calls"]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _grade_listwise(question: str, documents: List[Document], config: RunnableConfig) -> GradeResult:
+    """Grades every chunk in a single LLM call (so all chunks share its grade)."""
+    if not documents:
+        return "no", [], 0
 
     prompt = ChatPromptTemplate.from_template(
-        "You are a grader assessing relevance of a retrieved document to a user question. \n"
-        "Here is the retrieved document: \n\n {context} \n\n"
+        "You are a grader assessing relevance of retrieved documents to a user question. \n"
+        "Here are the retrieved documents: \n\n {context} \n\n"
         "Here is the user question: {question} \n"
-        "If the document contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n"
+        "If ANY of the documents contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n"
         "Return ONLY the word 'yes' or 'no'."
     )
+    chain = prompt | get_llm().with_config({"tags": ["grader"]}) | StrOutputParser()
+
+    context = "\n\n".join(
+        f"[Document {i + 1}]\n{doc.page_content}" for i, doc in enumerate(documents)
+    )
+    grade = await chain.ainvoke({"question": question, "context": context}, config=config)
+    score = "yes" if "yes" in grade.lower() else "no"
+    return score, [score] * len(documents), 1
+
+
+async def grade_documents(state: GraphState, config: RunnableConfig):
+    """
+    Node 2: GRADE DOCUMENTS (The Critic)
+    Checks if retrieved documents are relevant.
+    The strategy is picked by GRADER_MODE ('sequential', 'concurrent' or 'listwise').
+    """
+    print(f"---GRADE DOCUMENTS NODE [{metrics.request_id_var.get()}]---")
+    question = state["question"]
+    documents = state["documents"]
+    chunk_grades = dict(state.get("chunk_grades") or {})
+    started = time.perf_counter()
+
+    # Chunks graded on an earlier pass keep their grade instead of being sent to the grader again
+    known = [chunk_grades.get(chunk_id(doc)) if RETRY_EXCLUDE_SEEN else None for doc in documents]
+    to_grade = [doc for doc, grade in zip(documents, known) if grade is None]
+
+    if "yes" in known:
+        score, grades, calls = "yes", [None] * len(to_grade), 0
+    elif GRADER_MODE == "listwise":
+        score, grades, calls = await _grade_listwise(question, to_grade, config)
+    else:
+        prompt = ChatPromptTemplate.from_template(
+            "You are a grader assessing relevance of a retrieved document to a user question. \n"
+            "Here is the retrieved document: \n\n {context} \n\n"
+            "Here is the user question: {question} \n"
+            "If the document contains keyword(s) or semantic meaning related to the user question, grade it as relevant. \n"
+            "Return ONLY the word 'yes' or 'no'."
+        )
+        chain = prompt | get_llm().with_config({"tags": ["grader"]}) | StrOutputParser()
+
+        if GRADER_MODE == "sequential":
+            score, grades, calls = await _grade_sequential(chain, question, to_grade, config)
+        else:
+            score, grades, calls = await _grade_concurrent(chain, question, to_grade, config)
 
-    chain = prompt | llm.with_config({"tags": ["grader"]}) | StrOutputParser()
+    relevant_documents = list(state.get("relevant_documents") or [])
+    relevant_ids = {chunk_id(doc) for doc in relevant_documents}
+    scores = {chunk_id(doc): score for doc, score in zip(documents, state.get("scores") or [])}
+    for doc, grade in zip(to_grade, grades):
+        if grade is None:
+            continue
+        chunk_grades[chunk_id(doc)] = grade
+        if scores.get(chunk_id(doc)) is not None:
+            metrics.GRADED_CHUNK_SCORES.labels(grade).observe(scores[chunk_id(doc)])
+        if grade == "yes" and chunk_id(doc) not in relevant_ids:
+            relevant_documents.append(doc)
+            relevant_ids.add(chunk_id(doc))
 
-    score = "no"
-    for doc in documents:
-        grade = chain.invoke({"question": question, "context": doc.page_content})
-        if "yes" in grade.lower():
-            score = "yes"
-            break
+    # Latency is accumulated across rewrite loops so it reflects the whole request
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    grader_latency_ms = state.get("grader_latency_ms", 0.0) + elapsed_ms
 
-    print(f"---RESULT: Documents relevant? {score.upper()}---")
-    return {"grade": score}
+    skipped = len(documents) - len(to_grade)
+    print(
+        f"---RESULT: Documents relevant? {score.upper()} ({GRADER_MODE}, {elapsed_ms:.0f} ms, "
+        f"{calls} grader calls, {skipped} chunks already graded)---"
+    )
+    return {
+        "grade": score,
+        "grader_latency_ms": grader_latency_ms,
+        "chunk_grades": chunk_grades,
+        "relevant_documents": relevant_documents,
+        "grader_calls": state.get("grader_calls", 0) + calls,
+    }
 
 
-def transform_query(state: GraphState):
+async def transform_query(state: GraphState, config: RunnableConfig):
     """
     Node 3: TRANSFORM QUERY (The Fixer)
     Rewrites the question to improve vector search if grading failed.
     """
-    print("---TRANSFORM QUERY NODE---")
+    print(f"---TRANSFORM QUERY NODE [{metrics.request_id_var.get()}]---")
     question = state["question"]
 
     prompt = ChatPromptTemplate.from_template(
@@ -119,9 +731,10 @@ def transform_query(state: GraphState):
         "Return ONLY the new query text."
     )
 
-    chain = prompt | llm | StrOutputParser()
-    better_query = chain.invoke({"question": question})
+    chain = prompt | get_llm().with_config({"tags": ["rewriter"]}) | StrOutputParser()
+    better_query = await chain.ainvoke({"question": question}, config=config)
     current_retries = state.get("retry_count", 0)
+    metrics.GRAPH_RETRIES.inc()
     print(f"---REWRITTEN QUERY: {better_query}---")
     return {"search_query": better_query, "retry_count": current_retries + 1}
 
@@ -131,16 +744,23 @@ async def generate(state: GraphState, config: RunnableConfig):
     Node 4: GENERATE
     Produces the final answer using retrieved context.
     """
-    print("---GENERATE NODE---")
+    print(f"---GENERATE NODE [{metrics.request_id_var.get()}]---")
     question = state["question"]
-    documents = state["documents"]
+    documents = answer_documents(state.get("relevant_documents"), state["documents"])
+
+    if CONTEXT_PACKING:
+        context_documents = pack_context(documents, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD)
+    else:
+        context_documents = documents
 
     context_text = "\n\n".join(
         [
             f"[Source: {doc.metadata.get('source_file', 'Unknown')}]\n{doc.page_content}"
-            for doc in documents
+            for doc in context_documents
         ]
     )
+    context_tokens = estimate_tokens(context_text)
+    print(f"---CONTEXT: {len(documents)} chunks -> {len(context_documents)} blocks, ~{context_tokens} tokens---")
 
     prompt = ChatPromptTemplate.from_template(
         "You are a strict Compliance Auditor AI. "
@@ -153,33 +773,34 @@ async def generate(state: GraphState, config: RunnableConfig):
         "Answer:"
     )
 
-    rag_chain = prompt | llm.with_config({"tags": ["generator"]}) | StrOutputParser()
+    rag_chain = prompt | get_llm().with_config({"tags": ["generator"]}) | StrOutputParser()
 
+    started = time.perf_counter()
     response = await rag_chain.ainvoke(
         {"context": context_text, "question": question}, config=config
     )
 
-    return {"generation": response}
+    return {
+        "generation": response,
+        "context_documents": context_documents,
+        "context_tokens": context_tokens,
+        "generation_latency_ms": (time.perf_counter() - started) * 1000,
+    }
 
 
 # =============================================================================
 # 3. BUILD THE GRAPH LOGIC
 # =============================================================================
 
-workflow = StateGraph(GraphState)
-
-# Add Nodes
-workflow.add_node("retrieve", retrieve)
-workflow.add_node("grade_documents", grade_documents)
-workflow.add_node("generate", generate)
-workflow.add_node("transform_query", transform_query)
-
-# Define Entry Point
-workflow.set_entry_point("retrieve")
+def decide_after_retrieve(state: GraphState):
+    """Only the ambiguous score band is sent to the LLM grader."""
+    decision = state.get("retrieval_decision", "grade")
+    if decision == "accept":
+        return "generate"
+    if decision == "reject":
+        return "generate" if state.get("retry_count", 0) >= 3 else "transform_query"
+    return "grade_documents"
 
-# Add Edges
-workflow.add_edge("retrieve", "grade_documents")
-workflow.add_edge("transform_query", "retrieve")
 
 def decide_to_generate(state: GraphState):
     grade = state.get("grade")
@@ -192,26 +813,55 @@ def decide_to_generate(state: GraphState):
     else:
         return "transform_query"
 
-workflow.add_conditional_edges(
-    "grade_documents",
-    decide_to_generate,
-    {"generate": "generate", "transform_query": "transform_query"},
-)
 
-workflow.add_edge("generate", END)
+def _build_graph():
+    from langgraph.graph import StateGraph, END
+
+    workflow = StateGraph(GraphState)
+
+    # Add Nodes
+    workflow.add_node("retrieve", metrics.timed_node("retrieve", retrieve))
+    workflow.add_node("grade_documents", metrics.timed_node("grade_documents", grade_documents))
+    workflow.add_node("generate", metrics.timed_node("generate", generate))
+    workflow.add_node("transform_query", metrics.timed_node("transform_query", transform_query))
 
-# Compile the Graph
-app = workflow.compile()
+    # Define Entry Point
+    workflow.set_entry_point("retrieve")
+
+    # Add Edges
+    workflow.add_edge("transform_query", "retrieve")
+    workflow.add_conditional_edges(
+        "retrieve",
+        decide_after_retrieve,
+        {"generate": "generate", "grade_documents": "grade_documents", "transform_query": "transform_query"},
+    )
+    workflow.add_conditional_edges(
+        "grade_documents",
+        decide_to_generate,
+        {"generate": "generate", "transform_query": "transform_query"},
+    )
+    workflow.add_edge("generate", END)
+
+    # Compile the Graph
+    return workflow.compile()
+
+
+_COMPONENT_GETTERS = {
+    "llm": get_llm,
+    "embeddings": get_embeddings,
+    "client": get_client,
+    "async_client": get_async_client,
+    "vector_store": get_vector_store,
+    "intent_router": get_intent_router,
+    "collection_profile": get_collection_profile,
+    "app": get_graph,
+}
 
 # =============================================================================
 # 4. PUBLIC INTERFACE (Used by API)
 # =============================================================================
 
-def route_query(user_query: str) -> Literal["chat", "search"]:
-    """
-    Semantic Router: Decides if the query is a basic greeting/identity check 
-    or a complex compliance search requiring the graph.
-    """
+def _router_chain():
     prompt = ChatPromptTemplate.from_template(
         "You are a router. Classify user input into one of two categories: \n"
         "1. 'chat': Greetings, identity checks, unrelated/nonsense questions (dogs, painting, sports), or general help. \n"
@@ -220,19 +870,134 @@ def route_query(user_query: str) -> Literal["chat", "search"]:
         "If you are even slightly unsure if it is a compliance query, return 'chat'. \n"
         "Return ONLY one word: 'chat' or 'search'."
     )
-    
-    chain = prompt | llm | StrOutputParser()
-    intent = chain.invoke({"query": user_query}).strip().lower()
-    
-    if "chat" in intent:
+    return prompt | get_llm().with_config({"tags": ["router"]}) | StrOutputParser()
+
+
+def _parse_intent(raw: str) -> Literal["chat", "search"]:
+    if "chat" in raw.strip().lower():
         return "chat"
     return "search"
 
 
-def run_chat_logic(user_query: str):
+def route_query(user_query: str) -> Literal["chat", "search"]:
     """
-    Handles simple conversational queries without the full graph.
+    Semantic Router: Decides if the query is a basic greeting/identity check 
+    or a complex compliance search requiring the graph.
+    In 'embedding' mode the LLM is only asked when the local router is unsure.
+    """
+    if ROUTER_MODE == "embedding":
+        try:
+            intent, confidence = get_intent_router().classify(user_query)
+            if intent:
+                print(f"---ROUTER: {intent} (embedding, margin {confidence:.3f})---")
+                return intent
+        except Exception as e:
+            print(f"Embedding Router Error: {e}")
+
+    intent = _parse_intent(_router_chain().invoke({"query": user_query}))
+    print(f"---ROUTER: {intent} (llm)---")
+    return intent
+
+
+async def aroute_query(user_query: str) -> Literal["chat", "search"]:
+    """
+    Async version of `route_query` for use inside the event loop.
+    """
+    if ROUTER_MODE == "embedding":
+        try:
+            intent, confidence = await get_intent_router().aclassify(user_query)
+            if intent:
+                print(f"---ROUTER: {intent} (embedding, margin {confidence:.3f})---")
+                return intent
+        except Exception as e:
+            print(f"Embedding Router Error: {e}")
+
+    intent = _parse_intent(await _router_chain().ainvoke({"query": user_query}))
+    print(f"---ROUTER: {intent} (llm)---")
+    return intent
+
+
+speculation_stats = {
+    "launched": 0,
+    "used": 0,             # Search intent: the graph reused the prefetched documents
+    "discarded": 0,        # Chat intent: the retrieval was cancelled or thrown away
+    "failed": 0,
+    "ttft_saved_ms": 0.0,  # Retrieval time that overlapped with routing
+    "wasted_ms": 0.0,      # Retrieval time spent on queries routed to chat
+}
+
+
+async def aroute_with_speculation(
+    user_query: str, source_files: Optional[List[str]] = None
+) -> Tuple[Literal["chat", "search"], Optional[Tuple[List[Document], List[Optional[float]]]]]:
+    """
+    Routes the query while retrieving its documents at the same time.
+    Returns the intent plus the prefetched (documents, scores) for 'search' (None for 'chat',
+    when speculation is disabled, or when the speculative retrieval failed).
     """
+    if not SPECULATIVE_RETRIEVAL:
+        return await aroute_query(user_query), None
+
+    started = time.perf_counter()
+    finished_at = {}
+
+    async def speculate():
+        try:
+            return await aretrieve_documents(user_query, source_files=source_files)
+        finally:
+            finished_at["t"] = time.perf_counter()
+
+    task = asyncio.create_task(speculate())
+    speculation_stats["launched"] += 1
+    try:
+        intent = await aroute_query(user_query)
+    except BaseException:
+        task.cancel()
+        raise
+    routed_at = time.perf_counter()
+
+    if intent == "chat":
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        speculation_stats["discarded"] += 1
+        speculation_stats["wasted_ms"] += (finished_at.get("t", routed_at) - started) * 1000
+        return intent, None
+
+    try:
+        prefetched = await task
+    except Exception as e:
+        print(f"Speculative Retrieval Error: {e}")
+        speculation_stats["failed"] += 1
+        return intent, None
+
+    speculation_stats["used"] += 1
+    speculation_stats["ttft_saved_ms"] += (min(routed_at, finished_at["t"]) - started) * 1000
+    return intent, prefetched
+
+
+def graph_config() -> RunnableConfig:
+    """Tags the graph run (and every LLM call inside it) with the current request ID."""
+    return {"metadata": {"request_id": metrics.request_id_var.get()}}
+
+
+def graph_inputs(
+    user_query: str,
+    prefetched: Optional[Tuple[List[Document], List[Optional[float]]]],
+    source_files: Optional[List[str]] = None,
+    prefetched_decision: Optional[str] = None,
+):
+    """Initial graph state, seeded with the speculative retrieval (or the session's documents) when there is one."""
+    documents, scores = prefetched if prefetched else (None, None)
+    return {
+        "question": user_query,
+        "prefetched_documents": documents,
+        "prefetched_scores": scores,
+        "prefetched_decision": prefetched_decision if prefetched else None,
+        "source_files": source_files or None,
+    }
+
+
+def _chat_chain():
     prompt = ChatPromptTemplate.from_template(
         """You are **AuditAI**, a professional auditor specializing in the **NIST Cybersecurity Framework (CSF) 2.0**.
 
@@ -245,29 +1010,425 @@ Rules for your response:
 User Query: {query}
 Answer:"""
     )
-    
-    chain = prompt | llm | StrOutputParser()
-    answer = chain.invoke({"query": user_query})
+    return prompt | get_llm().with_config({"tags": ["chat"]}) | StrOutputParser()
+
+
+def run_chat_logic(user_query: str):
+    """
+    Handles simple conversational queries without the full graph.
+    """
+    answer = _chat_chain().invoke({"query": user_query})
     return {"answer": answer}
 
 
+async def arun_chat_logic(user_query: str):
+    """
+    Async version of `run_chat_logic` for use inside the event loop.
+    """
+    answer = await _chat_chain().ainvoke({"query": user_query})
+    return {"answer": answer}
+
 
-def process_query(user_query: str):
+async def astream_chat_logic(user_query: str):
     """
-    Helper function for non-streaming execution (e.g., for evals).
+    Streams the conversational answer token by token as the model produces it.
+    """
+    async for token in _chat_chain().astream({"query": user_query}):
+        if token:
+            yield token
+
+
+_index_version = {"value": None, "checked_at": float("-inf")}
+
+
+async def aget_index_version() -> Optional[str]:
+    """
+    Returns the version ingestion stamped on the live collection.
+    The lookup is throttled to once per INDEX_VERSION_CHECK_SECONDS.
+    """
+    now = time.monotonic()
+    if now - _index_version["checked_at"] < INDEX_VERSION_CHECK_SECONDS:
+        return _index_version["value"]
+
+    _index_version["checked_at"] = now
+    try:
+        async with upstream_limits["qdrant"].acquire():
+            with metrics.track_qdrant("get_collection"):
+                info = await get_async_client().get_collection(COLLECTION_NAME)
+        _index_version["value"] = (info.config.metadata or {}).get(INDEX_VERSION_KEY)
+    except Exception as e:
+        print(f"Index Version Error: {e}")
+    return _index_version["value"]
+
+
+async def acache_lookup(user_query: str) -> Tuple[Optional[List[float]], Optional[CachedAnswer]]:
+    """
+    Looks the query up in the semantic answer cache.
+    Returns the query embedding (for storing the answer later) and the hit, if any.
+    """
+    # A control-ID lookup is cheaper than the embedding a cache lookup needs
+    if not SEMANTIC_CACHE_ENABLED or await acontrol_lookup(user_query):
+        return None, None
+    try:
+        embedding = await get_embeddings().aembed_query(user_query)
+        index_version = await aget_index_version()
+    except Exception as e:
+        print(f"Cache Lookup Error: {e}")
+        return None, None
+
+    hit = answer_cache.lookup(embedding, index_version=index_version)
+    if hit:
+        print(f"---CACHE HIT (similarity {hit.similarity:.3f}): {hit.query[:60]}---")
+    return embedding, hit
+
+
+# We defined standard refusal phrases in the prompt. If the AI says them, we hide sources.
+REFUSAL_PHRASES = [
+    "missing from the database",
+    "does not mention",
+    "cannot answer",
+    "no information",
+    "context does not contain",
+    "not mentioned in the provided documents",
+]
+
+
+def is_refusal(answer: str) -> bool:
+    return any(phrase in answer.lower() for phrase in REFUSAL_PHRASES)
+
+
+def cache_store(user_query: str, embedding: Optional[List[float]], answer: str, documents: List[Document]):
+    """
+    Stores a finished search answer, tagged with the index version it was built from.
+    Refusals are not stored: similar questions would replay them, without sources, until the next ingest.
+    """
+    if not SEMANTIC_CACHE_ENABLED or embedding is None or not answer or is_refusal(answer):
+        return
+    answer_cache.store(
+        user_query, embedding, answer, documents, index_version=_index_version["value"]
+    )
+
+
+def _format_history(history: List[Dict[str, str]]) -> str:
+    lines = []
+    for message in history[-HISTORY_MAX_TURNS:]:
+        role = "Assistant" if message.get("role") in ("assistant", "ai") else "User"
+        # Long answers are cut: the gist is enough to resolve "it" / "that function"
+        content = " ".join(str(message.get("content", "")).split())
+        lines.append(f"{role}: {content[:500]}")
+    return "\n".join(lines)
+
+
+async def acondense_question(user_query: str, history: Optional[List[Dict[str, str]]]) -> str:
+    """
+    Rewrites a follow-up ("what about the Detect function?") into a standalone question,
+    so routing, the answer cache and retrieval see what is actually being asked.
+    Without history (or if the call fails) the query is returned unchanged.
     """
-    intent = route_query(user_query)
-    
+    if not HISTORY_CONDENSING or not history:
+        return user_query
+
+    prompt = ChatPromptTemplate.from_template(
+        "Given the conversation below and a follow-up question, rephrase the follow-up question "
+        "to be a standalone question that can be understood without the conversation. \n"
+        "If it is already standalone, return it unchanged. \n\n"
+        "Conversation:\n{history}\n\n"
+        "Follow-up question: {question}\n"
+        "Return ONLY the standalone question."
+    )
+    chain = prompt | get_llm().with_config({"tags": ["condenser"]}) | StrOutputParser()
+    try:
+        condensed = await chain.ainvoke(
+            {"history": _format_history(history), "question": user_query}, config=graph_config()
+        )
+    except Exception as e:
+        print(f"Condense Error: {e}")
+        return user_query
+    condensed = condensed.strip() or user_query
+    print(f"---CONDENSED QUESTION: {condensed}---")
+    return condensed
+
+
+async def asession_lookup(
+    session_id: Optional[str], user_query: str, source_files: Optional[List[str]] = None
+) -> Optional[Tuple[List[Document], List[Optional[float]]]]:
+    """
+    The chunks of the session's recent turns that cover the (condensed) question, with
+    their cosine scores, or None when the question needs a new search.
+    """
+    if not SESSION_CACHE_ENABLED or not session_id:
+        return None
+    try:
+        embedding = await get_embeddings().aembed_query(user_query)
+    except Exception as e:
+        print(f"Session Lookup Error: {e}")
+        return None
+
+    reused = session_store.lookup(session_id, embedding, source_files, index_version=_index_version["value"])
+    metrics.SESSION_LOOKUPS.labels("hit" if reused else "miss").inc()
+    if reused:
+        print(f"---SESSION HIT: {len(reused[0])} cached chunks (top score {reused[1][0]:.3f})---")
+    return reused
+
+
+async def aremember_session(session_id: Optional[str], documents: List[Document]) -> None:
+    """
+    Keeps the chunks an answer was built from with its session, for the follow-ups.
+    Their vectors come from the local snapshot when it is current, else from Qdrant
+    in one request, instead of being embedded again.
+    """
+    if not SESSION_CACHE_ENABLED or not session_id or not documents:
+        return
+    by_id = {str(doc.metadata["_id"]): doc for doc in documents if doc.metadata.get("_id") is not None}
+    if not by_id:
+        return
+
+    vectors = {}
+    snapshot = await alocal_snapshot()
+    if snapshot is not None:
+        vectors = snapshot.vectors_for(list(by_id))
+    missing = [key for key in by_id if key not in vectors]
+    if missing:
+        try:
+            async with upstream_limits["qdrant"].acquire():
+                with metrics.track_qdrant("retrieve"):
+                    points = await get_async_client().retrieve(
+                        collection_name=COLLECTION_NAME, ids=missing, with_payload=False, with_vectors=True
+                    )
+        except Exception as e:
+            print(f"Session Store Error: {e}")
+            return
+        for point in points:
+            vector = point.vector
+            if isinstance(vector, dict):  # Named vectors
+                vector = vector.get(get_vector_store().vector_name)
+            if vector:
+                vectors[str(point.id)] = vector
+
+    session_store.remember(
+        session_id,
+        [(key, doc, vectors[key]) for key, doc in by_id.items() if key in vectors],
+        index_version=_index_version["value"],
+    )
+
+
+async def aroute_with_session(
+    user_query: str, session_id: Optional[str] = None, source_files: Optional[List[str]] = None
+) -> Tuple[Literal["chat", "search"], Optional[Tuple[List[Document], List[Optional[float]]]], Optional[str]]:
+    """
+    A question naming CSF control IDs is a search answered from the control-ID index, and a
+    follow-up covered by its session's chunks one answered from those: no routing, no
+    retrieval, and the score gate accepts them (no grader). Anything else goes through
+    `aroute_with_speculation`. Returns the intent, the prefetched retrieval and its gate decision.
+    """
+    direct = await acontrol_lookup(user_query, source_files)
+    if direct:
+        metrics.CONTROL_LOOKUPS.inc()
+        print(f"---CONTROL LOOKUP: {len(direct[0])} chunks---")
+        return "search", direct, "accept"
+    reused = await asession_lookup(session_id, user_query, source_files)
+    if reused:
+        return "search", reused, "accept"
+    intent, prefetched = await aroute_with_speculation(user_query, source_files)
+    return intent, prefetched, None
+
+
+async def aprocess_query(
+    user_query: str,
+    source_files: Optional[List[str]] = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    session_id: Optional[str] = None,
+    use_cache: bool = True,
+):
+    """
+    Non-streaming execution of the full pipeline (cache + router + graph), fully async.
+    `source_files` limits retrieval to those documents (such answers bypass the answer cache).
+    With `history` the question is condensed first; with `session_id` follow-ups may be
+    answered from the chunks of the session's earlier turns. `use_cache=False` neither
+    reads nor fills the answer cache.
+    """
+    user_query = await acondense_question(user_query, history)
+
+    use_cache = use_cache and not source_files
+    embedding, hit = await acache_lookup(user_query) if use_cache else (None, None)
+    if hit:
+        await aremember_session(session_id, hit.documents)
+        return {"answer": hit.answer, "context": hit.documents, "cached": True}
+
+    intent, prefetched, decision = await aroute_with_session(user_query, session_id, source_files)
+
     if intent == "chat":
-        return run_chat_logic(user_query)
-        
-    inputs = {"question": user_query}
+        return await arun_chat_logic(user_query)
+
+    result = await arun_search(user_query, prefetched, source_files, decision, embedding)
+    if not result.get("error"):
+        await aremember_session(session_id, result["documents"])
+    return result
+
+
+async def arun_search(
+    user_query: str,
+    prefetched: Optional[Tuple[List[Document], List[Optional[float]]]] = None,
+    source_files: Optional[List[str]] = None,
+    decision: Optional[str] = None,
+    embedding: Optional[List[float]] = None,
+):
+    """Runs the graph to a final answer and caches it (when `embedding` is given)."""
     try:
-        final_state = asyncio.run(app.ainvoke(inputs))
+        final_state = await get_graph().ainvoke(
+            graph_inputs(user_query, prefetched, source_files, decision), config=graph_config()
+        )
+        print(
+            f"---GRADER: {final_state.get('grader_calls', 0)} calls, "
+            f"{final_state.get('grader_latency_ms', 0.0):.0f} ms---"
+        )
+        documents = answer_documents(final_state.get("relevant_documents"), final_state["documents"])
+        cache_store(user_query, embedding, final_state["generation"], documents)
         return {
             "answer": final_state["generation"],
-            "context": final_state["documents"],
+            # The packed context the answer was generated from (what RAGAS should judge)
+            "context": final_state.get("context_documents", final_state["documents"]),
+            # Everything the answer may cite (relevant chunks from every pass, then the last retrieval)
+            "documents": documents,
+            "grader_latency_ms": final_state.get("grader_latency_ms", 0.0),
+            "grader_calls": final_state.get("grader_calls", 0),
+            "context_tokens": final_state.get("context_tokens", 0),
+            "generation_latency_ms": final_state.get("generation_latency_ms", 0.0),
         }
     except Exception as e:
         print(f"Graph Error: {e}")
-        return {"answer": "Error processing request.", "context": []}
+        return {"answer": "Error processing request.", "context": [], "documents": [], "error": True}
+
+
+async def aroute_many(
+    questions: List[str], embeddings: Optional[List[List[float]]]
+) -> List[Literal["chat", "search"]]:
+    """
+    Routes a batch of already embedded questions: the embedding router decides what it can,
+    the rest go to the LLM router as one `abatch` call (BATCH_CONCURRENCY at a time).
+    Without embeddings every question goes to the LLM router.
+    A question whose LLM routing fails is treated as a search.
+    """
+    intents: List[Optional[str]] = [None] * len(questions)
+    if ROUTER_MODE == "embedding" and embeddings is not None:
+        try:
+            decided = await get_intent_router().aclassify_vectors(embeddings)
+            intents = [intent for intent, _ in decided]
+        except Exception as e:
+            print(f"Embedding Router Error: {e}")
+
+    unsure = [i for i, intent in enumerate(intents) if intent is None]
+    if unsure:
+        replies = await _router_chain().abatch(
+            [{"query": questions[i]} for i in unsure],
+            config={"max_concurrency": BATCH_CONCURRENCY, **graph_config()},
+            return_exceptions=True,
+        )
+        for i, reply in zip(unsure, replies):
+            if isinstance(reply, Exception):
+                print(f"Router Error: {reply}")
+                intents[i] = "search"
+            else:
+                intents[i] = _parse_intent(reply)
+
+    searches = sum(intent == "search" for intent in intents)
+    print(f"---BATCH ROUTER: {searches} search, {len(intents) - searches} chat ({len(unsure)} via llm)---")
+    return intents
+
+
+async def aprocess_batch(questions: List[str], source_files: Optional[List[str]] = None):
+    """
+    Answers a checklist of questions, yielding (index, result) as each one finishes.
+
+    Questions naming control IDs are served from the control-ID index. All others are
+    embedded in one call and routed in bulk, and their searches go to Qdrant as one
+    batched request. Grading and generation then run BATCH_CONCURRENCY questions at
+    a time. Cached answers are yielded first. If the shared embedding call fails, each
+    question is routed by the LLM and retrieves on its own instead.
+    Each question runs under its own request ID ("<batch ID>-<index>").
+    """
+    batch_id = metrics.request_id_var.get()
+
+    # Questions naming control IDs need neither embedding nor routing nor search
+    prefetched: Dict[int, Tuple[List[Document], List[Optional[float]]]] = {}
+    for i, question in enumerate(questions):
+        direct = await acontrol_lookup(question, source_files)
+        if direct:
+            prefetched[i] = direct
+            metrics.CONTROL_LOOKUPS.inc()
+    direct_ids = set(prefetched)
+    embedded = [i for i in range(len(questions)) if i not in prefetched]
+    vectors = []
+    if embedded:
+        try:
+            vectors = await get_embeddings().aembed_queries([questions[i] for i in embedded])
+        except Exception as e:
+            # No cache lookup, LLM routing, and each graph run embeds (or fails) on its own
+            print(f"Batch Embedding Error: {e}")
+    embeddings = dict(zip(embedded, vectors))
+
+    pending = list(embedded)
+    if SEMANTIC_CACHE_ENABLED and not source_files and embeddings:
+        index_version = await aget_index_version()
+        for i in list(pending):
+            hit = answer_cache.lookup(embeddings[i], index_version=index_version)
+            if hit:
+                pending.remove(i)
+                yield i, {"answer": hit.answer, "context": hit.documents, "documents": hit.documents, "cached": True}
+
+    routed = await aroute_many(
+        [questions[i] for i in pending], [embeddings[i] for i in pending] if embeddings else None
+    ) if pending else []
+    intents = dict(zip(pending, routed))
+    intents.update({i: "search" for i in prefetched})
+    searches = [i for i in pending if intents[i] == "search"]
+    if searches and embeddings:
+        try:
+            retrieved = await aretrieve_many(
+                [questions[i] for i in searches], [embeddings[i] for i in searches], source_files
+            )
+            prefetched.update(zip(searches, retrieved))
+        except Exception as e:
+            # Each graph run falls back to its own retrieval
+            print(f"Batch Retrieval Error: {e}")
+
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer(i: int, intent: str):
+        metrics.request_id_var.set(f"{batch_id}-{i}")
+        async with slots:
+            if intent == "chat":
+                try:
+                    return i, await arun_chat_logic(questions[i])
+                except Exception as e:
+                    print(f"Chat Error: {e}")
+                    return i, {"answer": "Error processing request.", "context": [], "error": True}
+            # Control-ID chunks are accepted as they are (no grader)
+            decision = "accept" if i in direct_ids else None
+            embedding = embeddings.get(i) if not source_files else None
+            return i, await arun_search(questions[i], prefetched.get(i), source_files, decision, embedding)
+
+    tasks = [asyncio.create_task(answer(i, intents[i])) for i in sorted(intents)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # The client went away (or the consumer stopped early): nothing left is wanted
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# The async Qdrant/Gemini clients keep connection pools bound to the loop they
+# were first used on, so the sync helper reuses one loop instead of asyncio.run().
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def process_query(user_query: str):
+    """
+    Helper function for non-streaming execution (e.g., for evals).
+    """
+    global _sync_loop
+    if _sync_loop is None or _sync_loop.is_closed():
+        _sync_loop = asyncio.new_event_loop()
+    return _sync_loop.run_until_complete(aprocess_query(user_query))
@@ -1,51 +1,535 @@
 import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_qdrant import QdrantVectorStore
+from qdrant_client import AsyncQdrantClient, models
+
+from audit_ai.config import (
+    COLLECTION_NAME, COLLECTION_PROFILE,
+    SPARSE_INDEX_PATH, CONTROL_INDEX_PATH,
+    LOCAL_SNAPSHOT, SNAPSHOT_DIR, SNAPSHOT_DTYPE,
+)
+from audit_ai.cache import INDEX_VERSION_KEY
+from audit_ai.collection import CollectionProfile, apply_profile, create_collection, get_profile
+from audit_ai.sparse import BM25Index
+from audit_ai.controls import ControlIndex
+from audit_ai.snapshot import CURRENT_FILE, VectorSnapshot
 
 load_dotenv()
 
 # --- PATH LOGIC ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-PDF_FILE_NAME = os.path.join(BASE_DIR, "data", "nist_framework.pdf")
-COLLECTION_NAME = "compliance_audit"
+DATA_DIR = os.path.join(BASE_DIR, "data")
+MANIFEST_FILE = os.path.join(DATA_DIR, "ingest_manifest.json")
+PAGE_CACHE_DIR = os.path.join(DATA_DIR, ".page_cache")
 
+# Point IDs are uuid5(namespace, chunk hash): the same chunk always maps to the same point
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c7f52-3c1e-4b8e-9a55-0b7b4d1d2a11")
 
-def ingest_docs():
-    qdrant_url = os.getenv("QDRANT_URL")
-    qdrant_key = os.getenv("QDRANT_API_KEY")
+# --- Pipeline Tuning ---
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))  # Also the upsert batch size
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+
+
+# =============================================================================
+# 1. CHUNKING & IDENTITY
+# =============================================================================
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    print(f"📄 Loading PDF: {PDF_FILE_NAME}...")
-    loader = PyPDFLoader(PDF_FILE_NAME)
-    documents = loader.load()
 
-    print("✂️  Splitting text...")
+def chunk_id(doc: Document) -> str:
+    """
+    Deterministic point ID from the chunk's content and its stable metadata.
+    Loader metadata such as the absolute path is left out so IDs match across machines.
+    """
+    identity = json.dumps(
+        {
+            "content": doc.page_content,
+            "source_file": doc.metadata.get("source_file"),
+            "page": doc.metadata.get("page"),
+        },
+        sort_keys=True,
+    )
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, hashlib.sha256(identity.encode("utf-8")).hexdigest()))
+
+
+def parse_and_split(
+    pdf_path: str,
+    page_numbers: List[int],
+    total_pages: int,
+    cached_pages: Optional[Dict[int, Dict[str, str]]],
+    chunk_size: int,
+    chunk_overlap: int,
+) -> Tuple[Dict[int, Dict[str, str]], List[Tuple[str, Document]]]:
+    """
+    Process-pool worker: extracts a range of pages (unless their text came from the
+    page cache) and splits them into chunks.
+    Extraction matches PyPDFLoader's default 'page' mode, so chunk IDs are stable.
+    """
+    source_file = os.path.basename(pdf_path)
+
+    if cached_pages is not None:
+        pages = cached_pages
+    else:
+        reader = PdfReader(pdf_path)
+        pages = {
+            i: {
+                "text": reader.pages[i].extract_text(extraction_mode="plain").strip(),
+                "label": reader.page_labels[i],
+            }
+            for i in page_numbers
+        }
+
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", " ", ""]
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=["\n\n", "\n", " ", ""]
     )
-    splits = text_splitter.split_documents(documents)
-    print(f"   Created {len(splits)} chunks.")
+    chunks = []
+    for page_number in page_numbers:
+        metadata = {
+            "source": source_file,
+            "source_file": source_file,
+            "page": page_number,
+            "page_label": pages[page_number]["label"],
+            "total_pages": total_pages,
+        }
+        for doc in text_splitter.create_documents([pages[page_number]["text"]], metadatas=[metadata]):
+            chunks.append((chunk_id(doc), doc))
+    return pages, chunks
+
+
+def page_cache_path(sha: str) -> str:
+    return os.path.join(PAGE_CACHE_DIR, f"{sha}.json")
+
+
+def load_page_cache(sha: str) -> Optional[Dict[int, Dict[str, str]]]:
+    path = page_cache_path(sha)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return {int(page): entry for page, entry in json.load(f).items()}
+
+
+def save_page_cache(sha: str, pages: Dict[int, Dict[str, str]]) -> None:
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = page_cache_path(sha) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    os.replace(tmp_path, page_cache_path(sha))
+
+
+# =============================================================================
+# 2. COLLECTION STATE
+# =============================================================================
+
+async def ensure_collection(client: AsyncQdrantClient, embeddings, profile: CollectionProfile) -> None:
+    """
+    Creates the collection with the given profile, or updates the HNSW, quantization
+    and payload-index settings of the existing (live) one, which is never dropped.
+    """
+    if await client.collection_exists(COLLECTION_NAME):
+        if await apply_profile(client, COLLECTION_NAME, profile):
+            print(f"🔧 Applied collection profile '{profile.name}' (Qdrant re-indexes in the background).")
+        return
+    dimension = len(await embeddings.aembed_query("dimension probe"))
+    print(f"🆕 Creating collection '{COLLECTION_NAME}' ({dimension} dims, profile '{profile.name}')...")
+    await create_collection(client, COLLECTION_NAME, dimension, profile)
+
+
+async def existing_points(client: AsyncQdrantClient) -> Dict[str, Optional[str]]:
+    """Maps every point ID in the collection to the source file it came from."""
+    points: Dict[str, Optional[str]] = {}
+    offset = None
+    while True:
+        batch, offset = await client.scroll(
+            collection_name=COLLECTION_NAME,
+            with_payload=["metadata"],
+            with_vectors=False,
+            limit=1000,
+            offset=offset,
+        )
+        for point in batch:
+            metadata = (point.payload or {}).get("metadata") or {}
+            # Points written before incremental ingestion only carry the absolute 'source' path
+            source = metadata.get("source_file") or os.path.basename(metadata.get("source", "") or "") or None
+            points[str(point.id)] = source
+        if offset is None:
+            return points
+
+
+async def build_local_indexes(client: AsyncQdrantClient, index_version: Optional[str]) -> None:
+    """
+    Rebuilds the local BM25 and control-ID indexes from the chunks currently in the
+    collection, and the vector snapshot when LOCAL_SNAPSHOT is on (only then are vectors fetched).
+    """
+    ids, texts, metadatas, vectors = [], [], [], []
+    offset = None
+    while True:
+        batch, offset = await client.scroll(
+            collection_name=COLLECTION_NAME,
+            with_payload=True,
+            with_vectors=LOCAL_SNAPSHOT,
+            limit=256,
+            offset=offset,
+        )
+        for point in batch:
+            payload = point.payload or {}
+            ids.append(str(point.id))
+            texts.append(payload.get(QdrantVectorStore.CONTENT_KEY, ""))
+            metadatas.append(payload.get(QdrantVectorStore.METADATA_KEY) or {})
+            if LOCAL_SNAPSHOT:
+                vector = point.vector
+                if isinstance(vector, dict):  # Named vectors: the collection has a single one
+                    vector = next(iter(vector.values()), None)
+                vectors.append(vector)
+        if offset is None:
+            break
+    BM25Index(ids, texts, metadatas).save(SPARSE_INDEX_PATH, index_version=index_version)
+    print(f"🔤 BM25 index rebuilt over {len(ids)} chunks -> {SPARSE_INDEX_PATH}")
+    controls = ControlIndex(ids, texts, metadatas)
+    controls.save(CONTROL_INDEX_PATH, index_version=index_version)
+    print(f"🔖 Control-ID index rebuilt: {len(controls)} controls in {len(controls.ids)} chunks -> {CONTROL_INDEX_PATH}")
+    if not LOCAL_SNAPSHOT:
+        return
+    snapshot = VectorSnapshot.build(ids, vectors, texts, metadatas, dtype=SNAPSHOT_DTYPE, index_version=index_version)
+    name = snapshot.save(SNAPSHOT_DIR)
+    print(
+        f"🧊 Vector snapshot exported: {len(snapshot)} x {snapshot.vectors.shape[1]} "
+        f"{snapshot.dtype} ({snapshot.vectors.nbytes / (1024 * 1024):.1f} MB) -> {os.path.join(SNAPSHOT_DIR, name)}"
+    )
+
+
+def load_manifest() -> Dict:
+    if not os.path.exists(MANIFEST_FILE):
+        return {"files": {}}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict) -> None:
+    os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
 
-    # CHANGED: Use Google Embeddings
-    print(f"🧠 Initializing Google Gemini Embeddings...")
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its (pool) children, in MB."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+# =============================================================================
+# 3. STREAMING PIPELINE
+# =============================================================================
+#
+#   process pool (parse + split)  ->  embed queue  ->  N embed workers  ->  upsert queue  ->  upserter
+#
+# Both queues are bounded, so a slow embedding API pauses parsing instead of
+# letting chunks pile up in memory.
+
+async def _run_pipeline(
+    files: List[Dict[str, Any]],
+    stored: Dict[str, Optional[str]],
+    embeddings,
+    client: AsyncQdrantClient,
+    stats: Dict[str, float],
+) -> Dict[str, Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=EMBED_CONCURRENCY * 2)
+    upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=EMBED_CONCURRENCY * 2)
+    results = {f["source_file"]: {"pages": {}, "ids": set(), "pending": 0} for f in files}
+
+    async def produce(pool: ProcessPoolExecutor):
+        queued: Set[str] = set()
+        batch: List[Tuple[str, Document]] = []
+        in_flight: Dict[asyncio.Future, Dict[str, Any]] = {}
+        tasks = [
+            (f, pages)
+            for f in files
+            for pages in [f["page_numbers"][i:i + PAGES_PER_TASK] for i in range(0, len(f["page_numbers"]), PAGES_PER_TASK)]
+        ]
+        for f, _ in tasks:
+            results[f["source_file"]]["pending"] += 1
+
+        async def handle(done_future: asyncio.Future):
+            f = in_flight.pop(done_future)
+            pages, chunks = done_future.result()
+            entry = results[f["source_file"]]
+            entry["pages"].update(pages)
+            entry["pending"] -= 1
+            stats["pages"] += len(pages)
+            for point_id, doc in chunks:
+                entry["ids"].add(point_id)
+                stats["chunks"] += 1
+                if point_id in stored or point_id in queued:
+                    continue
+                queued.add(point_id)
+                batch.append((point_id, doc))
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    await embed_queue.put(batch.copy())  # Blocks when the embedders fall behind
+                    batch.clear()
+            if entry["pending"] == 0 and f["cached_pages"] is None:
+                save_page_cache(f["sha256"], entry["pages"])
+
+        # Keep at most 2x workers parse tasks in flight so parsed text stays bounded too
+        for f, page_numbers in tasks:
+            cached = None if f["cached_pages"] is None else {p: f["cached_pages"][p] for p in page_numbers}
+            future = loop.run_in_executor(
+                pool, parse_and_split, f["path"], page_numbers, len(f["page_numbers"]),
+                cached, CHUNK_SIZE, CHUNK_OVERLAP,
+            )
+            in_flight[future] = f
+            if len(in_flight) >= INGEST_WORKERS * 2:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    await handle(finished)
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for finished in done:
+                await handle(finished)
+
+        if batch:
+            await embed_queue.put(batch)
+        for _ in range(EMBED_CONCURRENCY):
+            await embed_queue.put(None)
+
+    async def embed_worker():
+        while True:
+            batch = await embed_queue.get()
+            if batch is None:
+                return
+            vectors = await embeddings.aembed_documents([doc.page_content for _, doc in batch])
+            await upsert_queue.put(list(zip(batch, vectors)))
+
+    async def upsert_worker():
+        while True:
+            items = await upsert_queue.get()
+            if items is None:
+                return
+            await client.upsert(
+                collection_name=COLLECTION_NAME,
+                points=[
+                    models.PointStruct(
+                        id=point_id,
+                        vector=vector,
+                        payload={
+                            QdrantVectorStore.CONTENT_KEY: doc.page_content,
+                            QdrantVectorStore.METADATA_KEY: doc.metadata,
+                        },
+                    )
+                    for (point_id, doc), vector in items
+                ],
+            )
+            stats["upserted"] += len(items)
+
+    async def embed_stage():
+        async with asyncio.TaskGroup() as group:
+            for _ in range(EMBED_CONCURRENCY):
+                group.create_task(embed_worker())
+        await upsert_queue.put(None)
+
+    with ProcessPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce(pool))
+            group.create_task(embed_stage())
+            group.create_task(upsert_worker())
+    return results
+
+
+async def aingest_docs(path: str = DATA_DIR, profile: str = COLLECTION_PROFILE) -> Optional[str]:
+    """
+    Incrementally syncs one PDF, or every PDF in a directory, into the live collection.
+
+    Only chunks whose content-derived ID is not in Qdrant yet are embedded and
+    upserted. Points that no longer correspond to a chunk of the ingested files
+    are deleted afterwards, so search never sees a gap. When a directory is
+    ingested, points from PDFs that were removed from it are deleted as well.
+    Returns the new index version, or None when nothing changed.
+    """
+    qdrant_url = os.getenv("QDRANT_URL")
+    qdrant_key = os.getenv("QDRANT_API_KEY")
+
+    if os.path.isdir(path):
+        pdf_paths = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".pdf")
+        )
+        mirror_directory = True
+    else:
+        pdf_paths = [path]
+        mirror_directory = False
+    if not pdf_paths:
+        print(f"❌ Error: no PDF files found in '{path}'.")
+        return None
+
+    print("🧠 Initializing Google Gemini Embeddings...")
     embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
 
     print("☁️  Connecting to Qdrant Cloud...")
+    client = AsyncQdrantClient(url=qdrant_url, api_key=qdrant_key, prefer_grpc=True)
+    await ensure_collection(client, embeddings, get_profile(profile))
+
+    stored = await existing_points(client)
+    manifest = load_manifest()
+    ingested_files: Set[str] = set()
+    current_ids: Set[str] = set()
+    to_process: List[Dict[str, Any]] = []
+
+    for pdf_path in pdf_paths:
+        source_file = os.path.basename(pdf_path)
+        ingested_files.add(source_file)
+        sha = file_sha256(pdf_path)
+        entry = manifest["files"].get(source_file)
+
+        # Unchanged file and chunking, with all chunks still in Qdrant: nothing to do
+        if (
+            entry
+            and entry["sha256"] == sha
+            and entry.get("chunking") == [CHUNK_SIZE, CHUNK_OVERLAP]
+            and all(i in stored for i in entry["chunk_ids"])
+        ):
+            print(f"⏭️  {source_file}: unchanged ({len(entry['chunk_ids'])} chunks).")
+            current_ids.update(entry["chunk_ids"])
+            continue
+
+        cached_pages = load_page_cache(sha)
+        if cached_pages is not None:
+            print(f"📄 {source_file}: re-chunking {len(cached_pages)} cached pages...")
+        else:
+            print(f"📄 {source_file}: parsing...")
+        page_count = len(cached_pages) if cached_pages is not None else len(PdfReader(pdf_path).pages)
+        to_process.append(
+            {
+                "path": pdf_path,
+                "source_file": source_file,
+                "sha256": sha,
+                "page_numbers": list(range(page_count)),
+                "cached_pages": cached_pages,
+            }
+        )
+
+    stats = {"pages": 0, "chunks": 0, "upserted": 0}
+    started = time.perf_counter()
+    if to_process:
+        results = await _run_pipeline(to_process, stored, embeddings, client, stats)
+        for f in to_process:
+            ids = results[f["source_file"]]["ids"]
+            current_ids.update(ids)
+            manifest["files"][f["source_file"]] = {
+                "sha256": f["sha256"],
+                "pages": len(f["page_numbers"]),
+                "chunks": len(ids),
+                "chunking": [CHUNK_SIZE, CHUNK_OVERLAP],
+                "chunk_ids": sorted(ids),
+                "indexed_at": datetime.now(timezone.utc).isoformat(),
+            }
+    elapsed = time.perf_counter() - started
+    if stats["pages"]:
+        print(
+            f"📈 {stats['pages']} pages ({stats['pages'] / elapsed:.1f} pages/s), "
+            f"{stats['chunks']} chunks ({stats['chunks'] / elapsed:.1f} chunks/s), "
+            f"{stats['upserted']} embedded & upserted, peak RSS {peak_rss_mb():.0f} MB"
+        )
 
-    # Force Recreation of Collection (to fix dimension mismatch)
-    QdrantVectorStore.from_documents(
-        splits,
-        embeddings,
-        url=qdrant_url,
-        api_key=qdrant_key,
+    # --- Prune points that no longer belong to any ingested chunk ---
+    stale = [
+        point_id
+        for point_id, source_file in stored.items()
+        if point_id not in current_ids and (mirror_directory or source_file in ingested_files)
+    ]
+    if stale:
+        print(f"🗑️  Deleting {len(stale)} stale chunks...")
+        await client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=stale),
+        )
+    if mirror_directory:
+        for source_file in list(manifest["files"]):
+            if source_file not in ingested_files:
+                del manifest["files"][source_file]
+
+    added = stats["upserted"]
+    if not added and not stale:
+        save_manifest(manifest)
+        local_indexes = [SPARSE_INDEX_PATH, CONTROL_INDEX_PATH]
+        if LOCAL_SNAPSHOT:
+            local_indexes.append(os.path.join(SNAPSHOT_DIR, CURRENT_FILE))
+        if not all(os.path.exists(path) for path in local_indexes):
+            await build_local_indexes(client, manifest.get("index_version"))
+        print("✅ Index already up to date.")
+        return None
+
+    # Stamp the collection so running servers drop answers cached against the old index
+    index_version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}"
+    await client.update_collection(
         collection_name=COLLECTION_NAME,
-        prefer_grpc=True,
-        force_recreate=True,  # <--- IMPORTANT: Overwrites the old incompatible vectors
+        metadata={INDEX_VERSION_KEY: index_version},
     )
-    print("✅ Ingestion Complete! New Google vectors stored.")
+    manifest.update(
+        {
+            "collection": COLLECTION_NAME,
+            "index_version": index_version,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+    )
+    save_manifest(manifest)
+    await build_local_indexes(client, index_version)
+    print(f"✅ Ingestion Complete! +{added} / -{len(stale)} chunks (index version {index_version}).")
+    return index_version
+
+
+def ingest_docs(path: str = DATA_DIR, profile: str = COLLECTION_PROFILE) -> Optional[str]:
+    return asyncio.run(aingest_docs(path, profile))
 
 
 if __name__ == "__main__":
-    ingest_docs()
+    parser = argparse.ArgumentParser(description="Incrementally ingest policy PDFs into Qdrant.")
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=DATA_DIR,
+        help="A PDF file, or a directory whose PDFs are mirrored into the collection (default: data/).",
+    )
+    parser.add_argument(
+        "--profile",
+        default=COLLECTION_PROFILE,
+        help="Collection profile: default, accurate, scalar or binary (default: $COLLECTION_PROFILE).",
+    )
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        print(f"❌ Error: '{args.path}' not found.")
+        sys.exit(1)
+    ingest_docs(args.path, args.profile)
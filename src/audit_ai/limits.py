@@ -0,0 +1,151 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Dict, Optional
+
+from langchain_core.language_models import BaseChatModel
+
+from audit_ai import metrics
+
+
+class UpstreamLimiter:
+    """
+    Bounds the calls in flight to one upstream (LLM, embeddings, Qdrant) across all
+    requests of the process, so a traffic spike queues here instead of turning into
+    rate-limit errors upstream. `limit <= 0` means unbounded (still counted).
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        if self._semaphore is not None:
+            self.waiting += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        metrics.UPSTREAM_WAIT.labels(self.name).observe(time.perf_counter() - started)
+        self.in_flight += 1
+        metrics.UPSTREAM_IN_FLIGHT.labels(self.name).inc()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            metrics.UPSTREAM_IN_FLIGHT.labels(self.name).dec()
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+class BoundedChatModel(BaseChatModel):
+    """
+    Passes every call through to `model` while holding a slot of `limiter`.
+    A streamed call keeps its slot until the last chunk. Sync calls are not bounded.
+    """
+
+    model: BaseChatModel
+    limiter: Any  # UpstreamLimiter
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        return self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        async with self.limiter.acquire():
+            return await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        async with self.limiter.acquire():
+            async for chunk in self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+
+
+class Overloaded(Exception):
+    """A request shed by admission control, with the HTTP status to answer it with."""
+
+    def __init__(self, status_code: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Lets at most `max_in_flight` requests run at once. Up to `max_queue` more wait
+    for a slot (first come, first served) for at most `queue_timeout` seconds.
+    Anything beyond is shed immediately: 429 when the queue is full, 503 when
+    the wait runs out. `max_in_flight <= 0` admits everything.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "queue_timeout": 0}
+
+    async def acquire(self) -> None:
+        """Waits for a slot or raises Overloaded. Every successful call needs one `release()`."""
+        if self._slots is not None:
+            if self._slots.locked() and self.queued >= self.max_queue:
+                self._shed("queue_full")
+                raise Overloaded(429, "Too many requests queued, retry shortly.")
+
+            started = time.perf_counter()
+            self.queued += 1
+            metrics.ADMISSION_QUEUE_DEPTH.set(self.queued)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._shed("queue_timeout")
+                raise Overloaded(503, "Server busy, no capacity freed up in time.") from None
+            finally:
+                self.queued -= 1
+                metrics.ADMISSION_QUEUE_DEPTH.set(self.queued)
+            metrics.ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - started)
+
+        self.in_flight += 1
+        self.admitted += 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        if self._slots is not None:
+            self._slots.release()
+
+    def _shed(self, reason: str) -> None:
+        self.shed[reason] += 1
+        metrics.SHED_REQUESTS.labels(reason).inc()
+        print(f"---SHED: {reason} ({self.in_flight} running, {self.queued} queued)---")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+        }
+
+
+def limiter_context(limiter: Optional[UpstreamLimiter]):
+    """`limiter.acquire()`, or a no-op when there is no limiter."""
+    return limiter.acquire() if limiter is not None else nullcontext()
@@ -1,20 +1,74 @@
 import os
 import json
+import time
 import asyncio
-from typing import List, Optional, Dict, Any
+import statistics
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional, Dict, Any, Set
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 # Import the graph AND the router logic
-from audit_ai.engine import app as audit_graph, route_query, run_chat_logic
+from audit_ai.engine import (
+    get_graph,
+    answer_documents,
+    get_embeddings,
+    init_components,
+    aprewarm,
+    aroute_with_session,
+    acondense_question,
+    aremember_session,
+    session_store,
+    astream_chat_logic,
+    acache_lookup,
+    cache_store,
+    is_refusal,
+    answer_cache,
+    speculation_stats,
+    score_gate_stats,
+    graph_inputs,
+    graph_config,
+    upstream_limits,
+    aprocess_batch,
+    get_local_snapshot,
+    local_snapshot_stats,
+)
+from audit_ai.config import (
+    PREWARM_CONNECTIONS,
+    COALESCE_REQUESTS,
+    BATCH_MAX_QUESTIONS,
+    LOCAL_SNAPSHOT,
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
+from audit_ai.coalescing import SingleFlight, request_key
+from audit_ai.limits import AdmissionController, Overloaded
+from audit_ai import metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Builds the engine components once at startup (and optionally opens their connections)."""
+    started = time.perf_counter()
+    # Building the clients and compiling the graph is blocking work: keep it off the event loop
+    await asyncio.to_thread(init_components)
+    if PREWARM_CONNECTIONS:
+        await aprewarm()
+    print(f"---STARTUP: {(time.perf_counter() - started) * 1000:.0f} ms (prewarm {'on' if PREWARM_CONNECTIONS else 'off'})---")
+    yield
+
 
 app = FastAPI(
     title="AuditAI Agent API",
     description="A Streaming Agentic RAG API for NIST Compliance",
     version="2.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -26,40 +80,216 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Accepts or assigns an X-Request-ID and exposes it to the engine via a contextvar."""
+    request_id = request.headers.get("X-Request-ID") or metrics.new_request_id()
+    token = metrics.request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 class ChatRequest(BaseModel):
     query: str
+    # Earlier turns ({"role": "user" | "assistant", "content": ...}), used to condense follow-ups
     history: Optional[List[Dict[str, str]]] = []
+    # Only search these documents (file names as ingested, e.g. "acme_policy.pdf")
+    source_files: Optional[List[str]] = None
+    # Identifies the conversation: follow-ups can reuse the chunks its earlier turns retrieved
+    session_id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    # An audit checklist: each question is answered independently (no history, no session)
+    questions: List[str]
+    source_files: Optional[List[str]] = None
+
+
+def format_sources(documents) -> List[Dict[str, Any]]:
+    return [
+        {
+            "file": d.metadata.get("source_file", "NIST CSF 2.0"),
+            "page": d.metadata.get("page", 0),
+            "text": d.page_content[:200] + "...",
+        }
+        for d in documents
+    ]
+
+
+# Time to first token per path, over the most recent requests
+ttft_samples = {path: deque(maxlen=1000) for path in ("cache", "chat", "search")}
+
+
+def record_ttft(path: str, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    ttft_samples[path].append(elapsed * 1000)
+    metrics.TTFT.labels(path).observe(elapsed)
+    print(f"---TTFT: {elapsed * 1000:.0f} ms ({path}) [{metrics.request_id_var.get()}]---")
+
+
+def record_latency(path: str, started: float) -> None:
+    metrics.REQUEST_LATENCY.labels(path).observe(time.perf_counter() - started)
+
+
+def percentile_95(ordered: List[float]) -> float:
+    """Interpolated p95, so it never falls below the median on small samples."""
+    if len(ordered) < 2:
+        return ordered[0] if ordered else 0.0
+    return statistics.quantiles(ordered, n=20, method="inclusive")[-1]
+
+
+def ttft_stats() -> Dict[str, Any]:
+    summary = {}
+    for path, samples in ttft_samples.items():
+        ordered = sorted(samples)
+        summary[path] = {
+            "count": len(ordered),
+            "p50_ms": statistics.median(ordered) if ordered else 0.0,
+            "p95_ms": percentile_95(ordered),
+        }
+    return summary
+
+
+def snapshot_stats() -> Dict[str, Any]:
+    snapshot = get_local_snapshot() if LOCAL_SNAPSHOT else None
+    return {"enabled": LOCAL_SNAPSHOT, "searches": local_snapshot_stats, **(snapshot.stats() if snapshot else {})}
+
+
+async def replay_cached_answer(hit):
+    """Replays a cached answer through the same NDJSON token/sources protocol as a live run."""
+    for token in hit.answer.split(" "):
+        payload = json.dumps({"type": "token", "content": token + " "})
+        yield f"{payload}\n"
+
+    sources = [] if is_refusal(hit.answer) else format_sources(hit.documents)
+    payload = json.dumps({"type": "sources", "content": sources})
+    yield f"{payload}\n"
+
+
+# In-flight pipeline runs, shared by concurrent requests for the same question
+flights = SingleFlight()
+
+# Work that outlives its response (strong references, so the tasks are not garbage collected)
+background_tasks: Set[asyncio.Task] = set()
+
+
+def run_in_background(coroutine) -> None:
+    def settle(task: asyncio.Task) -> None:
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Background Task Error: {task.exception()}")
+
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(settle)
+
+# Caps the /chat requests running at once; a bounded queue waits for slots, the rest is shed
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SECONDS)
 
 
-async def run_agent_stream(query: str):
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that cancels its generator as soon as the client disconnects,
+    also while nothing is being sent (retrieval, grading, rewrites), and then calls
+    `on_close` however the response ended.
+    """
+
+    def __init__(self, content, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        stream = asyncio.create_task(self.stream_response(send))
+        disconnect = asyncio.create_task(self._wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if not stream.done():
+                metrics.CLIENT_DISCONNECTS.inc()
+                print(f"---CLIENT DISCONNECTED: run cancelled [{metrics.request_id_var.get()}]---")
+        finally:
+            for task in (stream, disconnect):
+                task.cancel()
+            await asyncio.gather(stream, disconnect, return_exceptions=True)
+            # A generator cancelled between two chunks is closed here rather than by the GC
+            await self.body_iterator.aclose()
+            if self.on_close is not None:
+                self.on_close()
+
+        # Failing to send to a client that has gone away is a disconnect, not an error
+        if not stream.cancelled() and not isinstance(stream.exception(), (OSError, type(None))):
+            raise stream.exception()
+
+    @staticmethod
+    async def _wait_for_disconnect(receive) -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+
+async def run_pipeline_stream(
+    query: str,
+    source_files: Optional[List[str]] = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    session_id: Optional[str] = None,
+):
     """
     Robust Generator: Streams text and conditionally filters sources if the AI doesn't know the answer.
     """
+    started = time.perf_counter()
 
-    # --- 1. ROUTER (Fast Path) ---
-    intent = route_query(query)
+    # Follow-ups ("what about Detect?") become standalone questions before anything else sees them
+    query = await acondense_question(query, history)
+
+    # --- 0. SEMANTIC CACHE (Near-duplicate questions skip everything) ---
+    # Answers limited to some documents are neither served from nor stored in the cache
+    query_embedding, hit = await acache_lookup(query) if not source_files else (None, None)
+    if hit:
+        record_ttft("cache", started)
+        async for line in replay_cached_answer(hit):
+            yield line
+        record_latency("cache", started)
+        await aremember_session(session_id, hit.documents)
+        return
+
+    # --- 1. ROUTER (Fast Path), with retrieval started speculatively alongside it ---
+    # A follow-up covered by the session's earlier chunks skips routing, retrieval and the grader
+    intent, prefetched, prefetched_decision = await aroute_with_session(query, session_id, source_files)
 
     if intent == "chat":
-        response = run_chat_logic(query)
-        answer_text = response["answer"]
-        tokens = answer_text.split(" ")
-        for token in tokens:
-            payload = json.dumps({"type": "token", "content": token + " "})
-            yield f"{payload}\n"
-            await asyncio.sleep(0.05)
+        first_token = True
+        try:
+            async for token in astream_chat_logic(query):
+                if first_token:
+                    record_ttft("chat", started)
+                    first_token = False
+                payload = json.dumps({"type": "token", "content": token})
+                yield f"{payload}\n"
+        except Exception as e:
+            print(f"Chat Error: {e}")
+            err_payload = json.dumps({"type": "token", "content": f"\n[System Error: {str(e)}]"})
+            yield f"{err_payload}\n"
         # Chat intent implies no sources
         payload = json.dumps({"type": "sources", "content": []})
         yield f"{payload}\n"
+        record_latency("chat", started)
         return
 
     # --- 2. GRAPH (Search Path) ---
-    captured_sources = []
+    captured_documents = []
     full_answer_accumulator = ""  # Track the full answer to check for "I don't know"
+    first_token = True
+    relevant_documents = []
+    grader_latency_ms = 0.0
+    grader_calls = 0
+    failed = False
 
     try:
         # Stream events from the graph
-        async for event in audit_graph.astream_events(
-            {"question": query}, version="v1"
+        async for event in get_graph().astream_events(
+            graph_inputs(query, prefetched, source_files, prefetched_decision), config=graph_config(), version="v2"
         ):
             kind = event["event"]
             data = event.get("data", {})
@@ -67,15 +297,14 @@ async def run_agent_stream(query: str):
             # A. Capture Sources (When retrieval finishes)
             if kind == "on_chain_end" and event.get("name") == "retrieve":
                 if "output" in data and data["output"]:
-                    docs = data["output"].get("documents", [])
-                    captured_sources = [
-                        {
-                            "file": d.metadata.get("source_file", "NIST CSF 2.0"),
-                            "page": d.metadata.get("page", 0),
-                            "text": d.page_content[:200] + "...",
-                        }
-                        for d in docs
-                    ]
+                    captured_documents = data["output"].get("documents", [])
+
+            # Track grader latency, calls and relevant chunks (accumulated across rewrite loops)
+            if kind == "on_chain_end" and event.get("name") == "grade_documents":
+                if "output" in data and data["output"]:
+                    grader_latency_ms = data["output"].get("grader_latency_ms", grader_latency_ms)
+                    grader_calls = data["output"].get("grader_calls", grader_calls)
+                    relevant_documents = data["output"].get("relevant_documents", relevant_documents)
 
             # B. Capture Tokens
             if "chunk" in data:
@@ -91,59 +320,170 @@ async def run_agent_stream(query: str):
                     content = chunk["content"]
 
                 if content:
+                    if first_token:
+                        record_ttft("search", started)
+                        first_token = False
                     full_answer_accumulator += content  # Accumulate text
                     payload = json.dumps({"type": "token", "content": content})
                     yield f"{payload}\n"
 
     except Exception as e:
+        failed = True
         print(f"Graph Error: {e}")
         err_payload = json.dumps(
             {"type": "token", "content": f"\n[System Error: {str(e)}]"}
         )
         yield f"{err_payload}\n"
 
-    # --- 3. SMART SOURCE FILTERING ---
-    # We defined standard refusal phrases in the prompt. If the AI says them, we hide sources.
-    refusal_phrases = [
-        "missing from the database",
-        "does not mention",
-        "cannot answer",
-        "no information",
-        "context does not contain",
-        "not mentioned in the provided documents",
-    ]
+    print(f"---GRADER: {grader_calls} calls, {grader_latency_ms:.0f} ms---")
+    # Chunks found relevant on an earlier rewrite pass are part of the answer's sources
+    captured_documents = answer_documents(relevant_documents, captured_documents)
 
-    is_refusal = any(
-        phrase in full_answer_accumulator.lower() for phrase in refusal_phrases
-    )
+    # Refusals are not cached (cache_store skips them)
+    if not failed:
+        cache_store(query, query_embedding, full_answer_accumulator, captured_documents)
 
-    if is_refusal:
+    # --- 3. SMART SOURCE FILTERING ---
+    refused = is_refusal(full_answer_accumulator)
+    if refused:
         # If the AI admitted it doesn't know, send ZERO sources.
         payload = json.dumps({"type": "sources", "content": []})
     else:
         # Otherwise, send the retrieved sources.
-        payload = json.dumps({"type": "sources", "content": captured_sources})
+        payload = json.dumps({"type": "sources", "content": format_sources(captured_documents)})
 
     yield f"{payload}\n"
+    record_latency("search", started)
+
+    # Follow-ups in this session may be answered from the same chunks. Fetching their vectors
+    # can take a Qdrant round trip, which must not hold the response (or its followers) open.
+    if not failed and not refused:
+        run_in_background(aremember_session(session_id, captured_documents))
 
 
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
-    return StreamingResponse(
-        run_agent_stream(request.query), media_type="application/x-ndjson"
+    if not COALESCE_REQUESTS:
+        stream = run_pipeline_stream(request.query, request.source_files, request.history, request.session_id)
+        try:
+            await admission.acquire()
+        except Overloaded as e:
+            await stream.aclose()
+            raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": "1"})
+        return DisconnectAwareStreamingResponse(stream, on_close=admission.release, media_type="application/x-ndjson")
+
+    key = request_key(request.query, request.source_files, request.history, request.session_id)
+
+    # Joining a run already in flight costs no upstream calls, so it needs no slot
+    subscription = flights.join(key)
+    if subscription is None:
+        try:
+            await admission.acquire()
+        except Overloaded as e:
+            raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": "1"})
+        # An identical request may have started a run while this one queued
+        subscription = flights.join(key)
+        if subscription is not None:
+            admission.release()
+        else:
+            # The slot belongs to the run: it is freed when the run ends, not when this client leaves
+            subscription = flights.start(
+                key,
+                lambda: run_pipeline_stream(request.query, request.source_files, request.history, request.session_id),
+                on_done=admission.release,
+            )
+    return DisconnectAwareStreamingResponse(
+        flights.stream(subscription), on_close=lambda: flights.leave(subscription), media_type="application/x-ndjson"
     )
 
 
+async def run_batch_stream(questions: List[str], source_files: Optional[List[str]] = None):
+    """
+    Streams one NDJSON 'result' line per question, in the order they finish
+    (`index` points back into the checklist), then a closing 'done' line.
+    """
+    started = time.perf_counter()
+    failed = 0
+    results = aprocess_batch(questions, source_files)
+    try:
+        async for index, result in results:
+            answer = result["answer"]
+            if result.get("error"):
+                outcome = "failed"
+                failed += 1
+            else:
+                outcome = "cached" if result.get("cached") else "answered"
+            metrics.BATCH_QUESTIONS.labels(outcome).inc()
+            # Same rule as /chat: a refusal comes without sources
+            documents = [] if is_refusal(answer) else result.get("documents", [])
+            payload = json.dumps(
+                {
+                    "type": "result",
+                    "index": index,
+                    "question": questions[index],
+                    "answer": answer,
+                    "sources": format_sources(documents),
+                    "cached": bool(result.get("cached")),
+                    "error": bool(result.get("error")),
+                }
+            )
+            yield f"{payload}\n"
+    finally:
+        # Cancels the questions still running when the client goes away
+        await results.aclose()
+
+    elapsed = time.perf_counter() - started
+    record_latency("batch", started)
+    print(f"---BATCH: {len(questions)} questions in {elapsed * 1000:.0f} ms ({failed} failed)---")
+    payload = json.dumps({"type": "done", "questions": len(questions), "failed": failed, "latency_ms": elapsed * 1000})
+    yield f"{payload}\n"
+
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchRequest):
+    if not request.questions:
+        raise HTTPException(status_code=422, detail="The batch has no questions.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=422, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+
+    # A batch is one admitted request: its own concurrency is bounded by BATCH_CONCURRENCY
+    try:
+        await admission.acquire()
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": "1"})
+    stream = run_batch_stream(request.questions, request.source_files)
+    return DisconnectAwareStreamingResponse(stream, on_close=admission.release, media_type="application/x-ndjson")
+
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "semantic_cache": answer_cache.stats(),
+        "embedding_cache": get_embeddings().stats(),
+        "speculation": speculation_stats,
+        "score_gate": score_gate_stats,
+        "ttft": ttft_stats(),
+        "coalescing": flights.stats(),
+        "sessions": session_store.stats(),
+        "local_snapshot": snapshot_stats(),
+        "admission": admission.stats(),
+        "upstreams": {name: limiter.stats() for name, limiter in upstream_limits.items()},
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    if not os.getenv("GROQ_API_KEY"):
-        print("❌ Error: GROQ_API_KEY is missing!")
     if not os.getenv("GOOGLE_API_KEY"):
         print("❌ Error: GOOGLE_API_KEY is missing!")
     else:
@@ -0,0 +1,205 @@
+import time
+import uuid
+import asyncio
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import Counter, Gauge, Histogram
+
+# Every request gets an ID (X-Request-ID), visible to anything running in its context
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# --- Graph ---
+NODE_LATENCY = Histogram(
+    "auditai_node_latency_seconds", "Latency of each LangGraph node.", ["node"], buckets=LATENCY_BUCKETS
+)
+NODE_ERRORS = Counter("auditai_node_errors_total", "LangGraph node failures.", ["node"])
+GRAPH_RETRIES = Counter("auditai_graph_retries_total", "Query rewrites (transform_query loops).")
+
+# --- Upstream Calls ---
+LLM_LATENCY = Histogram(
+    "auditai_llm_latency_seconds", "Latency of LLM calls by role.", ["role"], buckets=LATENCY_BUCKETS
+)
+LLM_CALLS = Counter("auditai_llm_calls_total", "LLM calls by role and outcome.", ["role", "outcome"])
+LLM_TOKENS = Counter("auditai_llm_tokens_total", "LLM tokens by role and direction.", ["role", "direction"])
+EMBEDDING_LATENCY = Histogram(
+    "auditai_embedding_latency_seconds", "Latency of embedding model calls (cache misses only).", buckets=LATENCY_BUCKETS
+)
+EMBEDDING_TEXTS = Counter("auditai_embedding_texts_total", "Texts sent to the embedding model.")
+QDRANT_LATENCY = Histogram(
+    "auditai_qdrant_latency_seconds", "Latency of Qdrant requests.", ["operation"], buckets=LATENCY_BUCKETS
+)
+QDRANT_ERRORS = Counter("auditai_qdrant_errors_total", "Failed Qdrant requests.", ["operation"])
+
+# --- Local Vector Snapshot ---
+LOCAL_SEARCH_LATENCY = Histogram(
+    "auditai_local_search_latency_seconds",
+    "Latency of dense searches on the local vector snapshot.",
+    buckets=(0.0005, 0.001, 0.0025) + LATENCY_BUCKETS,
+)
+LOCAL_SEARCHES = Counter(
+    "auditai_local_searches_total",
+    "Dense searches meant for the local snapshot: 'hit' served locally, 'stale' (older index version) and 'error' went to Qdrant.",
+    ["outcome"],
+)
+
+# --- Requests ---
+TTFT = Histogram(
+    "auditai_ttft_seconds", "Time to first streamed token, by path.", ["path"], buckets=LATENCY_BUCKETS
+)
+REQUEST_LATENCY = Histogram(
+    "auditai_request_latency_seconds", "End-to-end /chat latency, by path.", ["path"], buckets=LATENCY_BUCKETS
+)
+
+# --- Score Gate Calibration ---
+GRADED_CHUNK_SCORES = Histogram(
+    "auditai_graded_chunk_score",
+    "Dense similarity of each chunk the LLM grader judged, by verdict (calibrates SCORE_*_THRESHOLD).",
+    ["verdict"],
+    buckets=tuple(round(0.3 + 0.05 * i, 2) for i in range(15)),
+)
+
+# --- Control-ID Lookup ---
+CONTROL_LOOKUPS = Counter(
+    "auditai_control_lookups_total", "Questions answered from the control-ID index (no embedding, search or grader)."
+)
+
+# --- Batch Audits ---
+BATCH_QUESTIONS = Counter(
+    "auditai_batch_questions_total", "Questions answered through /chat/batch, by outcome.", ["outcome"]
+)
+
+# --- Request Coalescing ---
+COALESCED_REQUESTS = Counter(
+    "auditai_coalesced_requests_total",
+    "Streamed /chat requests by single-flight role: 'leader' runs the pipeline, 'follower' attaches to it.",
+    ["role"],
+)
+FLIGHT_SUBSCRIBERS = Histogram(
+    "auditai_flight_subscribers", "Requests served by one pipeline run.", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+# --- Admission Control ---
+ADMISSION_QUEUE_DEPTH = Gauge("auditai_admission_queue_depth", "Requests waiting for a slot.")
+ADMISSION_IN_FLIGHT = Gauge("auditai_admission_in_flight", "Admitted requests currently running.")
+ADMISSION_QUEUE_WAIT = Histogram(
+    "auditai_admission_queue_wait_seconds", "Time admitted requests waited for a slot.", buckets=LATENCY_BUCKETS
+)
+SHED_REQUESTS = Counter(
+    "auditai_shed_requests_total", "Requests rejected by admission control: 'queue_full' (429), 'queue_timeout' (503).", ["reason"]
+)
+CLIENT_DISCONNECTS = Counter(
+    "auditai_client_disconnects_total", "Streams cancelled because the client disconnected before the end."
+)
+UPSTREAM_IN_FLIGHT = Gauge("auditai_upstream_in_flight", "Calls in flight per upstream.", ["upstream"])
+UPSTREAM_WAIT = Histogram(
+    "auditai_upstream_wait_seconds", "Time calls waited for an upstream concurrency slot.", ["upstream"], buckets=LATENCY_BUCKETS
+)
+
+# --- Conversation Sessions ---
+SESSION_LOOKUPS = Counter(
+    "auditai_session_lookups_total",
+    "Follow-ups checked against their session's documents: 'hit' skips retrieval and grading.",
+    ["outcome"],
+)
+
+# Tags the engine puts on its LLM calls; anything else is reported as 'other'
+LLM_ROLES = ("router", "grader", "rewriter", "condenser", "generator", "chat")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def timed_node(name: str, func):
+    """Wraps an async LangGraph node so its latency and failures are recorded."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            NODE_ERRORS.labels(name).inc()
+            raise
+        finally:
+            NODE_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+@contextmanager
+def track_qdrant(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        QDRANT_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        QDRANT_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+def observe_embedding(texts: int, seconds: float) -> None:
+    EMBEDDING_TEXTS.inc(texts)
+    EMBEDDING_LATENCY.observe(seconds)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Records latency, call counts and token usage of every LLM call.
+    Attached to the model itself, so router, grader, rewrite, generation and chat
+    calls are all covered. Runs inline on the event loop (no executor hop).
+    """
+
+    run_inline = True
+    ignore_chain = True
+    ignore_retriever = True
+    ignore_agent = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, Any] = {}
+
+    def _start(self, run_id: UUID, tags: Optional[list]) -> None:
+        role = next((tag for tag in (tags or []) if tag in LLM_ROLES), "other")
+        self._runs[run_id] = (role, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags=None, **kwargs: Any) -> None:
+        self._start(run_id, tags)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, tags=None, **kwargs: Any) -> None:
+        self._start(run_id, tags)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        role, started = run
+        LLM_LATENCY.labels(role).observe(time.perf_counter() - started)
+        LLM_CALLS.labels(role, "ok").inc()
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.labels(role, "input").inc(usage.get("input_tokens", 0))
+                    LLM_TOKENS.labels(role, "output").inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        role, started = run
+        LLM_LATENCY.labels(role).observe(time.perf_counter() - started)
+        # Graders cancelled by the early exit are not upstream failures
+        outcome = "cancelled" if isinstance(error, asyncio.CancelledError) else "error"
+        LLM_CALLS.labels(role, outcome).inc()
+
+
+llm_metrics_handler = LLMMetricsHandler()
@@ -0,0 +1,170 @@
+import json
+from typing import Dict, List, Literal, Optional, Tuple
+
+import numpy as np
+
+from audit_ai.cache import CachedEmbeddings
+
+Intent = Literal["chat", "search"]
+
+# Labelled utterances the query embedding is compared against.
+# Override with ROUTER_EXAMPLES_FILE (JSON: {"chat": [...], "search": [...]}).
+DEFAULT_ROUTER_EXAMPLES: Dict[str, List[str]] = {
+    "chat": [
+        "hello",
+        "hi there",
+        "good morning",
+        "hey, how are you?",
+        "thanks for the help",
+        "thank you, bye",
+        "who are you?",
+        "what is your name?",
+        "what can you do?",
+        "how can you help me?",
+        "are you a bot?",
+        "tell me a joke",
+        "what's the weather like today?",
+        "who won the football game last night?",
+        "how do I train my dog?",
+        "what is the best way to paint a wall?",
+        "recommend me a movie",
+        "asdfgh",
+        "can you write me a poem?",
+        "what time is it?",
+    ],
+    "search": [
+        "What are the six functions of the NIST CSF 2.0?",
+        "What is the purpose of the Govern function?",
+        "Explain the Identify function in the cybersecurity framework",
+        "What outcomes does the Protect function cover?",
+        "How does the Detect function work?",
+        "What activities are part of the Respond function?",
+        "What does the Recover function include?",
+        "What is a CSF Organizational Profile?",
+        "What are the CSF implementation tiers?",
+        "What does GV.SC-04 require for supply chain risk management?",
+        "Which subcategories cover identity management and access control?",
+        "How should we manage cybersecurity supply chain risk?",
+        "Does our access control policy meet NIST requirements?",
+        "Audit our incident response plan against the framework",
+        "What does the policy say about multi-factor authentication?",
+        "How often must backups be tested according to the policy?",
+        "What are the requirements for asset inventory?",
+        "How should vulnerabilities be prioritized and remediated?",
+        "What roles and responsibilities does the framework define for cybersecurity?",
+        "What is the difference between a current profile and a target profile?",
+        "Is our data retention policy compliant with NIST CSF?",
+        "What does the framework say about continuous monitoring?",
+    ],
+}
+
+
+def load_router_examples(path: Optional[str]) -> Dict[str, List[str]]:
+    if not path:
+        return DEFAULT_ROUTER_EXAMPLES
+    with open(path, "r", encoding="utf-8") as f:
+        examples = json.load(f)
+    for intent in ("chat", "search"):
+        if not examples.get(intent):
+            raise ValueError(f"Router examples file '{path}' needs a non-empty '{intent}' list")
+    return examples
+
+
+class EmbeddingRouter:
+    """
+    Classifies intent locally from the query embedding.
+
+    'centroid' compares the query with the mean embedding of each intent's
+    examples; 'knn' scores each intent by its share of the `k` nearest
+    examples. The confidence is the score margin between the two intents.
+    Below `threshold` the router abstains (returns None) so the caller can
+    fall back to the LLM router.
+    """
+
+    def __init__(
+        self,
+        embeddings: CachedEmbeddings,
+        examples: Dict[str, List[str]],
+        threshold: float,
+        strategy: Literal["centroid", "knn"] = "centroid",
+        k: int = 5,
+    ):
+        self.embeddings = embeddings
+        self.examples = examples
+        self.threshold = threshold
+        self.strategy = strategy
+        self.k = k
+
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None      # One normalized row per example
+        self._centroids: Optional[np.ndarray] = None   # One normalized row per intent
+        self._intents: List[str] = list(examples.keys())
+
+    # --- Example Embeddings (built once, on first use) ---
+    # Embedded as queries (RETRIEVAL_QUERY), like the queries they are compared with
+
+    def _build(self, vectors: List[List[float]]) -> None:
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+        labels = np.array(self._labels)
+        centroids = np.vstack([matrix[labels == intent].mean(axis=0) for intent in self._intents])
+        self._centroids = self._normalize(centroids)
+        self._matrix = matrix
+
+    def _texts(self) -> List[str]:
+        self._labels = [intent for intent in self._intents for _ in self.examples[intent]]
+        return [text for intent in self._intents for text in self.examples[intent]]
+
+    def _ensure_built(self) -> None:
+        if self._matrix is None:
+            self._build([self.embeddings.embed_query(text) for text in self._texts()])
+
+    async def _aensure_built(self) -> None:
+        if self._matrix is None:
+            self._build(await self.embeddings.aembed_queries(self._texts()))
+
+    async def aprepare(self) -> None:
+        """Embeds the examples now rather than on the first query."""
+        await self._aensure_built()
+
+    # --- Classification ---
+
+    def _scores(self, query_vector: List[float]) -> Dict[str, float]:
+        query = self._normalize(np.asarray(query_vector, dtype=np.float32))
+
+        if self.strategy == "knn":
+            similarities = self._matrix @ query
+            nearest = np.argsort(similarities)[::-1][: self.k]
+            scores = {intent: 0.0 for intent in self._intents}
+            for i in nearest:
+                scores[self._labels[i]] += float(similarities[i]) / len(nearest)
+            return scores
+
+        similarities = self._centroids @ query
+        return {intent: float(similarities[i]) for i, intent in enumerate(self._intents)}
+
+    def _decide(self, scores: Dict[str, float]) -> Tuple[Optional[Intent], float]:
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        confidence = ranked[0][1] - ranked[1][1]
+        if confidence < self.threshold:
+            return None, confidence
+        return ranked[0][0], confidence
+
+    def classify(self, query: str) -> Tuple[Optional[Intent], float]:
+        """Returns (intent, confidence); the intent is None when the router abstains."""
+        self._ensure_built()
+        return self._decide(self._scores(self.embeddings.embed_query(query)))
+
+    async def aclassify(self, query: str) -> Tuple[Optional[Intent], float]:
+        await self._aensure_built()
+        return self._decide(self._scores(await self.embeddings.aembed_query(query)))
+
+    async def aclassify_vectors(self, query_vectors: List[List[float]]) -> List[Tuple[Optional[Intent], float]]:
+        """`aclassify` for queries that are already embedded (e.g. a whole batch in one call)."""
+        await self._aensure_built()
+        return [self._decide(self._scores(vector)) for vector in query_vectors]
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+@dataclass
+class _SessionDocument:
+    document: Document
+    vector: np.ndarray  # Normalized chunk embedding, as stored in Qdrant
+    size_bytes: int
+
+
+@dataclass
+class Session:
+    """Chunks retrieved for a conversation's recent turns, most recently used last."""
+
+    documents: "OrderedDict[str, _SessionDocument]" = field(default_factory=OrderedDict)
+    updated_at: float = 0.0
+    size_bytes: int = 0
+    # Stacked vectors of `documents` (rebuilt lazily after writes)
+    _matrix: Optional[np.ndarray] = None
+    _matrix_keys: List[str] = field(default_factory=list)
+
+
+class SessionStore:
+    """
+    Per-session cache of the chunks recent turns were answered from.
+
+    A follow-up whose (condensed) question is close enough to some of those
+    chunks can be answered from them without a new search. Each session keeps at
+    most `max_documents` chunks (oldest dropped first). Whole sessions are evicted
+    LRU-first beyond `max_sessions` or `max_bytes`, and expire after `ttl_seconds`
+    of inactivity. Everything is dropped when the index version changes.
+    """
+
+    def __init__(self, threshold: float, margin: float, max_documents: int, max_sessions: int, ttl_seconds: float, max_bytes: int):
+        self.threshold = threshold
+        self.margin = margin
+        self.max_documents = max_documents
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self._index_version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- Lookup / Store ---
+
+    def lookup(
+        self,
+        session_id: str,
+        embedding: List[float],
+        source_files: Optional[List[str]] = None,
+        index_version: Optional[str] = None,
+    ) -> Optional[Tuple[List[Document], List[float]]]:
+        """
+        The session's chunks scoring within `margin` of the best one (best first), if the
+        best scores at least `threshold`. Otherwise None: the question needs a real search.
+        """
+        self._check_version(index_version)
+        session = self._touch(session_id)
+        if session is None or not session.documents:
+            self.misses += 1
+            return None
+
+        matrix, keys = self._stacked(session)
+        similarities = matrix @ self._normalize(embedding)
+        if source_files:
+            allowed = np.array([session.documents[k].document.metadata.get("source_file") in source_files for k in keys])
+            similarities = np.where(allowed, similarities, -np.inf)
+
+        order = np.argsort(-similarities)
+        top = float(similarities[order[0]])
+        if top < self.threshold:
+            self.misses += 1
+            return None
+
+        chosen = [int(i) for i in order if similarities[i] >= top - self.margin]
+        self.hits += 1
+        return [session.documents[keys[i]].document for i in chosen], [float(similarities[i]) for i in chosen]
+
+    def remember(
+        self,
+        session_id: str,
+        documents: List[Tuple[str, Document, List[float]]],
+        index_version: Optional[str] = None,
+    ) -> None:
+        """Adds (chunk ID, document, vector) triples to the session, refreshing ones it already holds."""
+        self._check_version(index_version)
+        session = self._touch(session_id)
+        if session is None:
+            session = self._sessions[session_id] = Session(updated_at=time.monotonic())
+
+        for key, document, vector in documents:
+            if key in session.documents:
+                session.documents.move_to_end(key)
+                continue
+            size = len(document.page_content) + len(str(document.metadata)) + 4 * len(vector)
+            session.documents[key] = _SessionDocument(document, self._normalize(vector), size)
+            session.size_bytes += size
+            self._bytes += size
+        while len(session.documents) > self.max_documents:
+            _, dropped = session.documents.popitem(last=False)
+            session.size_bytes -= dropped.size_bytes
+            self._bytes -= dropped.size_bytes
+        session._matrix = None
+
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+
+    # --- Eviction ---
+
+    def _touch(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session.updated_at > self.ttl_seconds:
+            self._remove(session_id)
+            self.evictions += 1
+            return None
+        session.updated_at = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _remove(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size_bytes
+
+    def _check_version(self, index_version: Optional[str]) -> None:
+        if index_version is None or index_version == self._index_version:
+            return
+        if self._index_version is not None and self._sessions:
+            print(f"🗑️  Index version changed ({self._index_version} -> {index_version}), clearing session documents.")
+            self._sessions.clear()
+            self._bytes = 0
+        self._index_version = index_version
+
+    # --- Helpers ---
+
+    @staticmethod
+    def _stacked(session: Session):
+        if session._matrix is None:
+            session._matrix_keys = list(session.documents.keys())
+            session._matrix = np.vstack([session.documents[k].vector for k in session._matrix_keys])
+        return session._matrix, session._matrix_keys
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "sessions": len(self._sessions),
+            "documents": sum(len(s.documents) for s in self._sessions.values()),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+        }
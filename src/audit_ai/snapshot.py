@@ -0,0 +1,227 @@
+import os
+import json
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+DTYPES = {"int8": np.int8, "float16": np.float16, "float32": np.float32}
+CURRENT_FILE = "CURRENT"  # Names the active snapshot directory
+BLOCK_ROWS = 512  # Rows converted to float32 at a time while scoring
+
+
+def quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Stores normalized vectors as `dtype`. int8 keeps one float32 scale per row
+    (its largest component maps to 127), so a score is (int8 row . query) * scale.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown snapshot dtype '{dtype}' (expected one of {', '.join(DTYPES)})")
+    if dtype != "int8":
+        return matrix.astype(DTYPES[dtype]), None
+    peaks = np.abs(matrix).max(axis=1) if len(matrix) else np.zeros(0, dtype=np.float32)
+    peaks[peaks == 0] = 1.0
+    return np.round(matrix / peaks[:, None] * 127).astype(np.int8), (peaks / 127).astype(np.float32)
+
+
+def normalize(vectors: Any) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorSnapshot:
+    """
+    The collection's vectors and payloads, searched in-process instead of over the network.
+
+    Ingestion writes one directory per snapshot: the quantized vectors as a .npy matrix,
+    int8 row scales and the chunk payloads as JSON, then points CURRENT at it with an atomic
+    rename. The matrix is memory-mapped read-only, so every worker on a host shares one copy
+    through the page cache. Search is exact (brute-force cosine), which is cheap at the
+    few thousand chunks of a policy corpus.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        scales: Optional[np.ndarray],
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        index_version: Optional[str] = None,
+        name: Optional[str] = None,
+    ):
+        self.vectors = vectors
+        self.scales = scales
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.index_version = index_version
+        self.name = name
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        files = [metadata.get("source_file") for metadata in metadatas]
+        self._file_names = sorted({f for f in files if f}, key=str)
+        codes = {f: i for i, f in enumerate(self._file_names)}
+        self._file_codes = np.array([codes.get(f, -1) for f in files], dtype=np.int32)
+
+    @classmethod
+    def build(
+        cls,
+        ids: List[str],
+        vectors: List[List[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        dtype: str = "int8",
+        index_version: Optional[str] = None,
+    ) -> "VectorSnapshot":
+        matrix = normalize(vectors) if len(vectors) else np.zeros((0, 0), dtype=np.float32)
+        data, scales = quantize(matrix, dtype)
+        return cls(data, scales, list(ids), list(texts), list(metadatas), index_version)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dtype(self) -> str:
+        return np.dtype(self.vectors.dtype).name
+
+    # --- Search ---
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row with every (normalized) query: shape (rows, queries)."""
+        scores = np.empty((len(self.ids), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.ids), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + BLOCK_ROWS] = block @ queries.T
+        if self.scales is not None:
+            scores *= self.scales[:, None]
+        return scores
+
+    def _mask(self, exclude_ids: Optional[Set[str]], source_files: Optional[Set[str]]) -> Optional[np.ndarray]:
+        if not exclude_ids and not source_files:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if source_files:
+            codes = [i for i, f in enumerate(self._file_names) if f in source_files]
+            mask &= np.isin(self._file_codes, codes)
+        for chunk_id in exclude_ids or ():
+            position = self._positions.get(str(chunk_id))
+            if position is not None:
+                mask[position] = False
+        return mask
+
+    def _top(self, scores: np.ndarray, k: int, mask: Optional[np.ndarray]) -> List[Tuple[Document, float]]:
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.document(i), float(scores[i])) for i in top if scores[i] != -np.inf]
+
+    def search(
+        self,
+        vector: List[float],
+        k: int = 10,
+        exclude_ids: Optional[Set[str]] = None,
+        source_files: Optional[Set[str]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Top-k chunks by cosine similarity, optionally skipping some IDs or limited to some source files."""
+        return self.search_many([vector], k, exclude_ids, source_files)[0]
+
+    def search_many(
+        self,
+        vectors: List[List[float]],
+        k: int = 10,
+        exclude_ids: Optional[Set[str]] = None,
+        source_files: Optional[Set[str]] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """`search` for several queries; the matrix is read once for all of them."""
+        if not vectors:
+            return []
+        if not self.ids:
+            return [[] for _ in vectors]
+        scores = self._scores(normalize(vectors))
+        mask = self._mask(exclude_ids, source_files)
+        return [self._top(scores[:, j], k, mask) for j in range(len(vectors))]
+
+    def document(self, i: int) -> Document:
+        return Document(page_content=self.texts[i], metadata=dict(self.metadatas[i], _id=self.ids[i]))
+
+    def vectors_for(self, ids: List[str]) -> Dict[str, List[float]]:
+        """The (dequantized, normalized) vectors of the given chunks that the snapshot holds."""
+        found = {}
+        for chunk_id in ids:
+            i = self._positions.get(str(chunk_id))
+            if i is None:
+                continue
+            vector = np.asarray(self.vectors[i], dtype=np.float32)
+            if self.scales is not None:
+                vector = vector * self.scales[i]
+            found[str(chunk_id)] = vector.tolist()
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "snapshot": self.name,
+            "index_version": self.index_version,
+            "chunks": len(self.ids),
+            "dtype": self.dtype,
+            "matrix_mb": round(self.vectors.nbytes / (1024 * 1024), 2),
+        }
+
+    # --- Persistence ---
+
+    def save(self, root: str) -> str:
+        """
+        Writes a new snapshot directory under `root` and switches CURRENT to it atomically.
+        Readers holding the previous snapshot keep their mapping; older ones are removed.
+        """
+        os.makedirs(root, exist_ok=True)
+        name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}-{uuid.uuid4().hex[:8]}"
+        tmp_dir = os.path.join(root, f".{name}.tmp")
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), np.ascontiguousarray(self.vectors))
+        if self.scales is not None:
+            np.save(os.path.join(tmp_dir, "scales.npy"), self.scales)
+        with open(os.path.join(tmp_dir, "payloads.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "index_version": self.index_version,
+                    "dtype": self.dtype,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                },
+                f,
+            )
+        os.replace(tmp_dir, os.path.join(root, name))
+
+        tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+        self.name = name
+
+        # Keep the new snapshot and the one before it (workers may not have switched yet)
+        snapshots = sorted(entry for entry in os.listdir(root) if not entry.startswith(".") and entry != CURRENT_FILE)
+        for old in snapshots[:-2]:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+        return name
+
+    @classmethod
+    def load(cls, root: str) -> "VectorSnapshot":
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        directory = os.path.join(root, name)
+        with open(os.path.join(directory, "payloads.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        scales_path = os.path.join(directory, "scales.npy")
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        return cls(vectors, scales, data["ids"], data["texts"], data["metadatas"], data.get("index_version"), name)
@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import math
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+# Keeps dotted/hyphenated identifiers such as "gv.sc-04" together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "how", "in",
+    "is", "it", "of", "on", "or", "say", "says", "that", "the", "this", "to", "what",
+    "which", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers also contribute their parts ("gv.sc-04" -> "gv", "sc", "04")."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "." in token or "-" in token:
+            tokens.extend(part for part in re.split(r"[.\-]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of the collection, kept in memory.
+
+    Ingestion builds it from the Qdrant payloads and saves it as JSON next to the
+    manifest. Chunk text and metadata are stored too, so sparse-only hits can be
+    returned without another Qdrant round trip.
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((i, tf))
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        n = len(texts)
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        exclude_ids: Optional[Set[str]] = None,
+        source_files: Optional[Set[str]] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Top-k chunks for `query`, optionally skipping some IDs or limited to some source files."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self._postings[term]:
+                if exclude_ids and self.ids[i] in exclude_ids:
+                    continue
+                if source_files and self.metadatas[i].get("source_file") not in source_files:
+                    continue
+                norm = 1 - self.b + self.b * self._lengths[i] / self._avg_length
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [
+            (Document(page_content=self.texts[i], metadata=dict(self.metadatas[i], _id=self.ids[i])), score)
+            for i, score in ranked[:k]
+        ]
+
+    # --- Persistence ---
+
+    def save(self, path: str, index_version: Optional[str] = None) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "index_version": index_version,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                },
+                f,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["texts"], data["metadatas"])
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 60, limit: int = 10) -> List[Document]:
+    """
+    Fuses several ranked lists: each document scores sum(1 / (k + rank)) over the
+    lists it appears in. Documents are matched by their Qdrant point ID.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = str(doc.metadata.get("_id", doc.page_content))
+            scores[key] += 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [documents[key] for key in ranked[:limit]]
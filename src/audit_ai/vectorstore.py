@@ -0,0 +1,139 @@
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import AsyncQdrantClient, models
+
+from audit_ai.limits import UpstreamLimiter, limiter_context
+from audit_ai.metrics import track_qdrant
+
+
+class AsyncQdrantVectorStore(QdrantVectorStore):
+    """
+    QdrantVectorStore whose async search path runs on an AsyncQdrantClient.
+
+    The stock LangChain store implements `asimilarity_search*` by pushing the
+    blocking client into a thread executor. Here the query embedding and the
+    Qdrant request are both awaited natively, so a slow search never ties up
+    a worker thread or the event loop. Searches hold a slot of `limiter` if one is given.
+    """
+
+    def __init__(
+        self, *args: Any, async_client: AsyncQdrantClient, limiter: Optional[UpstreamLimiter] = None, **kwargs: Any
+    ):
+        super().__init__(*args, **kwargs)
+        self.async_client = async_client
+        self.limiter = limiter
+
+    async def asimilarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[models.Filter] = None,
+        search_params: Optional[models.SearchParams] = None,
+        offset: int = 0,
+        score_threshold: Optional[float] = None,
+        consistency: Optional[models.ReadConsistency] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        embeddings = self._require_embeddings("DENSE mode")
+        query_embedding = await embeddings.aembed_query(query)
+        return await self.asimilarity_search_with_score_by_vector(
+            query_embedding,
+            k=k,
+            filter=filter,
+            search_params=search_params,
+            offset=offset,
+            score_threshold=score_threshold,
+            consistency=consistency,
+            **kwargs,
+        )
+
+    async def asimilarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[models.Filter] = None,
+        search_params: Optional[models.SearchParams] = None,
+        offset: int = 0,
+        score_threshold: Optional[float] = None,
+        consistency: Optional[models.ReadConsistency] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        async with limiter_context(self.limiter):
+            with track_qdrant("query_points"):
+                response = await self.async_client.query_points(
+                    collection_name=self.collection_name,
+                    query=embedding,
+                    using=self.vector_name,
+                    query_filter=filter,
+                    search_params=search_params,
+                    limit=k,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False,
+                    score_threshold=score_threshold,
+                    consistency=consistency,
+                    **kwargs,
+                )
+        return [
+            (
+                self._document_from_point(
+                    point,
+                    self.collection_name,
+                    self.content_payload_key,
+                    self.metadata_payload_key,
+                ),
+                point.score,
+            )
+            for point in response.points
+        ]
+
+    async def asimilarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[models.Filter] = None,
+        search_params: Optional[models.SearchParams] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """One search per embedding, all sent to Qdrant in a single batched request."""
+        requests = [
+            models.QueryRequest(
+                query=embedding,
+                using=self.vector_name,
+                filter=filter,
+                params=search_params,
+                limit=k,
+                with_payload=True,
+                with_vector=False,
+            )
+            for embedding in embeddings
+        ]
+        async with limiter_context(self.limiter):
+            with track_qdrant("query_batch_points"):
+                responses = await self.async_client.query_batch_points(
+                    collection_name=self.collection_name, requests=requests
+                )
+        return [
+            [
+                (
+                    self._document_from_point(
+                        point,
+                        self.collection_name,
+                        self.content_payload_key,
+                        self.metadata_payload_key,
+                    ),
+                    point.score,
+                )
+                for point in response.points
+            ]
+            for response in responses
+        ]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        results = await self.asimilarity_search_with_score(query, k=k, **kwargs)
+        return [doc for doc, _ in results]
+
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        results = await self.asimilarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+        return [doc for doc, _ in results]